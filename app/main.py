@@ -1,14 +1,31 @@
+import time
+_SCRIPT_START = time.perf_counter()
+
 import streamlit as st
-from ultralytics import YOLO
-from PIL import Image
-import pandas as pd
-import numpy as np
 import sys
 import os
 
 # Add 'src' to python path so we can import our FinancialEngine
+# Heavy modules (pandas, numpy, PIL, ultralytics/torch, onnxruntime) are only
+# imported inside the loaders below, on first use in the mode that needs them.
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
-from financial_engine import FinancialEngine 
+import instrumentation
+from lazy_resource import LazyResource
+from model_paths import DEFAULT_INT8_PATH, DEFAULT_MODEL_PATH, DEFAULT_ONNX_PATH
+
+# Optional standalone inference worker (src/inference_server.py). When set,
+# diagnosis requests are micro-batched there instead of running in-process.
+INFERENCE_URL = os.environ.get("AGRIGUARD_INFERENCE_URL")
+# Optional SQLite file backing the diagnosis cache across restarts
+DIAGNOSIS_CACHE_DB = os.environ.get("AGRIGUARD_DIAGNOSIS_CACHE_DB")
+# Load the current mode's model/engine in the background as soon as the mode opens
+WARMUP_DEFAULT = os.environ.get("AGRIGUARD_WARMUP", "1") != "0"
+# With AGRIGUARD_METRICS=1, stage metrics are also written here (Prometheus text) after every run
+METRICS_FILE = os.environ.get("AGRIGUARD_METRICS_FILE")
+# Prefix published by src/shared_resources.py: attach to its weights / yield data instead of loading copies
+SHARED_RESOURCES = os.environ.get("AGRIGUARD_SHARED_RESOURCES")
+# Larger checkpoint (same classes) for the cascade's last stage, e.g. a yolov8s-cls run; the stage is hidden without it
+FALLBACK_MODEL = os.environ.get("AGRIGUARD_FALLBACK_MODEL")
 
 # --- CONFIGURATION ---
 st.set_page_config(
@@ -18,52 +35,141 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# --- 1. LOAD RESOURCES (Cached for Speed) ---
-@st.cache_resource
-def load_model():
-    # 1. Define the exact path to your trained model
+# --- 1. LOAD RESOURCES (Lazy, once per process) ---
+# Inference backends selectable in the sidebar: label -> (backend, model file)
+# The ONNX files come from src/03_model_training.py and src/04_model_optimization.py
+MODEL_BACKENDS = {
+    "PyTorch (Ultralytics)": ('ultralytics', DEFAULT_MODEL_PATH),
+    "ONNX Runtime (FP32)": ('onnx', DEFAULT_ONNX_PATH),
+    "ONNX Runtime (INT8)": ('onnx', DEFAULT_INT8_PATH),
+}
+
+def load_model(backend_label="PyTorch (Ultralytics)"):
+    # Resolve the model file for the selected backend
     # Windows paths use backslashes (\), Python prefers forward slashes (/)
-    # Update this string to match YOUR specific location if different
-    model_path = 'runs/classify/weights/agriguard_model/weights/best.pt' 
+    # Update the paths in model_paths.py to match YOUR specific location if different
+    from inference_backend import load_backend
+    backend, model_path = MODEL_BACKENDS[backend_label]
+    if SHARED_RESOURCES:
+        from shared_resources import load_classifier
+        return load_classifier(model_path, backend, shared=SHARED_RESOURCES)
+    return load_backend(model_path, backend)
 
-    # 2. Check if it exists
-    if os.path.exists(model_path):
-        st.success(f"✅ Custom AgriGuard Model Loaded: {model_path}")
-        return YOLO(model_path)
-    else:
+def model_fingerprint(backend_label):
+    # Weights the model resource must match; re-hashed only after the file changed
+    from diagnosis_cache import weights_fingerprint
+    _, model_path = MODEL_BACKENDS[backend_label]
+    return weights_fingerprint(model_path) if os.path.exists(model_path) else None
+
+def load_financial_engine():
+    from class_metadata import get_class_metadata
+    # Same compiled table as the classifier (see get_model), so its class ids score directly
+    class_metadata = get_class_metadata(resources["class_names"])
+    if SHARED_RESOURCES:
+        from shared_resources import attach
+        return attach(SHARED_RESOURCES).engine(class_metadata)
+    from financial_engine import FinancialEngine
+    return FinancialEngine(class_metadata=class_metadata)
+
+@st.cache_resource
+def app_resources():
+    # Process-wide singletons; nothing heavy is loaded until first use
+    return {
+        # Keyed on the weights fingerprint: a retrained/re-exported model file is reloaded on next use
+        "models": {label: LazyResource(label, lambda label=label: load_model(label),
+                                       key=lambda label=label: model_fingerprint(label))
+                   for label in MODEL_BACKENDS},
+        "engine": LazyResource("financial_engine", load_financial_engine),
+        # Classes of the loaded weights (every backend runs the same best.pt); None until a model loads
+        "class_names": None,
+        "timings": {"process_start": _SCRIPT_START, "cold_start_s": None},
+    }
+
+@st.cache_resource
+def load_diagnosis_cache(fingerprint, config=""):
+    from diagnosis_cache import DiagnosisCache
+    # One cache per weights fingerprint and mode; all of them share the SQLite file without evicting each other
+    return DiagnosisCache(fingerprint, capacity=2048, db_path=DIAGNOSIS_CACHE_DB, config=config)
+
+def get_model(backend_label):
+    _, model_path = MODEL_BACKENDS[backend_label]
+
+    # Check if it exists
+    if not os.path.exists(model_path):
         st.error(f"❌ Custom Model NOT Found at: {model_path}")
         st.warning("Please check the 'weights' folder. Did training finish?")
         # STOP the app here so you don't get 'butternut squash' results
         st.stop()
 
+    model = resources["models"][backend_label].get()
+    st.success(f"✅ Custom AgriGuard Model Loaded: {model_path}")
+    from class_metadata import get_class_metadata
+    class_metadata = get_class_metadata(model.names)
+    if resources["class_names"] != list(model.names):
+        resources["class_names"] = list(model.names)
+        if resources["engine"].loaded:
+            # Engine came up first (banker warm-up) with the default table: switch it to the model's
+            resources["engine"].get().class_metadata = class_metadata
+    unmatched = class_metadata.unmatched
+    if unmatched:
+        st.warning(f"No treatment/loss entry for {len(unmatched)} model classes (generic advice used): {unmatched}")
+    return model
+
 @st.cache_resource
-def load_financial_engine():
-    # We need to import the class from the src file
-    # To avoid import errors with numbers in filenames, we use importlib
-    import importlib.util
-    spec = importlib.util.spec_from_file_location("FinancialEngine", "src/financial_engine.py")
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
-    return module.FinancialEngine()
+def load_fallback_model(fingerprint):
+    # Keyed on the weights fingerprint: a retrained fallback checkpoint is reloaded
+    from inference_backend import load_backend
+    return load_backend(FALLBACK_MODEL)
+
+@st.cache_resource
+def get_cascade(backend_label, fingerprint, fallback_fingerprint, tta_threshold, fallback_threshold):
+    # One cascade (and stage counters) per configuration and weights; models are checked by get_model() first
+    from cascade import CascadeClassifier
+    fallback = load_fallback_model(fallback_fingerprint) if fallback_fingerprint else None
+    return CascadeClassifier(resources["models"][backend_label].get(), fallback, tta_threshold=tta_threshold,
+                             fallback_threshold=fallback_threshold)
 
-model = load_model()
-fin_engine = load_financial_engine()
+def diagnose(model, image):
+    from inference_backend import topk
 
-# --- 2. TREATMENT DATABASE (Static Knowledge Base) ---
-treatments = {
-    'Blight': "Apply fungicides containing mancozeb or chlorothalonil. Improve air circulation.",
-    'Mildew': "Use sulfur-based sprays or neem oil. Remove infected leaves immediately.",
-    'Rust': "Apply copper-based fungicides. Rotate crops to prevent recurrence.",
-    'Spot': "Avoid overhead watering. Use copper soap or certified organic fungicides.",
-    'Mite': "Spray water to knock them off. Introduce predatory mites or use neem oil.",
-    'Healthy': "Crop is healthy! Continue standard irrigation and monitoring."
-}
+    # Run Inference
+    probs = model.predict_proba([image])[0]
+    
+    # Process Results (Classification)
+    with instrumentation.stage("postprocess"):
+        predictions = topk(probs, model.names, k=5)
+    return {
+        "class_name": predictions[0][0], # e.g., "Tomato___Early_blight"
+        "confidence": predictions[0][1],
+        "topk": predictions,
+    }
+
+resources = app_resources()
+if 'session_start' not in st.session_state:
+    st.session_state['session_start'] = _SCRIPT_START
+    st.session_state['first_interaction_s'] = {}
 
-def get_treatment(disease_name):
-    for key, val in treatments.items():
-        if key.lower() in disease_name.lower():
-            return val
-    return "Consult a local agronomist for specific chemical controls."
+backend_label = st.sidebar.selectbox("Inference Backend:", list(MODEL_BACKENDS), disabled=bool(INFERENCE_URL))
+warmup = st.sidebar.checkbox("Warm up models in background", value=WARMUP_DEFAULT)
+
+# Cascade: TTA (and optionally a second model) only for low-confidence photos
+cascade_mode = st.sidebar.checkbox("Cascade (re-check uncertain photos)", value=False, disabled=bool(INFERENCE_URL))
+if cascade_mode:
+    tta_threshold = st.sidebar.slider("Run TTA below confidence", 0.0, 1.0, 0.7, 0.05)
+    use_fallback, fallback_threshold = False, 0.5
+    if FALLBACK_MODEL and os.path.exists(FALLBACK_MODEL):
+        # Only a distinct, larger checkpoint adds accuracy; other runtimes of best.pt would repeat stage 1
+        use_fallback = st.sidebar.checkbox(f"Escalate to {os.path.basename(FALLBACK_MODEL)}", value=True)
+        fallback_threshold = st.sidebar.slider("Run fallback below confidence", 0.0, 1.0, 0.5, 0.05,
+                                               disabled=not use_fallback)
+    else:
+        st.sidebar.caption("Set AGRIGUARD_FALLBACK_MODEL to a larger checkpoint to add a fallback stage.")
+
+# --- 2. TREATMENT DATABASE (Static Knowledge Base) ---
+# Per-class table compiled once per process, shared with the FinancialEngine's loss lookup
+def get_treatment(class_name, names=None):
+    from class_metadata import get_class_metadata
+    return get_class_metadata(names).treatment(class_name)
 
 # --- 3. UI LAYOUT ---
 st.title("🌾 AgriGuard AI: Risk & Credit Engine")
@@ -74,44 +180,100 @@ mode = st.sidebar.radio("Select User Mode:", ["👨‍🌾 Farmer (Diagnosis)",
 
 if mode == "👨‍🌾 Farmer (Diagnosis)":
     st.header("🍂 Plant Disease Diagnosis")
+    if warmup and not INFERENCE_URL and os.path.exists(MODEL_BACKENDS[backend_label][1]):
+        resources["models"][backend_label].warm_up()
     uploaded_file = st.file_uploader("Upload a photo of your crop leaf:", type=['jpg', 'png', 'jpeg'])
+    # Full-resolution photos with several leaves: classify leaf tiles instead of one 224px downscale
+    multi_leaf = st.checkbox("Multi-leaf field photo (tile the image)", value=False, disabled=bool(INFERENCE_URL))
 
     if uploaded_file:
         col1, col2 = st.columns([1, 1])
         
         with col1:
-            image = Image.open(uploaded_file)
+            from PIL import Image
+            if multi_leaf:
+                # Reduced-resolution (draft) JPEG decode, sized for the tiles
+                from tiled_inference import TILES_ACROSS, draft_decode
+                with instrumentation.stage("upload_decode", mode="draft"):
+                    image = draft_decode(uploaded_file, 224 * TILES_ACROSS)
+            else:
+                with instrumentation.stage("upload_decode"):
+                    image = Image.open(uploaded_file)
+                    image.load()
             st.image(image, caption="Uploaded Image", use_container_width=True)
         
         with col2:
             st.write("### AI Diagnosis Results")
             if st.button("Analyze Leaf"):
-                with st.spinner("Running YOLOv8 Vision Model..."):
-                    # Run Inference
-                    results = model(image)
-                    
-                    # Process Results (Classification)
-                    top_result = results[0].probs.top1
-                    conf = results[0].probs.top1conf.item()
-                    class_name = results[0].names[top_result] # e.g., "Tomato___Early_blight"
+                with st.spinner("Running YOLOv8 Vision Model..."), instrumentation.profile_request("diagnose"), \
+                        instrumentation.stage("diagnose_request"):
+                    if INFERENCE_URL:
+                        # Run Inference on the shared worker
+                        from inference_server import InferenceClient
+                        class_name, conf = InferenceClient(INFERENCE_URL).predict(uploaded_file.getvalue(), k=1)[0]
+                        class_names = None
+                    else:
+                        from diagnosis_cache import weights_fingerprint
+                        model = get_model(backend_label)
+                        fingerprint = weights_fingerprint(model.model_path)
+                        config = []
+                        if cascade_mode:
+                            fallback_fingerprint = weights_fingerprint(FALLBACK_MODEL) if use_fallback else None
+                            try:
+                                model = get_cascade(backend_label, fingerprint, fallback_fingerprint,
+                                                    tta_threshold, fallback_threshold)
+                            except ValueError as e:
+                                # e.g. AGRIGUARD_FALLBACK_MODEL points at the same weights
+                                st.error(f"❌ Cascade not available: {e}")
+                                st.stop()
+                            # Cascade settings change the result, so they are part of the cache key
+                            config.append(f"cascade={model.config()}")
+                        if multi_leaf:
+                            from tiled_inference import diagnose_tiles
+                            config.append("tiled")
+                            run = lambda img: diagnose_tiles(model, img)
+                        else:
+                            run = lambda img: diagnose(model, img)
+                        diagnosis_cache = load_diagnosis_cache(fingerprint, ":".join(config))
+
+                        # Re-uploaded photos skip inference entirely
+                        diagnosis, cache_hit = diagnosis_cache.get_or_compute(image, run)
+                        class_name, conf = diagnosis["class_name"], diagnosis["confidence"]
+                        class_names = model.names
+                        instrumentation.count("agriguard_diagnosis_cache_total", result="hit" if cache_hit else "miss")
+                        if cache_hit:
+                            st.caption("⚡ Served from diagnosis cache")
+                        if cascade_mode:
+                            cascade_stats = model.stats()
+                            st.caption(f"Cascade: TTA ran for {cascade_stats['tta_rate']:.0%} and the fallback for "
+                                       f"{cascade_stats['fallback_rate']:.0%} of {cascade_stats['images']} photos "
+                                       f"(×{cascade_stats['cost_factor']:.2f} fast-model cost)")
+                        if multi_leaf:
+                            st.caption(f"🍃 {diagnosis['tiles']} leaf tiles classified "
+                                       f"({diagnosis['leaf_fraction']:.0%} of the photo is leaf)")
+                            st.bar_chart({name.replace("___", " - "): p for name, p in diagnosis["topk"]})
                     
                     # Parse Name
                     clean_name = class_name.replace("___", " - ").replace("_", " ")
-                    disease_only = class_name.split("___")[-1]
                     
                     # Display Metrics
                     st.metric(label="Detected Condition", value=clean_name)
                     st.metric(label="Model Confidence", value=f"{conf*100:.1f}%")
                     
                     # Display Treatment
-                    st.info(f"💊 **Recommended Treatment:** {get_treatment(disease_only)}")
+                    st.info(f"💊 **Recommended Treatment:** {get_treatment(class_name, class_names)}")
                     
-                    # Store for Banker Mode (Session State)
+                    # Store for Banker Mode (Session State); the class id indexes the shared metadata table
                     st.session_state['last_diagnosis'] = class_name
+                    st.session_state["last_class_id"] = list(class_names).index(class_name) if class_names else None
+                    # Tiled diagnoses also keep the per-plant distribution for a severity-weighted loss
+                    st.session_state['last_distribution'] = diagnosis.get("distribution") if multi_leaf else None
                     st.success("Diagnosis saved to system.")
 
 elif mode == "🏦 Banker (Risk Analysis)":
     st.header("📊 Micro-Credit Risk Assessment")
+    if warmup:
+        resources["engine"].warm_up()
     
     # Input Form
     with st.form("loan_application"):
@@ -131,27 +293,73 @@ elif mode == "🏦 Banker (Risk Analysis)":
     if submit:
         # Run Financial Engine
         try:
-            report = fin_engine.calculate_risk_profile(state, crop, disease_input, land_area)
+            import pandas as pd
+            with instrumentation.profile_request("risk_report"), instrumentation.stage("risk_request"):
+                fin_engine = resources["engine"].get()
+                distribution = None
+                disease = disease_input
+                if disease_input == st.session_state.get('last_diagnosis'):
+                    distribution = st.session_state.get('last_distribution')
+                    if st.session_state.get('last_class_id') is not None:
+                        disease = st.session_state['last_class_id']
+                report = fin_engine.calculate_risk_profile(state, crop, disease, land_area,
+                                                           disease_distribution=distribution)
             
             # Display Dashboard
-            st.divider()
-            st.subheader(f"Risk Profile: {report['Recommendation']}")
+            with instrumentation.stage("render_report"):
+                st.divider()
+                st.subheader(f"Risk Profile: {report['Recommendation']}")
+                if distribution:
+                    st.caption("Yield loss is severity-weighted over the multi-leaf disease distribution.")
             
-            # Key Metrics Row
-            m1, m2, m3, m4 = st.columns(4)
-            m1.metric("Credit Score", report['Credit_Eligibility_Score'], delta_color="normal")
-            m2.metric("Yield Loss Risk", report['Yield_Loss_Pct'], delta_color="inverse")
-            m3.metric("Proj. Revenue", f"₹{report['Projected_Revenue_INR']:,}")
-            m4.metric("Revenue at Risk", f"₹{report['Revenue_at_Risk_INR']:,}", delta_color="inverse")
+                # Key Metrics Row
+                m1, m2, m3, m4 = st.columns(4)
+                m1.metric("Credit Score", report['Credit_Eligibility_Score'], delta_color="normal")
+                m2.metric("Yield Loss Risk", report['Yield_Loss_Pct'], delta_color="inverse")
+                m3.metric("Proj. Revenue", f"₹{report['Projected_Revenue_INR']:,}")
+                m4.metric("Revenue at Risk", f"₹{report['Revenue_at_Risk_INR']:,}", delta_color="inverse")
             
-            # Detailed Table
-            st.table(pd.DataFrame([report]).T.rename(columns={0: "Value"}))
+                # Detailed Table
+                st.table(pd.DataFrame([report]).T.rename(columns={0: "Value"}))
             
-            # Visual Logic
-            if report['Credit_Eligibility_Score'] > 70:
-                st.balloons()
-            else:
-                st.error("High Risk Detected. Mandatory Crop Insurance Recommended.")
+                # Visual Logic
+                if report['Credit_Eligibility_Score'] > 70:
+                    st.balloons()
+                else:
+                    st.error("High Risk Detected. Mandatory Crop Insurance Recommended.")
                 
         except Exception as e:
-            st.error(f"Error in calculation: {e}")
\ No newline at end of file
+            st.error(f"Error in calculation: {e}")
+
+# --- 4. STARTUP TIMING REPORT ---
+# Cold start: first script run in this process until its UI was rendered.
+# Time to first interaction: session start until this mode's UI was usable.
+# First use: how long the mode's model/engine load took (hidden by warm-up).
+timings = resources["timings"]
+if timings["cold_start_s"] is None:
+    timings["cold_start_s"] = time.perf_counter() - timings["process_start"]
+st.session_state['first_interaction_s'].setdefault(mode, time.perf_counter() - st.session_state['session_start'])
+
+model_resource = resources["models"][backend_label]
+if model_resource.loaded and not INFERENCE_URL:
+    from diagnosis_cache import weights_fingerprint
+    cache_stats = load_diagnosis_cache(weights_fingerprint(model_resource.get().model_path)).stats()
+    st.sidebar.caption(f"Diagnosis cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+                       f"({cache_stats['hit_rate']*100:.0f}% hit rate)")
+
+with st.sidebar.expander("⏱ Startup Timing"):
+    st.write(f"Cold start (process → first render): **{timings['cold_start_s']:.2f}s**")
+    for mode_name, seconds in st.session_state['first_interaction_s'].items():
+        st.write(f"{mode_name} — time to first interaction: **{seconds:.2f}s**")
+    for resource in (model_resource, resources["engine"]):
+        status = f"{resource.load_seconds:.2f}s" if resource.loaded else "not loaded yet"
+        st.write(f"First-use load of {resource.name}: {status}")
+
+# --- 5. STAGE METRICS (AGRIGUARD_METRICS=1) ---
+if instrumentation.ENABLED:
+    if METRICS_FILE:
+        instrumentation.write_metrics(METRICS_FILE)
+    with st.sidebar.expander("📈 Stage Metrics"):
+        for stage_name, stats in instrumentation.REGISTRY.summary().items():
+            st.write(f"{stage_name}: {stats['count']} calls, mean **{stats['mean_ms']:.2f} ms**, "
+                     f"p99 ≤ {stats['p99_ms']:g} ms")
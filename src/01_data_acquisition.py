@@ -1,79 +1,27 @@
+import argparse
 import os
-import shutil
-from dotenv import load_dotenv
 
-# 1. Load Credentials
-load_dotenv()
+from acquisition import DATASETS, HttpSource, KaggleSource, LocalSource, acquire
 
-# Validate keys
-if not os.getenv("KAGGLE_USERNAME") or not os.getenv("KAGGLE_KEY"):
-    raise ValueError(
-        "Error: Kaggle credentials not found in .env file.\n"
-        "Please ensure you have run 'setup_security.py' and pasted your keys into .env"
-    )
 
-from kaggle.api.kaggle_api_extended import KaggleApi
-
-def download_real_agri_data():
-    print("Authenticating with Kaggle...")
-    api = KaggleApi()
-    api.authenticate()
+def download_real_agri_data(source=None, workers=3, extract_workers=8, verify=False, keep_archives=False):
+    # 1. Pick the download source (Kaggle by default; credentials are checked there)
+    source = source or KaggleSource()
 
     # Define target directories based on the setup script
-    images_dir = "data/raw/images"
-    finance_dir = "data/raw/financial"
-    
-    os.makedirs(images_dir, exist_ok=True)
-    os.makedirs(finance_dir, exist_ok=True)
+    for dataset in DATASETS:
+        os.makedirs(dataset["dest"], exist_ok=True)
 
     print("Starting Real Data Download...")
 
-    # --- DATASET 1: IMAGES (The "Vision" Part) ---
-    # Source: https://www.kaggle.com/datasets/vipoooool/new-plant-diseases-dataset
-    # This is the standard "PlantVillage" expanded dataset (87K images)
-    print("\n1. Downloading Crop Disease Images (This is large ~2GB, please wait)...")
-    try:
-        api.dataset_download_files(
-            'vipoooool/new-plant-diseases-dataset', 
-            path=images_dir, 
-            unzip=True
-        )
-        print("   [Success] Image dataset downloaded.")
-        
-        # Cleanup: The dataset often unzips into nested folders. Let's organize it.
-        # Structure usually looks like: data/raw/images/New Plant Diseases Dataset(Augmented)/...
-        # We will deal with pathing in Phase 2.
-        
-    except Exception as e:
-        print(f"   [Error] Could not download Image Data: {e}")
-
-    # --- DATASET 2: FINANCIAL/YIELD CONTEXT (The "Fintech" Part) ---
-    # Source: https://www.kaggle.com/datasets/akshatgupta7/crop-yield-in-indian-states-dataset
-    # Contains: State, Crop, Season, Yield, Production, Rainfall
-    print("\n2. Downloading Indian Crop Yield & Production Data...")
-    try:
-        api.dataset_download_files(
-            'akshatgupta7/crop-yield-in-indian-states-dataset', 
-            path=finance_dir, 
-            unzip=True
-        )
-        print("   [Success] Financial/Yield dataset downloaded.")
-    except Exception as e:
-        print(f"   [Error] Could not download Yield Data: {e}")
-
-    # --- DATASET 3: MARKET PRICES (Optional Context) ---
-    # We try to get Daily Market Prices (Mandi Data) if available
-    # Source: https://www.kaggle.com/datasets/kianwee/agricultural-raw-material-prices-19902020
-    print("\n3. Downloading Agricultural Market Prices...")
-    try:
-        api.dataset_download_files(
-            'kianwee/agricultural-raw-material-prices-19902020', 
-            path=finance_dir, 
-            unzip=True
-        )
-        print("   [Success] Market Price dataset downloaded.")
-    except Exception as e:
-        print("   [Warning] Could not download Price Data (We can proceed with Yield data only).")
+    # 2. Fetch all datasets concurrently:
+    #    - Crop Disease Images (This is large ~2GB): resumes if interrupted
+    #    - Indian Crop Yield & Production Data
+    #    - Agricultural Market Prices (optional, we can proceed with Yield data only)
+    # Datasets already in the manifest (sizes + SHA-256 per file) are skipped.
+    # The image dataset unzips into nested folders; we deal with pathing in Phase 2.
+    acquire(DATASETS, source, workers=workers, extract_workers=extract_workers, verify=verify,
+            keep_archives=keep_archives)
 
     print("\n" + "="*40)
     print("PHASE 1 COMPLETE: RAW DATA ACQUIRED")
@@ -101,5 +49,22 @@ def inspect_downloads():
         print(" - Financial Folder is empty!")
 
 if __name__ == "__main__":
-    download_real_agri_data()
-    inspect_downloads()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Download the raw image, yield and price datasets")
+    parser.add_argument('--source', choices=['kaggle', 'local', 'http'], default='kaggle')
+    parser.add_argument('--source-path', help="Directory (local) or base URL (http) holding <owner>/<dataset>.zip")
+    parser.add_argument('--workers', type=int, default=3, help="Datasets fetched in parallel")
+    parser.add_argument('--extract-workers', type=int, default=8)
+    parser.add_argument('--verify', action='store_true', help="Re-hash every file of already acquired datasets")
+    parser.add_argument('--keep-archives', action='store_true')
+    args = parser.parse_args()
+
+    if args.source == 'local':
+        source = LocalSource(args.source_path)
+    elif args.source == 'http':
+        source = HttpSource(args.source_path)
+    else:
+        source = KaggleSource()
+
+    download_real_agri_data(source, workers=args.workers, extract_workers=args.extract_workers,
+                            verify=args.verify, keep_archives=args.keep_archives)
+    inspect_downloads()
@@ -1,14 +1,20 @@
+import argparse
+import hashlib
+import json
 import os
 import shutil
-import random
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
-def organize_dataset():
-    # 1. Define Paths
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+MANIFEST_NAME = ".organize_manifest.json"
+
+
+def find_raw_base():
     # The Kaggle download usually unzips into this long nested path
     # Check your folder to be sure, but this is standard for 'vipoooool/new-plant-diseases-dataset'
     raw_base = "data/raw/images/New Plant Diseases Dataset(Augmented)/New Plant Diseases Dataset(Augmented)"
-    
+
     # If the above path doesn't exist, try the non-augmented one or short path
     if not os.path.exists(raw_base):
         raw_base = "data/raw/images/New Plant Diseases Dataset(Augmented)"
@@ -16,57 +22,181 @@ def organize_dataset():
             # Fallback: User might need to check manually where it unzipped
             print(f"[Error] Could not find dataset at: {raw_base}")
             print("Please check 'data/raw/images' to see the exact folder name.")
-            return
+            return None
+    return raw_base
+
+
+def split_images(cls, images, split_ratio, seed):
+    """
+    Deterministic train/val split of one class.
+
+    Images are ordered by a seeded hash of their name instead of random.shuffle,
+    so the split is reproducible and adding a file to a class moves at most a
+    file or two across the boundary on the next incremental run.
+    """
+    ranked = sorted(images, key=lambda f: hashlib.sha1(f"{seed}:{cls}:{f}".encode()).hexdigest())
+    split_idx = int(len(ranked) * split_ratio)
+    return ranked[:split_idx], ranked[split_idx:]
+
+
+def class_signature(src_path, images):
+    # Cheap change detection: names, sizes and mtimes of every source image
+    digest = hashlib.sha1()
+    for img in images:
+        st = os.stat(os.path.join(src_path, img))
+        digest.update(f"{img}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def place_file(src, dst, mode):
+    """
+    Materializes `src` at `dst` as a hardlink, symlink or copy.
+    Links fall back to shutil.copy2 when the filesystem refuses them
+    (e.g. hardlinks across devices). Returns the method actually used.
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if mode == 'hardlink':
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError:
+            pass
+    elif mode == 'symlink':
+        try:
+            os.symlink(os.path.abspath(src), dst)
+            return 'symlink'
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+def is_current(src, dst):
+    # Links share (or resolve to) the source inode, copy2 preserves size + mtime
+    try:
+        s, d = os.stat(src), os.stat(dst)
+    except OSError:
+        return False
+    return s.st_size == d.st_size and s.st_mtime_ns == d.st_mtime_ns
+
+
+def list_images(path):
+    if not os.path.isdir(path):
+        return []
+    return sorted(f for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def organize_dataset(raw_base=None, processed_dir="data/processed/dataset_yolo", split_ratio=0.8,
+                     mode='hardlink', workers=8, seed=42, incremental=True):
+    # 1. Define Paths
+    raw_base = raw_base or find_raw_base()
+    if raw_base is None:
+        return
 
-    processed_dir = "data/processed/dataset_yolo"
-    
     print(f"Source: {raw_base}")
     print(f"Destination: {processed_dir}")
 
-    # 2. Setup Train/Val split
-    split_ratio = 0.8 # 80% Train, 20% Val
-    
-    # Clean previous run
-    if os.path.exists(processed_dir):
+    # 2. Setup Train/Val split (default 80% Train, 20% Val)
+    settings = {"split_ratio": split_ratio, "seed": seed, "mode": mode}
+    manifest_path = os.path.join(processed_dir, MANIFEST_NAME)
+    manifest = {}
+    if incremental and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    # Clean previous run only if the split itself changed (or a full rebuild was asked for)
+    if os.path.exists(processed_dir) and manifest.get("settings") != settings:
+        print("Split settings changed or no manifest found: rebuilding from scratch.")
         shutil.rmtree(processed_dir)
-    
+        manifest = {}
+
     os.makedirs(os.path.join(processed_dir, 'train'), exist_ok=True)
     os.makedirs(os.path.join(processed_dir, 'val'), exist_ok=True)
 
     # 3. Iterate over classes (folders)
-    # The dataset has a 'train' and 'valid' folder already, but we'll merge and re-split 
+    # The dataset has a 'train' and 'valid' folder already, but we'll merge and re-split
     # to control the randomness and ensure we know exactly what's where.
     source_train = os.path.join(raw_base, 'train')
-    
-    classes = [d for d in os.listdir(source_train) if os.path.isdir(os.path.join(source_train, d))]
+
+    classes = sorted(d for d in os.listdir(source_train) if os.path.isdir(os.path.join(source_train, d)))
     print(f"Found {len(classes)} classes (Diseases/Crops).")
 
-    for cls in tqdm(classes, desc="Processing Classes"):
-        # Create class folders in dest
-        os.makedirs(os.path.join(processed_dir, 'train', cls), exist_ok=True)
-        os.makedirs(os.path.join(processed_dir, 'val', cls), exist_ok=True)
-        
+    old_signatures = manifest.get("classes", {})
+    signatures = {}
+    to_place = []
+    to_remove = []
+    skipped = 0
+
+    for cls in tqdm(classes, desc="Planning Classes"):
         # Get all images for this class
         src_path = os.path.join(source_train, cls)
-        images = [f for f in os.listdir(src_path) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
-        
-        # Shuffle
-        random.shuffle(images)
-        
+        images = list_images(src_path)
+        signatures[cls] = class_signature(src_path, images)
+
         # Split
-        split_idx = int(len(images) * split_ratio)
-        train_imgs = images[:split_idx]
-        val_imgs = images[split_idx:]
-        
-        # Copy files
-        for img in train_imgs:
-            shutil.copy2(os.path.join(src_path, img), os.path.join(processed_dir, 'train', cls, img))
-            
-        for img in val_imgs:
-            shutil.copy2(os.path.join(src_path, img), os.path.join(processed_dir, 'val', cls, img))
+        train_imgs, val_imgs = split_images(cls, images, split_ratio, seed)
+
+        # Unchanged source and its outputs still on disk (names only, no stat per file)
+        if old_signatures.get(cls) == signatures[cls] and all(
+                list_images(os.path.join(processed_dir, split, cls)) == sorted(wanted)
+                for split, wanted in (('train', train_imgs), ('val', val_imgs))):
+            skipped += 1
+            continue
+
+        # Diff the desired layout against what is already on disk
+        for split, wanted in (('train', train_imgs), ('val', val_imgs)):
+            dest_path = os.path.join(processed_dir, split, cls)
+            os.makedirs(dest_path, exist_ok=True)
+            wanted_set = set(wanted)
+            for img in list_images(dest_path):
+                if img not in wanted_set:
+                    to_remove.append(os.path.join(dest_path, img))
+            for img in wanted:
+                src, dst = os.path.join(src_path, img), os.path.join(dest_path, img)
+                if not is_current(src, dst):
+                    to_place.append((src, dst))
+
+    # Classes that disappeared from the source (stray files next to the class folders are left alone)
+    for split in ('train', 'val'):
+        for cls in os.listdir(os.path.join(processed_dir, split)):
+            path = os.path.join(processed_dir, split, cls)
+            if cls not in signatures and os.path.isdir(path):
+                shutil.rmtree(path)
+
+    print(f"{skipped} classes unchanged, {len(to_place)} files to place, {len(to_remove)} stale files to remove.")
+
+    for path in to_remove:
+        os.remove(path)
+
+    # 4. Link/copy files on a thread pool (the work is almost entirely syscalls)
+    methods = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        jobs = pool.map(lambda job: place_file(job[0], job[1], mode), to_place)
+        for method in tqdm(jobs, total=len(to_place), desc=f"Placing Files ({mode})"):
+            methods[method] = methods.get(method, 0) + 1
+
+    # 5. Record what was built so the next run only touches changes
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({"settings": settings, "classes": signatures}, f, indent=2)
+    os.replace(tmp_path, manifest_path)
 
     print("\n[Success] Dataset organized for YOLOv8 Classification!")
     print(f"Location: {processed_dir}")
+    if methods:
+        print(f"Files placed by method: {methods}")
+
 
 if __name__ == "__main__":
-    organize_dataset()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Organize the PlantVillage images into a YOLOv8 train/val layout")
+    parser.add_argument('--mode', choices=['hardlink', 'symlink', 'copy'], default='hardlink',
+                        help="How files are materialized (links fall back to copies across filesystems)")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--split-ratio', type=float, default=0.8)
+    parser.add_argument('--full', action='store_true', help="Ignore the manifest and rebuild everything")
+    args = parser.parse_args()
+
+    organize_dataset(split_ratio=args.split_ratio, mode=args.mode, workers=args.workers,
+                     seed=args.seed, incremental=not args.full)
@@ -1,7 +1,39 @@
 from ultralytics import YOLO
+import argparse
+import importlib.util
 import os
+import sys
+import time
 
-def train_model():
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from model_paths import DEFAULT_MODEL_PATH, DEFAULT_ONNX_PATH
+
+DATASET_DIR = "data/processed/dataset_yolo"
+
+def shard_trainer(shard_dir):
+    """
+    Ultralytics ClassificationTrainer that reads train/val images from the
+    memory-mapped shards of src/dataset_shards.py instead of decoding every
+    JPEG from the folder dataset each epoch. The folder dataset still
+    supplies the class names, which must match the shards'.
+    """
+    from ultralytics.models.yolo.classify import ClassificationTrainer
+    from dataset_shards import ShardClassificationDataset
+
+    class ShardTrainer(ClassificationTrainer):
+        def build_dataset(self, img_path, mode="train", batch=None):
+            split = 'train' if mode == 'train' else 'val'
+            dataset = ShardClassificationDataset(shard_dir, split, args=self.args, augment=mode == 'train')
+            names = [self.data["names"][i] for i in range(len(self.data["names"]))]
+            if dataset.classes != names:
+                raise ValueError(f"Shards in {shard_dir} don't match the dataset classes; "
+                                 f"rebuild them with src/dataset_shards.py build")
+            return dataset
+
+    return ShardTrainer
+
+
+def train_model(shards=None):
     # 1. Define Path to Dataset
     # YOLO needs the absolute path usually, or relative to current dir
     dataset_path = os.path.abspath("data/processed/dataset_yolo")
@@ -19,13 +51,21 @@ def train_model():
     # 3. Train
     # epochs=10 is enough to see results (Use 50 for final resume project)
     # imgsz=224 is standard for classification
+    # With shards (src/dataset_shards.py) images come pre-resized from mmap instead of per-epoch JPEG decodes
+    extra = {}
+    if shards:
+        if not os.path.exists(os.path.join(shards, "meta.json")):
+            raise FileNotFoundError(f"No shards in {shards}: run 'src/dataset_shards.py build' first!")
+        print(f"Reading images from shards: {shards}")
+        extra['trainer'] = shard_trainer(shards)
     results = model.train(
         data=dataset_path, 
         epochs=5,           # Set to 20-50 for high accuracy if you have time
         imgsz=224, 
         batch=32,
         name='agriguard_model', # Results saved to runs/classify/agriguard_model
-        project='weights'       # Save location
+        project='weights',      # Save location
+        **extra
     )
 
     # 4. Validation (Optional, automatically done during train)
@@ -35,8 +75,239 @@ def train_model():
 
     # 5. Export for Deployment
     # We export to ONNX format (standard for web deployment) or just keep .pt
-    success = model.export(format='onnx')
+    # dynamic=True keeps the batch axis open so the ONNX backend can run micro-batches
+    success = model.export(format='onnx', dynamic=True)
     print(f"Model exported: {success}")
 
+
+def build_student(nc, width=0.125, depth=0.33):
+    """
+    A narrower YOLOv8-cls: same layout as yolov8n-cls (width 0.25) with
+    `width` scaling every channel count, randomly initialized.
+    """
+    from copy import deepcopy
+    from ultralytics.nn.tasks import ClassificationModel, yaml_model_load
+
+    cfg = deepcopy(yaml_model_load('yolov8n-cls.yaml'))
+    cfg['scales'] = {'n': [depth, width, 1024]}
+    cfg['scale'] = 'n'
+    return ClassificationModel(cfg, nc=nc, verbose=False)
+
+
+def _logits(model, output):
+    # Classify heads return logits in train mode, probabilities (or (probs, logits)) in eval mode
+    import torch
+
+    if model.training:
+        return output
+    if isinstance(output, (tuple, list)):
+        return output[1]
+    return torch.log(output.clamp_min(1e-8))
+
+
+def _kd_epoch(student, teacher, loader, optimizer, imgsz, temperature, alpha, device):
+    import torch
+    import torch.nn.functional as F
+
+    student.train()
+    total, seen = 0.0, 0
+    for images, labels in loader:
+        images, labels = images.to(device), labels.to(device)
+        with torch.no_grad():
+            teacher_logits = _logits(teacher, teacher(images))
+
+        # The student sees the same crops at its own (smaller) resolution
+        small = F.interpolate(images, size=(imgsz, imgsz), mode='bilinear', align_corners=False)
+        student_logits = _logits(student, student(small))
+
+        soft = F.kl_div(F.log_softmax(student_logits / temperature, dim=1),
+                        F.softmax(teacher_logits / temperature, dim=1), reduction='batchmean')
+        loss = alpha * soft * temperature ** 2 + (1 - alpha) * F.cross_entropy(student_logits, labels)
+
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        total += loss.item() * len(labels)
+        seen += len(labels)
+    return total / max(seen, 1)
+
+
+def prune_student(student, amount):
+    """
+    L2 structured pruning of whole conv filters (`amount` of each layer's
+    output channels zeroed). Masks stay attached until finalize_pruning(),
+    so fine-tuning keeps the pruned filters at zero.
+    """
+    import torch
+    from torch.nn.utils import prune
+
+    for module in student.modules():
+        if isinstance(module, torch.nn.Conv2d) and module.out_channels > 8:
+            prune.ln_structured(module, name='weight', amount=amount, n=2, dim=0)
+
+
+def finalize_pruning(student):
+    """Bakes the pruning masks into the weights; returns the fraction of zeroed conv weights."""
+    import torch
+    from torch.nn.utils import prune
+
+    zeros, total = 0, 0
+    for module in student.modules():
+        if isinstance(module, torch.nn.Conv2d):
+            if prune.is_pruned(module):
+                prune.remove(module, 'weight')
+            zeros += int((module.weight == 0).sum())
+            total += module.weight.numel()
+    return zeros / max(total, 1)
+
+
+def distill_student(teacher_path=DEFAULT_MODEL_PATH, dataset_path=DATASET_DIR, imgsz=160, width=0.125,
+                    epochs=10, batch=64, lr=1e-3, temperature=4.0, alpha=0.7, prune_amount=0.0,
+                    prune_epochs=3, workers=4, device='cpu', tflite=False, shards=None):
+    """
+    Trains a small student from the trained `best.pt` teacher with knowledge
+    distillation (soft teacher targets at `temperature`, mixed with the hard
+    labels by `alpha`), optionally prunes conv filters and fine-tunes, then
+    saves an Ultralytics checkpoint and a static-shape ONNX export. With
+    `shards` the training images come from src/dataset_shards.py shards.
+    Returns (student .pt path, student .onnx path).
+    """
+    import torch
+    from torchvision import datasets, transforms
+
+    if not os.path.exists(teacher_path):
+        raise FileNotFoundError(f"Train the teacher first: {teacher_path} not found")
+
+    # 1. Teacher (frozen) and data at the teacher's resolution
+    teacher_yolo = YOLO(teacher_path)
+    teacher = teacher_yolo.model.to(device).float().eval()
+    for p in teacher.parameters():
+        p.requires_grad_(False)
+    teacher_imgsz = teacher_yolo.overrides.get('imgsz', 224)
+    teacher_imgsz = teacher_imgsz[0] if isinstance(teacher_imgsz, (list, tuple)) else teacher_imgsz
+
+    # Ultralytics classifiers take [0, 1] RGB without mean/std normalization
+    augment = [
+        transforms.RandomResizedCrop(teacher_imgsz, scale=(0.5, 1.0)),
+        transforms.RandomHorizontalFlip(),
+        transforms.ToTensor(),
+    ]
+    if shards:
+        from dataset_shards import ShardDataset
+        train_set = ShardDataset(shards, 'train', transforms.Compose([transforms.ToPILImage()] + augment))
+    else:
+        train_set = datasets.ImageFolder(os.path.join(dataset_path, 'train'), transforms.Compose(augment))
+    names = [teacher.names[i] for i in range(len(teacher.names))]
+    if train_set.classes != names:
+        raise ValueError("Dataset classes don't match the teacher's classes; re-run preprocessing/training.")
+    loader = torch.utils.data.DataLoader(train_set, batch_size=batch, shuffle=True, num_workers=workers,
+                                         drop_last=True)
+
+    # 2. Student
+    student = build_student(len(names), width=width).to(device)
+    student.names = dict(teacher.names)
+    params = sum(p.numel() for p in student.parameters())
+    print(f"Distilling {teacher_path} -> student (width {width}, {imgsz}px, {params / 1e6:.2f}M params)")
+
+    optimizer = torch.optim.AdamW(student.parameters(), lr=lr, weight_decay=1e-4)
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=epochs)
+    for epoch in range(epochs):
+        start = time.time()
+        loss = _kd_epoch(student, teacher, loader, optimizer, imgsz, temperature, alpha, device)
+        scheduler.step()
+        print(f"   epoch {epoch + 1}/{epochs}: loss {loss:.4f} ({time.time() - start:.0f}s)")
+
+    # 3. Optional structured pruning + short fine-tune with the same KD loss
+    sparsity = 0.0
+    if prune_amount > 0:
+        print(f"Pruning {prune_amount:.0%} of conv filters, fine-tuning {prune_epochs} epochs...")
+        prune_student(student, prune_amount)
+        optimizer = torch.optim.AdamW(student.parameters(), lr=lr / 10, weight_decay=1e-4)
+        for epoch in range(prune_epochs):
+            loss = _kd_epoch(student, teacher, loader, optimizer, imgsz, temperature, alpha, device)
+            print(f"   fine-tune {epoch + 1}/{prune_epochs}: loss {loss:.4f}")
+        sparsity = finalize_pruning(student)
+        print(f"   Conv weight sparsity: {sparsity:.1%}")
+
+    # 4. Save as an Ultralytics checkpoint so YOLO()/UltralyticsBackend load it like best.pt
+    tag = f"agriguard_student_{imgsz}" + (f"_p{int(prune_amount * 100)}" if prune_amount > 0 else "")
+    weights_dir = os.path.join('runs/classify/weights', tag, 'weights')
+    os.makedirs(weights_dir, exist_ok=True)
+    student_path = os.path.join(weights_dir, 'best.pt')
+    student.eval()
+    torch.save({
+        'model': student.cpu().half(),
+        'train_args': {'task': 'classify', 'imgsz': imgsz, 'data': os.path.abspath(dataset_path)},
+        'distillation': {'teacher': teacher_path, 'width': width, 'temperature': temperature, 'alpha': alpha,
+                         'epochs': epochs, 'prune_amount': prune_amount, 'conv_sparsity': sparsity},
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }, student_path)
+    print(f"[Success] Student saved to: {student_path}")
+
+    # 5. Export: fixed batch/shape, plain opset -> convertible to TFLite (onnx2tf) and NNAPI-friendly
+    student_yolo = YOLO(student_path)
+    onnx_path = student_yolo.export(format='onnx', imgsz=imgsz, dynamic=False, simplify=True, opset=13)
+    if tflite:
+        try:
+            print(f"TFLite export: {student_yolo.export(format='tflite', imgsz=imgsz)}")
+        except Exception as e:
+            print(f"[Warning] TFLite export failed (needs tensorflow): {e}")
+    return student_path, onnx_path
+
+
+def _load_optimization():
+    # Numbered pipeline scripts can't be imported by name
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "04_model_optimization.py")
+    spec = importlib.util.spec_from_file_location("model_optimization", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def report_tradeoff(students, per_class=20, output_path="outputs/distillation_report.json"):
+    """
+    Accuracy vs latency/size on the val split for the teacher and every
+    student (.pt, static ONNX and its INT8 copy), to pick a model per device tier.
+    """
+    optimization = _load_optimization()
+    models = {
+        "teacher (PyTorch)": (DEFAULT_MODEL_PATH, 'ultralytics'),
+        "teacher (ONNX)": (DEFAULT_ONNX_PATH, 'onnx'),
+    }
+    for label, (student_path, onnx_path) in students.items():
+        int8_path = os.path.splitext(onnx_path)[0] + '.int8.onnx'
+        try:
+            optimization.quantize_model(onnx_path, int8_path, mode='static')
+        except Exception as e:
+            print(f"[Warning] INT8 quantization of {onnx_path} failed: {e}")
+        models[f"{label} (PyTorch)"] = (student_path, 'ultralytics')
+        models[f"{label} (ONNX)"] = (onnx_path, 'onnx')
+        models[f"{label} (ONNX INT8)"] = (int8_path, 'onnx')
+    return optimization.compare_backends(models, per_class=per_class, output_path=output_path)
+
+
 if __name__ == "__main__":
-    train_model()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the classifier and (optionally) distill edge students")
+    parser.add_argument('--stage', choices=['train', 'distill', 'all'], default='train')
+    parser.add_argument('--student-imgsz', type=int, nargs='+', default=[160],
+                        help="One student per input size, e.g. 160 128")
+    parser.add_argument('--student-width', type=float, default=0.125, help="Channel multiplier (yolov8n = 0.25)")
+    parser.add_argument('--epochs', type=int, default=10, help="Distillation epochs")
+    parser.add_argument('--temperature', type=float, default=4.0)
+    parser.add_argument('--alpha', type=float, default=0.7, help="Weight of the teacher's soft targets")
+    parser.add_argument('--prune', type=float, default=0.0, help="Fraction of conv filters to prune (0 = off)")
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--tflite', action='store_true', help="Also export TFLite (needs tensorflow)")
+    parser.add_argument('--shards', help="Read training images from this shard directory (src/dataset_shards.py)")
+    args = parser.parse_args()
+
+    if args.stage in ('train', 'all'):
+        train_model(shards=args.shards)
+    if args.stage in ('distill', 'all'):
+        students = {}
+        for imgsz in args.student_imgsz:
+            students[f"student {imgsz}px"] = distill_student(
+                imgsz=imgsz, width=args.student_width, epochs=args.epochs, temperature=args.temperature,
+                alpha=args.alpha, prune_amount=args.prune, device=args.device, tflite=args.tflite,
+                shards=args.shards)
+        report_tradeoff(students)
\ No newline at end of file
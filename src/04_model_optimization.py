@@ -0,0 +1,163 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from inference_backend import (DEFAULT_INT8_PATH, DEFAULT_MODEL_PATH, DEFAULT_ONNX_PATH,
+                               OnnxBackend, load_backend, preprocess)
+
+VAL_DIR = "data/processed/dataset_yolo/val"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def sample_split(split_dir, per_class, seed=0):
+    """
+    Deterministic, class-balanced sample of (image_path, class_name) from a split folder.
+    """
+    rng = random.Random(seed)
+    samples = []
+    for cls in sorted(os.listdir(split_dir)):
+        cls_dir = os.path.join(split_dir, cls)
+        if not os.path.isdir(cls_dir):
+            continue
+        images = sorted(f for f in os.listdir(cls_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+        rng.shuffle(images)
+        samples.extend((os.path.join(cls_dir, f), cls) for f in images[:per_class])
+    return samples
+
+
+def quantize_model(onnx_path=DEFAULT_ONNX_PATH, output_path=DEFAULT_INT8_PATH, mode='static',
+                   calib_dir=VAL_DIR, calib_per_class=8):
+    """
+    Writes an INT8 copy of the exported ONNX model.
+
+    'static' calibrates activation ranges on a small class-balanced subset of
+    the val split (QDQ format, best for conv nets on CPU); 'dynamic' only
+    quantizes weights and needs no data.
+    """
+    import onnx
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                          quantize_dynamic, quantize_static)
+
+    if not os.path.exists(onnx_path):
+        raise FileNotFoundError(f"Run 'src/03_model_training.py' first to export {onnx_path}")
+
+    print(f"Quantizing {onnx_path} ({mode}) -> {output_path}")
+
+    if mode == 'dynamic':
+        quantize_dynamic(onnx_path, output_path, weight_type=QuantType.QInt8)
+    elif mode == 'static':
+        if not os.path.exists(calib_dir):
+            raise FileNotFoundError(f"Calibration split not found: {calib_dir}")
+
+        fp32 = OnnxBackend(onnx_path)
+        input_name, imgsz = fp32.input_name, fp32.imgsz
+        samples = sample_split(calib_dir, calib_per_class)
+        print(f"   Calibrating on {len(samples)} images from {calib_dir}")
+
+        class ValCalibrationReader(CalibrationDataReader):
+            def __init__(self):
+                self._paths = iter(path for path, _ in samples)
+
+            def get_next(self):
+                path = next(self._paths, None)
+                if path is None:
+                    return None
+                with open(path, 'rb') as f:
+                    return {input_name: preprocess(f.read(), imgsz)[None]}
+
+        quantize_static(onnx_path, output_path, ValCalibrationReader(), quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True)
+    else:
+        raise ValueError(f"Unknown quantization mode: {mode}")
+
+    # Keep the Ultralytics metadata (class names, imgsz) on the quantized copy
+    original = onnx.load(onnx_path)
+    quantized = onnx.load(output_path)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(original.metadata_props)
+    onnx.save(quantized, output_path)
+
+    size_mb = os.path.getsize(output_path) / 1e6
+    print(f"   [Success] INT8 model: {size_mb:.1f} MB (FP32: {os.path.getsize(onnx_path) / 1e6:.1f} MB)")
+    return output_path
+
+
+def evaluate_backend(backend, samples, warmup=5):
+    """
+    Top-1 accuracy and single-image latency of a backend on (path, class_name) samples.
+    """
+    images = []
+    for path, _ in samples:
+        with open(path, 'rb') as f:
+            images.append(f.read())
+
+    for img in images[:warmup]:
+        backend.predict_proba([img])
+
+    correct = 0
+    latencies = []
+    for img, (_, label) in zip(images, samples):
+        start = time.perf_counter()
+        probs = backend.predict_proba([img])[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        correct += backend.names[int(np.argmax(probs))] == label
+
+    latencies = np.array(latencies)
+    return {
+        "top1_accuracy": round(correct / len(samples), 4),
+        "latency_ms_mean": round(float(latencies.mean()), 2),
+        "latency_ms_p50": round(float(np.percentile(latencies, 50)), 2),
+        "latency_ms_p95": round(float(np.percentile(latencies, 95)), 2),
+        "model_size_mb": round(os.path.getsize(backend.model_path) / 1e6, 2),
+    }
+
+
+def compare_backends(models, val_dir=VAL_DIR, per_class=20, output_path="outputs/onnx_comparison.json"):
+    """
+    Runs every (label -> (model_path, backend)) entry on the same val subset and
+    writes the accuracy / latency comparison as JSON.
+    """
+    samples = sample_split(val_dir, per_class, seed=1)
+    print(f"\nEvaluating {len(models)} backends on {len(samples)} val images...")
+
+    report = {}
+    for label, (model_path, backend) in models.items():
+        if not os.path.exists(model_path):
+            print(f" - {label}: skipped ({model_path} not found)")
+            continue
+        report[label] = evaluate_backend(load_backend(model_path, backend), samples)
+        print(f" - {label}: {report[label]}")
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump({"val_images": len(samples), "backends": report}, f, indent=2)
+
+    print(f"\n{'Backend':<22}{'Top-1':>8}{'Mean ms':>10}{'p95 ms':>10}{'Size MB':>10}")
+    for label, r in report.items():
+        print(f"{label:<22}{r['top1_accuracy']:>8.4f}{r['latency_ms_mean']:>10.2f}"
+              f"{r['latency_ms_p95']:>10.2f}{r['model_size_mb']:>10.2f}")
+    print(f"\nComparison saved to: {output_path}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="INT8-quantize the ONNX export and compare it against PyTorch")
+    parser.add_argument('--onnx', default=DEFAULT_ONNX_PATH)
+    parser.add_argument('--output', default=DEFAULT_INT8_PATH)
+    parser.add_argument('--mode', choices=['static', 'dynamic'], default='static')
+    parser.add_argument('--calib-per-class', type=int, default=8)
+    parser.add_argument('--eval-per-class', type=int, default=20)
+    args = parser.parse_args()
+
+    quantize_model(args.onnx, args.output, mode=args.mode, calib_per_class=args.calib_per_class)
+    compare_backends({
+        "PyTorch (Ultralytics)": (DEFAULT_MODEL_PATH, 'ultralytics'),
+        "ONNX Runtime FP32": (args.onnx, 'onnx'),
+        "ONNX Runtime INT8": (args.output, 'onnx'),
+    }, per_class=args.eval_per_class)
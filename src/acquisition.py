@@ -0,0 +1,329 @@
+import base64
+import hashlib
+import http.client
+import json
+import os
+import shutil
+import threading
+import time
+import urllib.error
+import urllib.request
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST_PATH = "data/raw/.acquisition_manifest.json"
+DOWNLOAD_DIR = "data/raw/.downloads"
+CHUNK = 1 << 20
+
+# The datasets the pipeline needs (see src/01_data_acquisition.py)
+DATASETS = [
+    # This is the standard "PlantVillage" expanded dataset (87K images, ~2GB)
+    {"name": "images", "ref": "vipoooool/new-plant-diseases-dataset", "dest": "data/raw/images", "required": True},
+    # Contains: State, Crop, Season, Yield, Production, Rainfall
+    {"name": "yield", "ref": "akshatgupta7/crop-yield-in-indian-states-dataset", "dest": "data/raw/financial",
+     "required": True},
+    # Daily Market Prices (optional context)
+    {"name": "prices", "ref": "kianwee/agricultural-raw-material-prices-19902020", "dest": "data/raw/financial",
+     "required": False},
+]
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# --- Sources: fetch(ref, archive_path) leaves a complete zip at archive_path ---
+class HttpSource:
+    """
+    Downloads `<base_url>/<ref><suffix>` over HTTP(S), e.g. a plain file
+    server holding `<owner>/<dataset>.zip`. Bytes go to `<archive>.part`
+    and an interrupted download continues from there with a Range request;
+    servers that ignore Range simply restart it.
+    """
+
+    def __init__(self, base_url, headers=None, suffix='.zip', timeout=60, retries=3):
+        self.base_url = base_url.rstrip('/')
+        self.suffix = suffix
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self.retries = retries
+
+    def url_for(self, ref):
+        return f"{self.base_url}/{ref}{self.suffix}"
+
+    def resolve(self, ref):
+        """(url, headers) to download from; subclasses may add a redirect step."""
+        return self.url_for(ref), self.headers
+
+    def fetch(self, ref, archive_path):
+        part_path = archive_path + ".part"
+        for attempt in range(1, self.retries + 1):
+            try:
+                url, headers = self.resolve(ref)
+                self._download(url, headers, part_path)
+                os.replace(part_path, archive_path)
+                return archive_path
+            except (urllib.error.URLError, http.client.HTTPException, ConnectionError, TimeoutError) as e:
+                # Client errors (404, 403, ...) won't fix themselves
+                client_error = isinstance(e, urllib.error.HTTPError) and e.code < 500 and e.code not in (408, 429)
+                if client_error or attempt == self.retries:
+                    raise
+                print(f"   [Retry] {ref}: {e} (attempt {attempt}/{self.retries}, resuming)")
+                time.sleep(2 ** attempt)
+
+    def _download(self, url, headers, part_path):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        request = urllib.request.Request(url, headers=dict(headers))
+        if offset:
+            request.add_header('Range', f"bytes={offset}-")
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and offset:
+                return  # Range past the end: the part file is already complete
+            raise
+
+        with response:
+            if offset and response.status != 206:
+                offset = 0  # Range not honoured, start over
+            expected = response.headers.get('Content-Length')
+            expected = offset + int(expected) if expected is not None else None
+            with open(part_path, 'ab' if offset else 'wb') as f:
+                for chunk in iter(lambda: response.read(CHUNK), b''):
+                    f.write(chunk)
+        size = os.path.getsize(part_path)
+        if expected is not None and size != expected:
+            raise ConnectionError(f"Incomplete download of {url}: {size}/{expected} bytes")
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class KaggleSource(HttpSource):
+    """
+    Kaggle dataset archives via the public REST endpoint, resumable like any
+    HttpSource. The API answers with a redirect to a short-lived storage URL,
+    which is resolved again on every (re)try.
+    """
+
+    API_URL = "https://www.kaggle.com/api/v1/datasets/download"
+
+    def __init__(self, timeout=60, retries=5):
+        from dotenv import load_dotenv
+
+        # 1. Load Credentials
+        load_dotenv()
+        username, key = os.getenv("KAGGLE_USERNAME"), os.getenv("KAGGLE_KEY")
+        if not username or not key:
+            raise ValueError(
+                "Error: Kaggle credentials not found in .env file.\n"
+                "Please ensure you have run 'setup_security.py' and pasted your keys into .env"
+            )
+        token = base64.b64encode(f"{username}:{key}".encode()).decode()
+        super().__init__(self.API_URL, {"Authorization": f"Basic {token}"}, '', timeout, retries)
+
+    def resolve(self, ref):
+        opener = urllib.request.build_opener(_NoRedirect)
+        request = urllib.request.Request(self.url_for(ref), headers=self.headers)
+        try:
+            with opener.open(request, timeout=self.timeout):
+                # No redirect: the API streams the archive itself
+                return self.url_for(ref), self.headers
+        except urllib.error.HTTPError as e:
+            if e.code in (301, 302, 303, 307, 308) and e.headers.get('Location'):
+                # The signed storage URL must not get our Kaggle credentials
+                return e.headers['Location'], {}
+            raise
+
+
+class LocalSource:
+    """Archives from a directory laid out as `<root>/<owner>/<dataset>.zip` (offline runs, tests)."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def fetch(self, ref, archive_path):
+        source = os.path.join(self.root, f"{ref}.zip")
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"No archive for {ref} at {source}")
+        shutil.copyfile(source, archive_path + ".part")
+        os.replace(archive_path + ".part", archive_path)
+        return archive_path
+
+
+# --- Extraction and verification ---
+def _extract_members(archive_path, names, dest):
+    # Each worker reads through its own ZipFile handle; zipfile checks every member's CRC
+    results = {}
+    with zipfile.ZipFile(archive_path) as archive:
+        for name in names:
+            target = os.path.join(dest, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            digest = hashlib.sha256()
+            size = 0
+            with archive.open(name) as src, open(target + ".tmp", 'wb') as out:
+                for chunk in iter(lambda: src.read(CHUNK), b''):
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            os.replace(target + ".tmp", target)
+            results[name] = [size, digest.hexdigest()]
+    return results
+
+
+def extract_archive(archive_path, dest, workers=8):
+    """
+    Streams every member of the zip to `dest` on `workers` threads, hashing
+    while writing. Returns {relative path: [size, sha256]}.
+    """
+    with zipfile.ZipFile(archive_path) as archive:
+        members = [info for info in archive.infolist() if not info.is_dir()]
+    root = os.path.realpath(dest)
+    for info in members:
+        if not os.path.realpath(os.path.join(dest, info.filename)).startswith(root + os.sep):
+            raise ValueError(f"Unsafe path in archive {archive_path}: {info.filename}")
+
+    # Balance the workers by bytes, largest members first
+    buckets = [[] for _ in range(max(1, workers))]
+    loads = [0] * len(buckets)
+    for info in sorted(members, key=lambda i: i.file_size, reverse=True):
+        i = loads.index(min(loads))
+        buckets[i].append(info.filename)
+        loads[i] += info.file_size
+
+    files = {}
+    with ThreadPoolExecutor(max_workers=len(buckets)) as pool:
+        for result in pool.map(lambda names: _extract_members(archive_path, names, dest), buckets):
+            files.update(result)
+    return files
+
+
+def verify_files(dest, files, full=True, workers=8):
+    """
+    Paths under `dest` that don't match the manifest: missing, wrong size,
+    or (with full=True) wrong SHA-256.
+    """
+    def check(item):
+        name, (size, digest) = item
+        path = os.path.join(dest, name)
+        if not os.path.isfile(path) or os.path.getsize(path) != size:
+            return name
+        if full and sha256_file(path) != digest:
+            return name
+        return None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return [name for name in pool.map(check, files.items()) if name is not None]
+
+
+# --- Pipeline ---
+class Manifest:
+    """JSON record of every acquired dataset: archive hash plus per-file sizes and hashes."""
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def record(self, name, entry):
+        with self._lock:
+            self.entries[name] = entry
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path + ".tmp", 'w') as f:
+                json.dump(self.entries, f, indent=1)
+            os.replace(self.path + ".tmp", self.path)
+
+
+def acquire_dataset(dataset, source, manifest, download_dir=DOWNLOAD_DIR, extract_workers=8, verify=False,
+                    keep_archive=False):
+    """
+    Brings one dataset up to date. Skipped when every file recorded in the
+    manifest is present with the right size (and hash, with verify=True).
+    Otherwise the archive is fetched (resuming a partial download), extracted
+    and every extracted file is re-hashed from disk before it is recorded.
+    """
+    name, dest = dataset["name"], dataset["dest"]
+    entry = manifest.get(name)
+    if entry and entry.get("ref") == dataset["ref"]:
+        bad = verify_files(dest, entry["files"], full=verify, workers=extract_workers)
+        if not bad:
+            return {"name": name, "status": "up to date", "files": len(entry["files"])}
+        print(f"   [{name}] {len(bad)} files missing or changed, re-acquiring.")
+
+    os.makedirs(download_dir, exist_ok=True)
+    os.makedirs(dest, exist_ok=True)
+    archive_path = os.path.join(download_dir, f"{name}.zip")
+
+    start = time.perf_counter()
+    if not os.path.exists(archive_path):
+        print(f"   [{name}] Downloading {dataset['ref']}...")
+        source.fetch(dataset["ref"], archive_path)
+    archive_sha256 = sha256_file(archive_path)
+
+    try:
+        files = extract_archive(archive_path, dest, workers=extract_workers)
+    except zipfile.BadZipFile:
+        # Corrupt archive (e.g. a truncated earlier download): fetch it again next run
+        os.remove(archive_path)
+        raise
+
+    # Check what actually landed on disk against the hashes taken while streaming
+    bad = verify_files(dest, files, full=True, workers=extract_workers)
+    if bad:
+        raise IOError(f"{name}: {len(bad)} extracted files failed verification, e.g. {bad[:3]}")
+
+    manifest.record(name, {
+        "ref": dataset["ref"],
+        "archive_sha256": archive_sha256,
+        "archive_size": os.path.getsize(archive_path),
+        "acquired": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "files": files,
+    })
+    if not keep_archive:
+        os.remove(archive_path)
+    return {"name": name, "status": "acquired", "files": len(files),
+            "seconds": round(time.perf_counter() - start, 2)}
+
+
+def acquire(datasets=DATASETS, source=None, manifest_path=MANIFEST_PATH, download_dir=DOWNLOAD_DIR, workers=3,
+            extract_workers=8, verify=False, keep_archives=False):
+    """
+    Fetches all datasets concurrently. Failures of optional datasets are
+    reported and tolerated; a failing required dataset raises at the end.
+    """
+    source = source or KaggleSource()
+    manifest = Manifest(manifest_path)
+
+    def run(dataset):
+        try:
+            return acquire_dataset(dataset, source, manifest, download_dir, extract_workers, verify, keep_archives)
+        except Exception as e:
+            return {"name": dataset["name"], "status": "failed", "error": f"{type(e).__name__}: {e}",
+                    "required": dataset.get("required", True)}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(run, datasets))
+
+    for result in results:
+        if result["status"] == "failed":
+            level = "Error" if result["required"] else "Warning"
+            print(f"   [{level}] {result['name']}: {result['error']}")
+        else:
+            print(f"   [Success] {result['name']}: {result['status']} ({result['files']} files)")
+
+    failed = [r["name"] for r in results if r["status"] == "failed" and r["required"]]
+    if failed:
+        raise RuntimeError(f"Required datasets failed: {failed}. Re-run to resume.")
+    return results
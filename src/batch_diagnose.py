@@ -0,0 +1,280 @@
+import argparse
+import csv
+import glob
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from inference_backend import DEFAULT_MODEL_PATH, load_backend, resize_and_crop, topk
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Output columns and their Parquet types (risk columns only with --state/--crop/--acres)
+RESULT_FIELDS = {'path': 'string', 'class_name': 'string', 'confidence': 'float64', 'topk': 'string',
+                 'error': 'string'}
+RISK_FIELDS = {'Historical_Yield_Ton_Ha': 'float64', 'Yield_Loss_Pct': 'string',
+               'Projected_Revenue_INR': 'float64', 'Revenue_at_Risk_INR': 'float64',
+               'Credit_Eligibility_Score': 'int64', 'Recommendation': 'string'}
+
+
+def list_images(input_dir=None, manifest=None):
+    """
+    Image paths to process, in a stable order: every image under `input_dir`
+    (recursive), or the paths listed in `manifest` (one per line, or a CSV
+    with a 'path' column).
+    """
+    if manifest:
+        with open(manifest, newline='') as f:
+            if manifest.lower().endswith('.csv'):
+                return [row['path'] for row in csv.DictReader(f)]
+            return [line.strip() for line in f if line.strip()]
+
+    paths = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        paths.extend(os.path.join(root, f) for f in sorted(files) if f.lower().endswith(IMAGE_EXTENSIONS))
+    return paths
+
+
+def _load(path, imgsz):
+    # Runs on the prefetch pool: file read + JPEG decode + resize release the GIL
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            return resize_and_crop(image, imgsz), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def prefetch_batches(paths, imgsz, batch_size, workers, prefetch):
+    """
+    Yields (paths, images, errors) batches while the next `prefetch` batches
+    are already being decoded on a thread pool. Memory stays bounded to the
+    batches in flight.
+    """
+    batches = (paths[i:i + batch_size] for i in range(0, len(paths), batch_size))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        for batch in batches:
+            in_flight.append((batch, [pool.submit(_load, p, imgsz) for p in batch]))
+            if len(in_flight) > prefetch:
+                yield _collect(*in_flight.popleft())
+        while in_flight:
+            yield _collect(*in_flight.popleft())
+
+
+def _collect(batch, futures):
+    loaded = [f.result() for f in futures]
+    return batch, [image for image, _ in loaded], [error for _, error in loaded]
+
+
+class CsvSink:
+    """Appends result rows to a CSV file; the file itself is the resume checkpoint."""
+
+    def __init__(self, path, fields):
+        self.path = path
+        self.fields = list(fields)
+        self._file = None
+        self._writer = None
+
+    def done_paths(self):
+        if not os.path.exists(self.path):
+            return set()
+        # Drop a half-written last line left by an interrupted run
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                f.truncate(end)
+        with open(self.path, newline='') as f:
+            reader = csv.DictReader(f)
+            if reader.fieldnames and reader.fieldnames != self.fields:
+                raise ValueError(f"{self.path} was written with different columns; use a new output file")
+            return {row['path'] for row in reader}
+
+    def write(self, rows):
+        if self._file is None:
+            new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            self._file = open(self.path, 'a', newline='')
+            self._writer = csv.DictWriter(self._file, fieldnames=self.fields, extrasaction='ignore')
+            if new_file:
+                self._writer.writeheader()
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class ParquetSink:
+    """
+    Writes result rows into a directory of part files
+    (`<output>/part-00000.parquet`, ...). A part only becomes readable once
+    its footer is written, so the writer is closed every `batches_per_part`
+    batches: a killed run loses at most that many batches, and resuming
+    never rewrites earlier parts.
+    """
+
+    def __init__(self, path, fields, batches_per_part=1):
+        self.path = path
+        self.fields = fields
+        self.batches_per_part = batches_per_part
+        self._writer = None
+        self._batches = 0
+
+    def _parts(self):
+        return sorted(glob.glob(os.path.join(self.path, 'part-*.parquet')))
+
+    def _next_part(self):
+        # After the highest existing number: a deleted (footer-less) part's number is never reused
+        numbers = [int(os.path.basename(p)[len('part-'):-len('.parquet')]) for p in self._parts()]
+        return os.path.join(self.path, f"part-{max(numbers, default=-1) + 1:05d}.parquet")
+
+    def done_paths(self):
+        import pyarrow.parquet as pq
+
+        done = set()
+        for part in self._parts():
+            try:
+                done.update(pq.read_table(part, columns=['path']).column('path').to_pylist())
+            except Exception:
+                # A part whose footer never got written (killed run) holds nothing usable
+                os.remove(part)
+        return done
+
+    def write(self, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Fixed schema: a batch with no errors must not infer a null-typed column
+        schema = pa.schema([(name, pa.type_for_alias(kind)) for name, kind in self.fields.items()])
+        table = pa.Table.from_pylist(rows, schema=schema)
+        if self._writer is None:
+            os.makedirs(self.path, exist_ok=True)
+            self._writer = pq.ParquetWriter(self._next_part(), schema)
+        self._writer.write_table(table)
+        self._batches += 1
+        if self._batches >= self.batches_per_part:
+            self.close()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._batches = 0
+
+
+def run_batch(paths, output, model_path=DEFAULT_MODEL_PATH, backend=None, batch_size=32, workers=8,
+              prefetch=4, k=5, state=None, crop=None, acres=None, resume=True, cascade=None, batches_per_part=1):
+    """
+    Classifies `paths` in batches and streams one row per image to `output`
+    (.csv, or a .parquet directory). With state/crop/acres every diagnosis is
+    also scored by FinancialEngine; giving only some of them is a ValueError.
+    Already-written paths are skipped on resume; a Parquet output starts a new
+    part file every `batches_per_part` batches (what a killed run can lose).
+    `cascade` (a dict of load_cascade() settings) re-checks low-confidence
+    images with TTA / a fallback model.
+    """
+    risk_args = {'state': state, 'crop': crop, 'acres': acres}
+    missing = [name for name, value in risk_args.items() if value is None]
+    if 0 < len(missing) < len(risk_args):
+        raise ValueError(f"Risk scoring needs state, crop and acres together; missing: {', '.join(missing)}")
+
+    fields = dict(RESULT_FIELDS)
+    engine = None
+    if not missing:
+        from financial_engine import FinancialEngine
+        engine = FinancialEngine()
+        fields.update(RISK_FIELDS)
+
+    sink = ParquetSink(output, fields, batches_per_part) if output.endswith('.parquet') else CsvSink(output, fields)
+    if resume:
+        done = sink.done_paths()
+        if done:
+            print(f"[Resume] {len(done)} images already in {output}, skipping them.")
+            paths = [p for p in paths if p not in done]
+    elif os.path.exists(output):
+        raise FileExistsError(f"{output} exists; pass resume=True (default) or remove it first")
+
+    if cascade is not None:
+        from cascade import load_cascade
+        model = load_cascade(model_path, backend, **cascade)
+    else:
+        model = load_backend(model_path, backend)
+    imgsz = getattr(model, 'imgsz', 224)
+    print(f"Diagnosing {len(paths)} images with {model_path} (batch={batch_size}, workers={workers})")
+
+    try:
+        with tqdm(total=len(paths), desc="Diagnosing", unit="img") as progress:
+            for batch, images, errors in prefetch_batches(paths, imgsz, batch_size, workers, prefetch):
+                ok = [i for i, image in enumerate(images) if image is not None]
+                probs = model.predict_proba([images[i] for i in ok]) if ok else np.empty((0, len(model.names)))
+
+                rows = [{'path': p, 'class_name': None, 'confidence': None, 'topk': None, 'error': e}
+                        for p, e in zip(batch, errors)]
+                for i, p in zip(ok, probs):
+                    predictions = topk(p, model.names, k)
+                    rows[i].update(class_name=predictions[0][0], confidence=predictions[0][1],
+                                   topk=json.dumps(predictions))
+
+                if engine is not None and ok:
+                    reports = engine.calculate_risk_profile_batch(pd.DataFrame({
+                        'state': state, 'crop': crop, 'land_area_acres': float(acres),
+                        'disease_class': [rows[i]['class_name'] for i in ok],
+                    }))
+                    for i, report in zip(ok, reports.astype(object).to_dict('records')):
+                        rows[i].update({f: report[f] for f in RISK_FIELDS})
+
+                sink.write(rows)
+                progress.update(len(batch))
+    finally:
+        sink.close()
+
+    if cascade is not None:
+        print(f"Cascade stages: {model.stats()}")
+    print(f"[Success] Results written to: {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless bulk leaf diagnosis to CSV/Parquet")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help="Folder of leaf images (walked recursively)")
+    source.add_argument('--manifest', help="Text file of image paths, or CSV with a 'path' column")
+    parser.add_argument('--output', required=True, help="results.csv, or results.parquet (directory of parts)")
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--backend', choices=['ultralytics', 'onnx'], default=None)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=8, help="Decode/preprocess threads")
+    parser.add_argument('--prefetch', type=int, default=4, help="Batches decoded ahead of the model")
+    parser.add_argument('--topk', type=int, default=5)
+    parser.add_argument('--state', help="Chain each diagnosis into the risk engine for this state")
+    parser.add_argument('--crop')
+    parser.add_argument('--acres', type=float)
+    parser.add_argument('--no-resume', action='store_true', help="Fail instead of resuming an existing output")
+    parser.add_argument('--batches-per-part', type=int, default=1,
+                        help="Parquet only: batches per part file (fewer files vs. more work redone after a kill)")
+    parser.add_argument('--cascade', action='store_true', help="Re-check low-confidence images with TTA")
+    parser.add_argument('--tta-threshold', type=float, default=0.7)
+    parser.add_argument('--fallback-model', help="Larger model for images still uncertain after TTA")
+    parser.add_argument('--fallback-threshold', type=float, default=0.5)
+    args = parser.parse_args()
+    missing = [f"--{name}" for name in ('state', 'crop', 'acres') if getattr(args, name) is None]
+    if 0 < len(missing) < 3:
+        parser.error(f"--state, --crop and --acres go together (missing {', '.join(missing)})")
+
+    cascade = None
+    if args.cascade:
+        cascade = {'tta_threshold': args.tta_threshold, 'fallback_path': args.fallback_model,
+                   'fallback_threshold': args.fallback_threshold}
+
+    run_batch(list_images(args.input, args.manifest), args.output, model_path=args.model, backend=args.backend,
+              batch_size=args.batch_size, workers=args.workers, prefetch=args.prefetch, k=args.topk,
+              state=args.state, crop=args.crop, acres=args.acres, resume=not args.no_resume, cascade=cascade,
+              batches_per_part=args.batches_per_part)
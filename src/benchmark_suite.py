@@ -0,0 +1,280 @@
+import argparse
+import importlib.util
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_DIR = "outputs/benchmarks"
+
+FIXTURE_STATES = ['Andhra Pradesh', 'Bihar', 'Gujarat', 'Karnataka', 'Madhya Pradesh', 'Maharashtra',
+                  'Punjab', 'Tamil Nadu', 'Uttar Pradesh', 'West Bengal']
+FIXTURE_CROPS = ['Rice', 'Wheat', 'Maize', 'Potato', 'Tomato', 'Cotton', 'Sugarcane', 'Groundnut']
+FIXTURE_CLASSES = ['Corn___Common_rust_', 'Corn___healthy', 'Potato___Early_blight', 'Potato___Late_blight',
+                   'Tomato___Bacterial_spot', 'Tomato___healthy']
+
+
+# --- Synthetic fixtures (no downloads, no trained weights) ---
+def make_yield_csv(path, rows=20000, seed=0):
+    """Yield CSV with the same headers as the government dataset."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'Crop': rng.choice(FIXTURE_CROPS, rows),
+        'Crop_Year': rng.integers(1997, 2021, rows),
+        'Season': rng.choice(['Kharif', 'Rabi', 'Whole Year'], rows),
+        'State': rng.choice(FIXTURE_STATES, rows),
+        'Area': rng.uniform(100, 50000, rows).round(1),
+        'Production': rng.uniform(100, 90000, rows).round(1),
+        'Annual_Rainfall': rng.uniform(300, 3000, rows).round(1),
+        'Yield': rng.gamma(4.0, 0.8, rows),
+    })
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df.to_csv(path, index=False)
+    return path
+
+
+def make_images(raw_base, per_class=50, imgsz=224, seed=0):
+    """Random-noise JPEGs laid out like the Kaggle download (<raw_base>/train/<class>/*.jpg)."""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    paths = []
+    for cls in FIXTURE_CLASSES:
+        cls_dir = os.path.join(raw_base, 'train', cls)
+        os.makedirs(cls_dir, exist_ok=True)
+        for i in range(per_class):
+            path = os.path.join(cls_dir, f"{i:05d}.jpg")
+            Image.fromarray(rng.integers(0, 256, (imgsz, imgsz, 3), dtype=np.uint8)).save(path, quality=90)
+            paths.append(path)
+    return paths
+
+
+def make_tiny_classifier(path, imgsz=224, seed=0):
+    """
+    Randomly initialized conv -> pool -> linear classifier as ONNX, with the
+    names/imgsz metadata an Ultralytics export carries, so OnnxBackend loads it
+    like a real model. Measures our decode/preprocess/batching overhead plus a
+    small amount of compute, not the accuracy of anything.
+    """
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(seed)
+    n = len(FIXTURE_CLASSES)
+    weights = [
+        numpy_helper.from_array((rng.standard_normal((16, 3, 3, 3)) * 0.1).astype(np.float32), 'conv_w'),
+        numpy_helper.from_array((rng.standard_normal((16, n)) * 0.1).astype(np.float32), 'fc_w'),
+        numpy_helper.from_array(np.zeros(n, dtype=np.float32), 'fc_b'),
+    ]
+    nodes = [
+        helper.make_node('Conv', ['images', 'conv_w'], ['conv'], strides=[2, 2], pads=[1, 1, 1, 1]),
+        helper.make_node('Relu', ['conv'], ['relu']),
+        helper.make_node('GlobalAveragePool', ['relu'], ['pool']),
+        helper.make_node('Flatten', ['pool'], ['flat']),
+        helper.make_node('Gemm', ['flat', 'fc_w', 'fc_b'], ['logits']),
+        helper.make_node('Softmax', ['logits'], ['output0'], axis=1),
+    ]
+    graph = helper.make_graph(
+        nodes, 'tiny_classifier',
+        [helper.make_tensor_value_info('images', TensorProto.FLOAT, ['batch', 3, imgsz, imgsz])],
+        [helper.make_tensor_value_info('output0', TensorProto.FLOAT, ['batch', n])],
+        weights)
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)])
+    model.ir_version = 8
+    helper.set_model_props(model, {'names': repr(dict(enumerate(FIXTURE_CLASSES))), 'imgsz': repr([imgsz, imgsz])})
+    onnx.save(model, path)
+    return path
+
+
+# --- Benchmarks ---
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_engine(data_dir, lookups=20000, reports=20000, seed=0):
+    from financial_engine import FinancialEngine
+
+    cache_dir = os.path.join(data_dir, '.cache')
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    _, csv_init = _timed(FinancialEngine, data_dir=data_dir, use_cache=False)
+    _, cold_init = _timed(FinancialEngine, data_dir=data_dir)
+    engine, warm_init = _timed(FinancialEngine, data_dir=data_dir)
+
+    rng = np.random.default_rng(seed)
+    # Mix exact names with partial ones ("Pradesh") and crops missing from the data
+    states = rng.choice(FIXTURE_STATES + ['Pradesh', 'Nagaland'], lookups)
+    crops = rng.choice(FIXTURE_CROPS + ['Barley'], lookups)
+    _, lookup_s = _timed(lambda: [engine.get_historical_yield(s, c) for s, c in zip(states, crops)])
+
+    applications = pd.DataFrame({
+        'state': rng.choice(FIXTURE_STATES, reports),
+        'crop': rng.choice(FIXTURE_CROPS, reports),
+        'disease_class': rng.choice(FIXTURE_CLASSES, reports),
+        'land_area_acres': rng.uniform(1, 20, reports),
+    })
+    rows = list(zip(*(applications[c].tolist() for c in engine.BATCH_COLUMNS)))
+    _, report_s = _timed(lambda: [engine.calculate_risk_profile(*row) for row in rows])
+    _, batch_s = _timed(engine.calculate_risk_profile_batch, applications)
+
+    return {
+        "init_csv_s": round(csv_init, 4),
+        "init_cold_cache_s": round(cold_init, 4),
+        "init_warm_cache_s": round(warm_init, 4),
+        "lookups_per_sec": round(lookups / lookup_s, 1),
+        "reports_per_sec": round(reports / report_s, 1),
+        "batch_reports_per_sec": round(reports / batch_s, 1),
+        "batch_speedup": round(report_s / batch_s, 1),
+    }
+
+
+def bench_inference(model_path, image_paths, batch_sizes=(1, 8, 32), repeats=30):
+    from inference_backend import load_backend
+
+    model, load_s = _timed(load_backend, model_path)
+    encoded = [open(p, 'rb').read() for p in image_paths]
+    result = {"model": os.path.basename(model_path), "load_s": round(load_s, 4), "batches": {}}
+
+    for batch_size in batch_sizes:
+        batch = [encoded[i % len(encoded)] for i in range(batch_size)]
+        model.predict_proba(batch)  # warm-up
+        latencies = []
+        for _ in range(repeats):
+            latencies.append(_timed(model.predict_proba, batch)[1] * 1000)
+        p50 = float(np.percentile(latencies, 50))
+        result["batches"][str(batch_size)] = {
+            "p50_ms": round(p50, 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+            "images_per_sec": round(batch_size / (p50 / 1000), 1),
+        }
+    return result
+
+
+def _load_preprocessing():
+    # The pipeline scripts are numbered, so they can't be imported by name
+    spec = importlib.util.spec_from_file_location("data_preprocessing", os.path.join(SRC_DIR, "02_data_preprocessing.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench_organize(raw_base, workdir, modes=('hardlink', 'copy')):
+    preprocessing = _load_preprocessing()
+    n_files = sum(len(files) for _, _, files in os.walk(os.path.join(raw_base, 'train')))
+    result = {"files": n_files}
+    for mode in modes:
+        processed_dir = os.path.join(workdir, f"organized_{mode}")
+        shutil.rmtree(processed_dir, ignore_errors=True)
+        _, full_s = _timed(preprocessing.organize_dataset, raw_base, processed_dir, mode=mode)
+        _, noop_s = _timed(preprocessing.organize_dataset, raw_base, processed_dir, mode=mode)
+        result[mode] = {
+            "full_s": round(full_s, 4),
+            "files_per_sec": round(n_files / full_s, 1),
+            "incremental_noop_s": round(noop_s, 4),
+        }
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=SRC_DIR).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+def run_suite(workdir=None, model_path=None, yield_rows=20000, images_per_class=50, imgsz=224,
+              stages=('engine', 'inference', 'organize')):
+    """
+    Builds the synthetic fixtures in `workdir` (a temp dir by default) and runs
+    the selected stages. `model_path` benchmarks a real exported model instead
+    of the tiny random one.
+    """
+    own_workdir = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix="agriguard_bench_")
+    results = {"environment": environment(), "fixtures": {"yield_rows": yield_rows,
+                                                          "images": images_per_class * len(FIXTURE_CLASSES),
+                                                          "imgsz": imgsz}}
+    try:
+        data_dir = os.path.join(workdir, 'financial')
+        raw_base = os.path.join(workdir, 'raw_images')
+        if 'engine' in stages:
+            make_yield_csv(os.path.join(data_dir, 'crop_yield.csv'), yield_rows)
+            print("[Bench] FinancialEngine")
+            results["engine"] = bench_engine(data_dir)
+
+        if 'inference' in stages or 'organize' in stages:
+            image_paths = make_images(raw_base, images_per_class, imgsz)
+
+        if 'inference' in stages:
+            model_path = model_path or make_tiny_classifier(os.path.join(workdir, 'tiny_classifier.onnx'), imgsz)
+            print(f"[Bench] Inference ({model_path})")
+            results["inference"] = bench_inference(model_path, image_paths)
+
+        if 'organize' in stages:
+            print("[Bench] organize_dataset")
+            results["organize"] = bench_organize(raw_base, workdir)
+    finally:
+        if own_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def _flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(baseline, current):
+    """Per-metric ratio current / baseline for every numeric result present in both runs."""
+    old = _flatten({k: v for k, v in baseline.items() if k not in ('environment', 'fixtures')})
+    new = _flatten({k: v for k, v in current.items() if k not in ('environment', 'fixtures')})
+    return {key: round(new[key] / old[key], 3) for key in sorted(old.keys() & new.keys()) if old[key]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline performance benchmarks on synthetic fixtures")
+    parser.add_argument('--stages', nargs='+', default=['engine', 'inference', 'organize'],
+                        choices=['engine', 'inference', 'organize'])
+    parser.add_argument('--model', default=None, help="Benchmark this model instead of the tiny random one")
+    parser.add_argument('--yield-rows', type=int, default=20000)
+    parser.add_argument('--images-per-class', type=int, default=50)
+    parser.add_argument('--workdir', default=None, help="Keep fixtures here instead of a temp dir")
+    parser.add_argument('--output', default=None, help=f"JSON path (default: {OUTPUT_DIR}/<timestamp>.json)")
+    parser.add_argument('--compare', default=None, help="Previous results JSON to compare against")
+    args = parser.parse_args()
+
+    results = run_suite(args.workdir, args.model, args.yield_rows, args.images_per_class, stages=args.stages)
+    if args.compare:
+        with open(args.compare) as f:
+            results["ratio_vs_baseline"] = compare(json.load(f), results)
+
+    output = args.output or os.path.join(OUTPUT_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"[Success] Benchmark results saved to: {output}")
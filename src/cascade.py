@@ -0,0 +1,161 @@
+import os
+import threading
+
+import numpy as np
+
+import instrumentation
+from diagnosis_cache import weights_fingerprint
+from inference_backend import decode_image, load_backend
+
+
+def _corner_crop(corner, scale):
+    def crop(image):
+        w, h = image.size
+        side = int(min(w, h) * scale)
+        left = 0 if corner in ('top_left', 'bottom_left') else w - side
+        top = 0 if corner in ('top_left', 'top_right') else h - side
+        return image.crop((left, top, left + side, top + side))
+    return crop
+
+
+def tta_views(scale=0.8):
+    """
+    Test-time augmentation views: name -> function(PIL image) -> PIL image.
+    The plain image (center crop) is what the first stage already saw.
+    """
+    from PIL import ImageOps
+
+    views = {
+        'hflip': ImageOps.mirror,
+        'vflip': ImageOps.flip,
+    }
+    for corner in ('top_left', 'top_right', 'bottom_left', 'bottom_right'):
+        views[corner] = _corner_crop(corner, scale)
+    return views
+
+
+class CascadeClassifier:
+    """
+    Confidence-gated inference on top of a fast backend.
+
+    Stage 1 runs the fast model once on every image. Only images whose top-1
+    confidence is below `tta_threshold` go to stage 2: the TTA views of all of
+    them (flips + corner crops) run through the fast model as one batch and
+    their probabilities are averaged with the stage 1 result. If a `fallback`
+    model is given, images still below `fallback_threshold` after that go to
+    stage 3 and the (larger) fallback model's probabilities are averaged in
+    with weight `fallback_weight`. The fallback has to be a different
+    (larger) checkpoint: the same weights file would only repeat stage 1.
+
+    Exposes the same names / imgsz / model_path / predict_proba() as the
+    plain backends, so it drops into every diagnosis path. stats() reports
+    how often each stage fired and the cost in fast-model passes, counting
+    one fallback pass as `fallback_cost` of them (default: the weights file
+    size ratio, a rough proxy for the larger model's compute).
+    """
+
+    def __init__(self, fast, fallback=None, tta_threshold=0.7, fallback_threshold=0.5,
+                 views=('hflip', 'vflip', 'top_left', 'top_right', 'bottom_left', 'bottom_right'),
+                 crop_scale=0.8, fallback_weight=0.5, fallback_cost=None):
+        self.fallback_fingerprint = None
+        self.fallback_cost = 0.0
+        if fallback is not None:
+            if list(fallback.names) != list(fast.names):
+                raise ValueError("Fallback model must predict the same classes as the fast model")
+            self.fallback_fingerprint = weights_fingerprint(fallback.model_path)
+            if self.fallback_fingerprint == weights_fingerprint(fast.model_path):
+                raise ValueError(f"Fallback {fallback.model_path} has the same weights as the fast model; "
+                                 f"use a larger checkpoint")
+            if fallback_cost is None:
+                fallback_cost = max(os.path.getsize(fallback.model_path) / os.path.getsize(fast.model_path), 1.0)
+            self.fallback_cost = float(fallback_cost)
+
+        available = tta_views(crop_scale)
+        unknown = [v for v in views if v not in available]
+        if unknown:
+            raise ValueError(f"Unknown TTA views {unknown}. Choose from: {list(available)}")
+
+        self.fast = fast
+        self.fallback = fallback
+        self.tta_threshold = tta_threshold
+        self.fallback_threshold = fallback_threshold
+        self.views = [available[v] for v in views]
+        self.view_names = list(views)
+        self.fallback_weight = fallback_weight
+
+        self.names = fast.names
+        self.imgsz = getattr(fast, 'imgsz', 224)
+        self.model_path = fast.model_path
+
+        self._lock = threading.Lock()
+        self._counts = {"images": 0, "tta": 0, "fallback": 0}
+
+    def config(self):
+        """Settings that change the output (part of the diagnosis cache key)."""
+        return {
+            "tta_threshold": self.tta_threshold,
+            "fallback_threshold": self.fallback_threshold if self.fallback is not None else None,
+            # The weights, not the path: a retrained checkpoint at the same path must not reuse old results
+            "fallback": self.fallback_fingerprint,
+            "views": self.view_names,
+            "fallback_weight": self.fallback_weight,
+        }
+
+    def predict_proba(self, images):
+        """
+        Classifies a list of images. Returns an (N, num_classes) float32 array.
+        """
+        images = [decode_image(img) for img in images]
+
+        # 1. Fast model, once per image
+        with instrumentation.stage("cascade", step="fast"):
+            probs = self.fast.predict_proba(images).astype(np.float64)
+
+        # 2. Batched TTA for the uncertain ones
+        uncertain = np.flatnonzero(probs.max(axis=1) < self.tta_threshold)
+        if len(uncertain) and self.views:
+            with instrumentation.stage("cascade", step="tta"):
+                batch = [view(images[i]) for i in uncertain for view in self.views]
+                view_probs = self.fast.predict_proba(batch).reshape(len(uncertain), len(self.views), -1)
+                probs[uncertain] = (probs[uncertain] + view_probs.sum(axis=1)) / (len(self.views) + 1)
+
+        # 3. Larger fallback model for what is still uncertain
+        escalated = np.empty(0, dtype=np.int64)
+        if self.fallback is not None and len(uncertain):
+            escalated = uncertain[probs[uncertain].max(axis=1) < self.fallback_threshold]
+            if len(escalated):
+                with instrumentation.stage("cascade", step="fallback"):
+                    fallback_probs = self.fallback.predict_proba([images[i] for i in escalated])
+                    probs[escalated] = ((1 - self.fallback_weight) * probs[escalated]
+                                        + self.fallback_weight * fallback_probs)
+
+        with self._lock:
+            self._counts["images"] += len(images)
+            self._counts["tta"] += len(uncertain)
+            self._counts["fallback"] += len(escalated)
+        instrumentation.count("agriguard_cascade_images_total", len(images), step="fast")
+        instrumentation.count("agriguard_cascade_images_total", len(uncertain), step="tta")
+        instrumentation.count("agriguard_cascade_images_total", len(escalated), step="fallback")
+        return probs.astype(np.float32)
+
+    def stats(self):
+        """Images seen and how many of them reached the TTA / fallback stages."""
+        with self._lock:
+            counts = dict(self._counts)
+        seen = max(counts["images"], 1)
+        return {
+            **counts,
+            "tta_rate": round(counts["tta"] / seen, 4),
+            "fallback_rate": round(counts["fallback"] / seen, 4),
+            # Forward passes per image in fast-model units (fallback passes weighted by fallback_cost),
+            # relative to stage 1 alone
+            "cost_factor": round(1 + (counts["tta"] * len(self.views)
+                                      + counts["fallback"] * self.fallback_cost) / seen, 3),
+        }
+
+
+def load_cascade(model_path, backend=None, fallback_path=None, fallback_backend=None, **settings):
+    """CascadeClassifier over load_backend() models; `settings` go to the constructor."""
+    fast = load_backend(model_path, backend)
+    fallback = load_backend(fallback_path, fallback_backend) if fallback_path else None
+    return CascadeClassifier(fast, fallback, **settings)
@@ -0,0 +1,266 @@
+import threading
+
+import numpy as np
+
+# Shared treatment advice, referenced by the per-class table below
+TREAT_BLIGHT = "Apply fungicides containing mancozeb or chlorothalonil. Improve air circulation."
+TREAT_MILDEW = "Use sulfur-based sprays or neem oil. Remove infected leaves immediately."
+TREAT_RUST = "Apply copper-based fungicides. Rotate crops to prevent recurrence."
+TREAT_SPOT = "Avoid overhead watering. Use copper soap or certified organic fungicides."
+TREAT_MITE = "Spray water to knock them off. Introduce predatory mites or use neem oil."
+TREAT_ROT = "Prune out cankers and mummified fruit. Apply captan or myclobutanil during the season."
+TREAT_SCAB = "Rake up fallen leaves. Apply captan or myclobutanil from green tip to petal fall."
+TREAT_MOLD = "Lower humidity (ventilate, avoid wet leaves). Apply chlorothalonil or copper fungicides."
+TREAT_VIRUS = "No chemical cure: remove infected plants, control whiteflies/aphids and use resistant varieties."
+TREAT_GREENING = "No cure: remove infected trees, control the citrus psyllid and replant with certified stock."
+TREAT_HEALTHY = "Crop is healthy! Continue standard irrigation and monitoring."
+TREAT_DEFAULT = "Consult a local agronomist for specific chemical controls."
+
+# Keyword fallback for classes without an explicit entry (first match wins)
+TREATMENT_KEYWORDS = {
+    'Blight': TREAT_BLIGHT,
+    'Mildew': TREAT_MILDEW,
+    'Rust': TREAT_RUST,
+    'Spot': TREAT_SPOT,
+    'Mite': TREAT_MITE,
+    'Healthy': TREAT_HEALTHY,
+}
+
+# Yield loss fraction assumed for a diseased class without an explicit entry
+DEFAULT_LOSS = 0.10
+
+# The 38 PlantVillage classes, in the (sorted) order the classifier outputs them:
+# class name -> (crop, disease, expected yield loss fraction, treatment)
+PLANTVILLAGE_CLASSES = {
+    'Apple___Apple_scab': ('Apple', 'Apple_scab', 0.20, TREAT_SCAB),
+    'Apple___Black_rot': ('Apple', 'Black_rot', 0.30, TREAT_ROT),
+    'Apple___Cedar_apple_rust': ('Apple', 'Cedar_apple_rust', 0.15, TREAT_RUST),
+    'Apple___healthy': ('Apple', 'healthy', 0.0, TREAT_HEALTHY),
+    'Blueberry___healthy': ('Blueberry', 'healthy', 0.0, TREAT_HEALTHY),
+    'Cherry_(including_sour)___Powdery_mildew': ('Cherry', 'Powdery_mildew', 0.15, TREAT_MILDEW),
+    'Cherry_(including_sour)___healthy': ('Cherry', 'healthy', 0.0, TREAT_HEALTHY),
+    'Corn_(maize)___Cercospora_leaf_spot Gray_leaf_spot': ('Maize', 'Cercospora_leaf_spot Gray_leaf_spot', 0.25,
+                                                           TREAT_SPOT),
+    'Corn_(maize)___Common_rust_': ('Maize', 'Common_rust_', 0.25, TREAT_RUST),
+    'Corn_(maize)___Northern_Leaf_Blight': ('Maize', 'Northern_Leaf_Blight', 0.35, TREAT_BLIGHT),
+    'Corn_(maize)___healthy': ('Maize', 'healthy', 0.0, TREAT_HEALTHY),
+    'Grape___Black_rot': ('Grape', 'Black_rot', 0.30, TREAT_ROT),
+    'Grape___Esca_(Black_Measles)': ('Grape', 'Esca_(Black_Measles)', 0.40, TREAT_ROT),
+    'Grape___Leaf_blight_(Isariopsis_Leaf_Spot)': ('Grape', 'Leaf_blight_(Isariopsis_Leaf_Spot)', 0.15,
+                                                   TREAT_BLIGHT),
+    'Grape___healthy': ('Grape', 'healthy', 0.0, TREAT_HEALTHY),
+    'Orange___Haunglongbing_(Citrus_greening)': ('Orange', 'Haunglongbing_(Citrus_greening)', 0.50,
+                                                 TREAT_GREENING),
+    'Peach___Bacterial_spot': ('Peach', 'Bacterial_spot', 0.30, TREAT_SPOT),
+    'Peach___healthy': ('Peach', 'healthy', 0.0, TREAT_HEALTHY),
+    'Pepper,_bell___Bacterial_spot': ('Pepper', 'Bacterial_spot', 0.30, TREAT_SPOT),
+    'Pepper,_bell___healthy': ('Pepper', 'healthy', 0.0, TREAT_HEALTHY),
+    'Potato___Early_blight': ('Potato', 'Early_blight', 0.20, TREAT_BLIGHT),
+    'Potato___Late_blight': ('Potato', 'Late_blight', 0.40, TREAT_BLIGHT),
+    'Potato___healthy': ('Potato', 'healthy', 0.0, TREAT_HEALTHY),
+    'Raspberry___healthy': ('Raspberry', 'healthy', 0.0, TREAT_HEALTHY),
+    'Soybean___healthy': ('Soybean', 'healthy', 0.0, TREAT_HEALTHY),
+    'Squash___Powdery_mildew': ('Squash', 'Powdery_mildew', 0.15, TREAT_MILDEW),
+    'Strawberry___Leaf_scorch': ('Strawberry', 'Leaf_scorch', 0.20, TREAT_SPOT),
+    'Strawberry___healthy': ('Strawberry', 'healthy', 0.0, TREAT_HEALTHY),
+    'Tomato___Bacterial_spot': ('Tomato', 'Bacterial_spot', 0.30, TREAT_SPOT),
+    'Tomato___Early_blight': ('Tomato', 'Early_blight', 0.20, TREAT_BLIGHT),
+    'Tomato___Late_blight': ('Tomato', 'Late_blight', 0.40, TREAT_BLIGHT),
+    'Tomato___Leaf_Mold': ('Tomato', 'Leaf_Mold', 0.15, TREAT_MOLD),
+    'Tomato___Septoria_leaf_spot': ('Tomato', 'Septoria_leaf_spot', 0.15, TREAT_SPOT),
+    'Tomato___Spider_mites Two-spotted_spider_mite': ('Tomato', 'Spider_mites Two-spotted_spider_mite', 0.10,
+                                                      TREAT_MITE),
+    'Tomato___Target_Spot': ('Tomato', 'Target_Spot', 0.25, TREAT_SPOT),
+    'Tomato___Tomato_Yellow_Leaf_Curl_Virus': ('Tomato', 'Tomato_Yellow_Leaf_Curl_Virus', 0.60, TREAT_VIRUS),
+    'Tomato___Tomato_mosaic_virus': ('Tomato', 'Tomato_mosaic_virus', 0.50, TREAT_VIRUS),
+    'Tomato___healthy': ('Tomato', 'healthy', 0.0, TREAT_HEALTHY),
+}
+
+# Short disease names typed by hand (e.g. in the Banker form) -> class they stand for
+DISEASE_ALIASES = {
+    'Leaf_mold': 'Tomato___Leaf_Mold',
+    'Spider_mites': 'Tomato___Spider_mites Two-spotted_spider_mite',
+    'Mosaic_virus': 'Tomato___Tomato_mosaic_virus',
+    'Yellow_Leaf_Curl_Virus': 'Tomato___Tomato_Yellow_Leaf_Curl_Virus',
+    'Gray_leaf_spot': 'Corn_(maize)___Cercospora_leaf_spot Gray_leaf_spot',
+    'Citrus_greening': 'Orange___Haunglongbing_(Citrus_greening)',
+}
+
+
+def keyword_treatment(disease_name):
+    """The old keyword match, used for names without a table entry."""
+    for key, val in TREATMENT_KEYWORDS.items():
+        if key.lower() in disease_name.lower():
+            return val
+    return TREAT_DEFAULT
+
+
+class ClassMetadata:
+    """
+    Crop, disease, yield loss, treatment and healthy flag for every class the
+    classifier can output, compiled once into parallel arrays indexed by the
+    integer class id (the model's output index).
+
+    Two extra ids follow the real classes: `unknown_id` (a name we know
+    nothing about, DEFAULT_LOSS) and `unknown_healthy_id` (an unknown name
+    that still says "healthy", no loss), so every lookup returns a valid
+    index and batch code can gather with `metadata.loss[ids]`.
+    Model classes missing from PLANTVILLAGE_CLASSES get keyword-derived
+    values and are listed in `unmatched`.
+    """
+
+    MAX_MEMO = 4096
+
+    def __init__(self, names=None):
+        if names is None:
+            names = list(PLANTVILLAGE_CLASSES)
+        elif isinstance(names, dict):
+            names = [names[i] for i in range(len(names))]
+        self.names = list(names)
+
+        crops, diseases, losses, treatments, healthy = [], [], [], [], []
+        self.unmatched = []
+        for name in self.names:
+            entry = PLANTVILLAGE_CLASSES.get(name)
+            if entry is None:
+                self.unmatched.append(name)
+                entry = self._derive(name)
+            crop, disease, loss, treatment = entry
+            crops.append(crop)
+            diseases.append(disease)
+            losses.append(loss)
+            treatments.append(treatment)
+            healthy.append('healthy' in disease.lower())
+
+        # Sentinel rows for names outside the model's classes
+        self.unknown_id = len(self.names)
+        self.unknown_healthy_id = self.unknown_id + 1
+        crops += [None, None]
+        diseases += [None, None]
+        losses += [DEFAULT_LOSS, 0.0]
+        treatments += [TREAT_DEFAULT, TREAT_HEALTHY]
+        healthy += [False, True]
+
+        self.crops = crops
+        self.diseases = diseases
+        self.treatments = treatments
+        self.loss = np.array(losses, dtype=np.float64)
+        self.healthy = np.array(healthy, dtype=bool)
+        self.matched = np.array([n in PLANTVILLAGE_CLASSES for n in self.names] + [False, False], dtype=bool)
+
+        # Exact class names first; short disease names only where unambiguous
+        self._ids = {name: i for i, name in enumerate(self.names)}
+        self._aliases = {}
+        by_disease = {}
+        for i, disease in enumerate(diseases[:self.unknown_id]):
+            by_disease.setdefault(self._key(disease), []).append(i)
+        for key, ids in by_disease.items():
+            if len({losses[i] for i in ids}) == 1:
+                self._aliases[key] = ids[0]
+        for alias, name in DISEASE_ALIASES.items():
+            if name in self._ids:
+                self._aliases[self._key(alias)] = self._ids[name]
+        self._memo = {}
+
+        if self.unmatched:
+            print(f"[Warning] {len(self.unmatched)} classes have no metadata entry "
+                  f"(keyword fallback used): {self.unmatched}")
+
+    @staticmethod
+    def _key(name):
+        return name.strip().strip('_').lower()
+
+    @staticmethod
+    def _derive(name):
+        crop, _, disease = name.rpartition('___')
+        if 'healthy' in disease.lower():
+            return crop, disease, 0.0, TREAT_HEALTHY
+        return crop, disease, DEFAULT_LOSS, keyword_treatment(disease)
+
+    def class_id(self, name):
+        """
+        Integer id for a class name. Accepts an integer class id as is (the
+        model's output index; ValueError if out of range), exact model class
+        names (O(1)), then a bare disease name like "Early_blight"
+        (case-insensitive); anything else maps to one of the unknown sentinels.
+        """
+        if isinstance(name, (int, np.integer)):
+            if not 0 <= name < self.unknown_id:
+                raise ValueError(f"Class id {name} out of range for {self.unknown_id} classes")
+            return int(name)
+
+        class_id = self._ids.get(name)
+        if class_id is not None:
+            return class_id
+
+        class_id = self._memo.get(name)
+        if class_id is None:
+            disease = name.split('___')[-1]
+            class_id = self._aliases.get(self._key(disease))
+            if class_id is None:
+                class_id = self.unknown_healthy_id if 'healthy' in disease.lower() else self.unknown_id
+            if len(self._memo) >= self.MAX_MEMO:
+                self._memo.clear()
+            self._memo[name] = class_id
+        return class_id
+
+    def class_ids(self, names):
+        """class_id() for a sequence of names or ids, as an int64 array to gather the tables with."""
+        if isinstance(names, np.ndarray) and names.dtype.kind in 'iu':
+            if len(names) and (names.min() < 0 or names.max() >= self.unknown_id):
+                raise ValueError(f"Class ids out of range for {self.unknown_id} classes")
+            return names.astype(np.int64)
+        return np.fromiter((self.class_id(n) for n in names), dtype=np.int64, count=len(names))
+
+    def disease(self, name):
+        """Disease part of a class name ("Tomato___Early_blight" -> "Early_blight"), or of a class id."""
+        if isinstance(name, (int, np.integer)):
+            return self.diseases[self.class_id(name)]
+        return name.split('___')[-1]
+
+    def treatment(self, name):
+        class_id = self.class_id(name)
+        if class_id == self.unknown_id:
+            return keyword_treatment(name.split('___')[-1])
+        return self.treatments[class_id]
+
+    def row(self, class_id):
+        """Everything known about one class id, as a dict."""
+        return {
+            "class_name": self.names[class_id] if class_id < self.unknown_id else None,
+            "crop": self.crops[class_id],
+            "disease": self.diseases[class_id],
+            "loss_pct": float(self.loss[class_id]),
+            "treatment": self.treatments[class_id],
+            "healthy": bool(self.healthy[class_id]),
+            "matched": bool(self.matched[class_id]),
+        }
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_class_metadata(names=None):
+    """
+    Process-wide ClassMetadata per class list (default: the PlantVillage
+    classes), so the vision and finance paths share one compiled table.
+    A model trained on exactly the PlantVillage classes gets the same table
+    as names=None.
+    """
+    if isinstance(names, dict):
+        names = [names[i] for i in range(len(names))]
+    key = tuple(names) if names is not None else tuple(PLANTVILLAGE_CLASSES)
+    with _cache_lock:
+        metadata = _cache.get(key)
+        if metadata is None:
+            metadata = _cache[key] = ClassMetadata(list(key))
+    return metadata
+
+
+if __name__ == "__main__":
+    metadata = get_class_metadata()
+    print(f"{len(metadata.names)} classes, {len(metadata.unmatched)} unmatched\n")
+    print(f"{'Id':>3}  {'Class':<52}{'Crop':<12}{'Loss':>6}")
+    for i, name in enumerate(metadata.names):
+        print(f"{i:>3}  {name:<52}{metadata.crops[i]:<12}{metadata.loss[i]*100:>5.0f}%")
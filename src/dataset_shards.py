@@ -0,0 +1,272 @@
+import argparse
+import inspect
+import io
+import json
+import mmap
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from inference_backend import resize_and_crop
+
+DATASET_DIR = "data/processed/dataset_yolo"
+SHARD_DIR = "data/processed/shards"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def list_split(dataset_dir, split):
+    """
+    Returns (classes, [(image_path, label), ...]) for one split of the folder layout.
+    """
+    split_dir = os.path.join(dataset_dir, split)
+    classes = sorted(d for d in os.listdir(split_dir) if os.path.isdir(os.path.join(split_dir, d)))
+    samples = []
+    for label, cls in enumerate(classes):
+        cls_dir = os.path.join(split_dir, cls)
+        samples.extend((os.path.join(cls_dir, f), label)
+                       for f in sorted(os.listdir(cls_dir)) if f.lower().endswith(IMAGE_EXTENSIONS))
+    return classes, samples
+
+
+def _encode_sample(path, imgsz, encoding, quality):
+    from PIL import Image
+
+    image = resize_and_crop(Image.open(path), imgsz)
+    if encoding == 'raw':
+        return np.asarray(image, dtype=np.uint8).tobytes()
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def write_shards(dataset_dir=DATASET_DIR, output_dir=SHARD_DIR, imgsz=224, encoding='raw',
+                 images_per_shard=8192, workers=8, quality=95, splits=('train', 'val')):
+    """
+    Packs the organized folder dataset into a few large shard files per split.
+
+    Every image is resized/center-cropped to imgsz once, then stored either as
+    raw uint8 HWC pixels ('raw', ~150KB per image at 224px, zero-copy reads)
+    or re-encoded as JPEG ('jpeg', ~10x smaller, decoded on read).
+    Each split gets `<split>-00000.bin`, ... plus `<split>-index.npz` holding
+    the shard id, byte offset, length and label of every sample.
+    Splits not rebuilt keep their entry in meta.json as long as they were
+    written with the same imgsz and encoding.
+    """
+    if encoding not in ('raw', 'jpeg'):
+        raise ValueError(f"Unknown encoding: {encoding}")
+    if not os.path.exists(dataset_dir):
+        raise FileNotFoundError("Run 'src/02_data_preprocessing.py' first!")
+
+    os.makedirs(output_dir, exist_ok=True)
+    meta = {"imgsz": imgsz, "encoding": encoding, "splits": {}}
+    meta_path = os.path.join(output_dir, "meta.json")
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            previous = json.load(f)
+        if (previous.get("imgsz"), previous.get("encoding")) == (imgsz, encoding):
+            meta["splits"].update(previous.get("splits", {}))
+        else:
+            print(f"[Warning] Existing shards are {previous.get('encoding')} at {previous.get('imgsz')}px; "
+                  f"splits other than {list(splits)} are dropped from meta.json")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for split in splits:
+            classes, samples = list_split(dataset_dir, split)
+            n = len(samples)
+            shard_ids = np.zeros(n, dtype=np.int32)
+            offsets = np.zeros(n, dtype=np.int64)
+            lengths = np.zeros(n, dtype=np.int64)
+            labels = np.array([label for _, label in samples], dtype=np.int32)
+
+            print(f"[Shards] {split}: {n} images -> {output_dir} ({encoding}, {imgsz}px)")
+            for shard_id, start in enumerate(range(0, n, images_per_shard)):
+                chunk = samples[start:start + images_per_shard]
+                shard_path = os.path.join(output_dir, f"{split}-{shard_id:05d}.bin")
+                offset = 0
+                with open(shard_path + ".tmp", 'wb') as f:
+                    # map() keeps the input order, so offsets line up with samples
+                    encoded = pool.map(lambda s: _encode_sample(s[0], imgsz, encoding, quality), chunk)
+                    for i, data in enumerate(encoded, start=start):
+                        f.write(data)
+                        shard_ids[i], offsets[i], lengths[i] = shard_id, offset, len(data)
+                        offset += len(data)
+                os.replace(shard_path + ".tmp", shard_path)
+                print(f"   wrote {shard_path} ({offset / 1e6:.1f} MB)")
+
+            index_path = os.path.join(output_dir, f"{split}-index.npz")
+            with open(index_path + ".tmp", 'wb') as f:
+                np.savez(f, shard=shard_ids, offset=offsets, length=lengths, label=labels)
+            os.replace(index_path + ".tmp", index_path)
+            meta["splits"][split] = {"classes": classes, "images": n,
+                                     "shards": int(shard_ids.max()) + 1 if n else 0}
+
+    # Readers only ever see a complete meta.json
+    with open(meta_path + ".tmp", 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(meta_path + ".tmp", meta_path)
+    print("[Success] Shards written.")
+    return meta
+
+
+class ShardDataset:
+    """
+    Random-access reader over the shard files, usable as a torch Dataset.
+
+    Shards are opened with mmap on first use; for 'raw' shards every sample is
+    a read-only (imgsz, imgsz, 3) uint8 view straight into the page cache, no
+    copy and no decode. Workers forked by a DataLoader reopen their own maps.
+    """
+
+    def __init__(self, shard_dir=SHARD_DIR, split='train', transform=None):
+        with open(os.path.join(shard_dir, "meta.json")) as f:
+            meta = json.load(f)
+
+        self.shard_dir = shard_dir
+        self.split = split
+        self.transform = transform
+        self.imgsz = meta["imgsz"]
+        self.encoding = meta["encoding"]
+        self.classes = meta["splits"][split]["classes"]
+
+        index = np.load(os.path.join(shard_dir, f"{split}-index.npz"))
+        self.shard_ids = index["shard"]
+        self.offsets = index["offset"]
+        self.lengths = index["length"]
+        self.labels = index["label"]
+        self._maps = {}
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _shard(self, shard_id):
+        mm = self._maps.get(shard_id)
+        if mm is None:
+            path = os.path.join(self.shard_dir, f"{self.split}-{shard_id:05d}.bin")
+            with open(path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[shard_id] = mm
+        return mm
+
+    def image(self, i):
+        """Sample `i` as an (imgsz, imgsz, 3) uint8 array, before any transform."""
+        mm = self._shard(int(self.shard_ids[i]))
+        offset, length = int(self.offsets[i]), int(self.lengths[i])
+
+        if self.encoding == 'raw':
+            image = np.frombuffer(mm, dtype=np.uint8, count=length, offset=offset)
+            image = image.reshape(self.imgsz, self.imgsz, 3)
+        else:
+            from PIL import Image
+            image = np.asarray(Image.open(io.BytesIO(memoryview(mm)[offset:offset + length])).convert('RGB'))
+        return image
+
+    def __getitem__(self, i):
+        image = self.image(i)
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, int(self.labels[i])
+
+    def __getstate__(self):
+        # mmap objects can't be pickled; each worker process maps its own
+        state = self.__dict__.copy()
+        state["_maps"] = {}
+        return state
+
+
+def _call_with_supported(fn, **kwargs):
+    # Ultralytics transform signatures differ between releases; pass what this one accepts
+    accepted = inspect.signature(fn).parameters
+    return fn(**{k: v for k, v in kwargs.items() if k in accepted})
+
+
+class ShardClassificationDataset(ShardDataset):
+    """
+    ShardDataset for the Ultralytics classification trainer: returns
+    {"img": tensor, "cls": label} samples with the same transforms as its
+    ClassificationDataset (augmentations from the train args when `augment`).
+    """
+
+    def __init__(self, shard_dir=SHARD_DIR, split='train', args=None, augment=False):
+        from ultralytics.data.augment import classify_augmentations, classify_transforms
+
+        if augment:
+            transform = _call_with_supported(
+                classify_augmentations, size=args.imgsz, scale=(1.0 - args.scale, 1.0), hflip=args.fliplr,
+                vflip=args.flipud, erasing=args.erasing, auto_augment=args.auto_augment,
+                hsv_h=args.hsv_h, hsv_s=args.hsv_s, hsv_v=args.hsv_v)
+        else:
+            transform = _call_with_supported(classify_transforms, size=args.imgsz,
+                                             crop_fraction=getattr(args, 'crop_fraction', 1.0))
+        super().__init__(shard_dir, split, transform)
+        # The trainer attaches the eval transforms to the exported model from here
+        self.torch_transforms = transform
+
+    def __getitem__(self, i):
+        from PIL import Image
+
+        return {"img": self.transform(Image.fromarray(self.image(i))), "cls": int(self.labels[i])}
+
+
+def benchmark(dataset_dir=DATASET_DIR, shard_dir=SHARD_DIR, split='train', limit=5000, seed=0):
+    """
+    Images/sec for reading the same random samples from the folder layout
+    (open + decode + resize, as the trainer does) and from the shards.
+    Every sample is converted to float32 in both paths so the work is comparable.
+    """
+    from PIL import Image
+
+    _, samples = list_split(dataset_dir, split)
+    dataset = ShardDataset(shard_dir, split)
+    if len(samples) != len(dataset):
+        raise ValueError("Shards are out of date with the folder dataset, rebuild them first.")
+
+    order = np.random.default_rng(seed).permutation(len(samples))[:limit]
+
+    start = time.perf_counter()
+    for i in order:
+        np.asarray(resize_and_crop(Image.open(samples[i][0]), dataset.imgsz)).astype(np.float32)
+    folder_rate = len(order) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in order:
+        dataset[i][0].astype(np.float32)
+    shard_rate = len(order) / (time.perf_counter() - start)
+
+    result = {
+        "split": split,
+        "images": int(len(order)),
+        "encoding": dataset.encoding,
+        "folder_images_per_sec": round(folder_rate, 1),
+        "shard_images_per_sec": round(shard_rate, 1),
+        "speedup": round(shard_rate / folder_rate, 2),
+    }
+    print(json.dumps(result, indent=2))
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack the leaf dataset into memory-mappable shards")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    build = sub.add_parser('build', help="Write shard files from the organized dataset")
+    build.add_argument('--dataset', default=DATASET_DIR)
+    build.add_argument('--output', default=SHARD_DIR)
+    build.add_argument('--imgsz', type=int, default=224)
+    build.add_argument('--encoding', choices=['raw', 'jpeg'], default='raw')
+    build.add_argument('--images-per-shard', type=int, default=8192)
+    build.add_argument('--workers', type=int, default=8)
+
+    bench = sub.add_parser('bench', help="Compare images/sec against the folder layout")
+    bench.add_argument('--dataset', default=DATASET_DIR)
+    bench.add_argument('--shards', default=SHARD_DIR)
+    bench.add_argument('--split', default='train')
+    bench.add_argument('--limit', type=int, default=5000)
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        write_shards(args.dataset, args.output, imgsz=args.imgsz, encoding=args.encoding,
+                     images_per_shard=args.images_per_shard, workers=args.workers)
+    else:
+        benchmark(args.dataset, args.shards, split=args.split, limit=args.limit)
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_fingerprints = {}
+
+
+def weights_fingerprint(model_path):
+    """
+    SHA-256 of the model weights file. Memoized per (path, size, mtime) so the
+    file is only re-hashed after it changed.
+    """
+    st = os.stat(model_path)
+    key = (os.path.abspath(model_path), st.st_size, st.st_mtime_ns)
+    if key not in _fingerprints:
+        digest = hashlib.sha256()
+        with open(model_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        _fingerprints[key] = digest.hexdigest()
+    return _fingerprints[key]
+
+
+def image_hash(image):
+    """
+    Content hash of the *decoded* pixels, so the same photo re-saved with
+    different metadata or container still hits. Accepts bytes or a PIL image.
+    """
+    from inference_backend import decode_image
+
+    image = decode_image(image)
+    digest = hashlib.sha256(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class DiagnosisCache:
+    """
+    Two-tier cache of diagnosis results keyed by image hash.
+
+    Tier 1 is a bounded in-memory LRU; tier 2 is an optional SQLite file shared
+    across restarts and processes. Rows are keyed by image hash, weights
+    fingerprint and `config` (settings that change the result, e.g. cascade
+    thresholds or tiled mode), so every model and mode keeps its own entries
+    and new weights simply never match old rows. Nothing is purged on open;
+    instead the file holds at most `max_rows` rows, least recently used ones
+    go first.
+    """
+
+    # How many puts between two size checks of the SQLite file
+    EVICT_EVERY = 256
+
+    def __init__(self, fingerprint, capacity=1024, db_path=None, config="", max_rows=100000):
+        self.fingerprint = fingerprint
+        self.config = config
+        self.capacity = capacity
+        self.max_rows = max_rows
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            # Layout before the config column (purged on open); it is only a cache
+            self._db.execute("DROP TABLE IF EXISTS diagnoses")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS diagnosis_results (
+                    image_hash TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    config TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    used REAL NOT NULL,
+                    PRIMARY KEY (image_hash, fingerprint, config)
+                )""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS diagnosis_results_used ON diagnosis_results (used)")
+            self._db.commit()
+
+    def get(self, key):
+        """Cached result dict for an image hash, or None."""
+        with self._lock:
+            result = self._lru.get(key)
+            if result is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return result
+
+            if self._db is not None:
+                where = "image_hash = ? AND fingerprint = ? AND config = ?"
+                params = (key, self.fingerprint, self.config)
+                row = self._db.execute(f"SELECT result FROM diagnosis_results WHERE {where}", params).fetchone()
+                if row is not None:
+                    self._db.execute(f"UPDATE diagnosis_results SET used = ? WHERE {where}", (time.time(), *params))
+                    self._db.commit()
+                    result = json.loads(row[0])
+                    self._remember(key, result)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return result
+
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        with self._lock:
+            self._remember(key, result)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO diagnosis_results VALUES (?, ?, ?, ?, ?)",
+                                 (key, self.fingerprint, self.config, json.dumps(result), time.time()))
+                self._puts += 1
+                if self._puts % self.EVICT_EVERY == 0:
+                    self._evict()
+                self._db.commit()
+
+    def _evict(self):
+        # Least recently used rows beyond max_rows, whatever model or mode wrote them
+        excess = self._db.execute("SELECT COUNT(*) FROM diagnosis_results").fetchone()[0] - self.max_rows
+        if excess > 0:
+            self._db.execute("DELETE FROM diagnosis_results WHERE rowid IN "
+                             "(SELECT rowid FROM diagnosis_results ORDER BY used LIMIT ?)", (excess,))
+
+    def _remember(self, key, result):
+        self._lru[key] = result
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.capacity:
+            self._lru.popitem(last=False)
+
+    def get_or_compute(self, image, diagnose):
+        """
+        Returns (result, hit). The image (bytes or PIL) is decoded once: the
+        RGB pixels are hashed and, on a miss, passed to `diagnose(image)`,
+        whose result (class_name, confidence, topk) is stored.
+        """
+        from inference_backend import decode_image
+
+        image = decode_image(image)
+        key = image_hash(image)
+        result = self.get(key)
+        if result is not None:
+            return result, True
+        result = diagnose(image)
+        self.put(key, result)
+        return result, False
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries_in_memory": len(self._lru),
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
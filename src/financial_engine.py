@@ -1,70 +1,61 @@
 import pandas as pd
 import numpy as np
 import os
+import threading
+
+import instrumentation
+from class_metadata import get_class_metadata
+from yield_store import (YieldIndex, add_ingested, default_ingest_path, find_yield_file, iter_yield_chunks,
+                         load_ingested, load_yield_store, read_yield_csv)
+
 
 class FinancialEngine:
-    def __init__(self):
+    # Hardcoded safe defaults if a crop is totally missing from the CSV (Ton/Ha)
+    DEFAULT_YIELDS = {'Rice': 4.0, 'Wheat': 3.5, 'Maize': 3.0}
+    DEFAULT_YIELD = 5.0
+    # Relative spread assumed for those defaults (no history to measure it from)
+    DEFAULT_YIELD_CV = 0.25
+
+    def __init__(self, data_dir="data/raw/financial", cache_path=None, use_cache=True, yield_index=None,
+                 class_metadata=None, ingest_path=None):
         # 1. Load the Historical Yield Data (Government Data)
-        data_dir = "data/raw/financial"
-        if not os.path.exists(data_dir):
-            raise FileNotFoundError(f"Directory not found: {data_dir}")
+        # Only State, Crop and Yield are ever used. They come from a compact
+        # compiled cache (see yield_store.py) that is rebuilt whenever the
+        # source CSV changes, so most inits skip CSV parsing entirely.
+        # A prebuilt `yield_index` (e.g. attached from shared memory, see
+        # shared_resources.py) skips loading altogether; `self.df` is then None.
+        # Records added with ingest() are saved next to the cache and merged
+        # back in here (not for prebuilt indexes: their owner loads them).
+        self.ingest_path = None
+        self.yield_source = None
+        if yield_index is not None:
+            print("[Init] Using prebuilt yield aggregates")
+            self.df, self.yield_index = None, yield_index
+        else:
+            file_path = find_yield_file(data_dir)
+            print(f"[Init] Loading Financial Context from: {os.path.basename(file_path)}")
 
-        files = [f for f in os.listdir(data_dir) if f.endswith('.csv')]
-        
-        # --- FIX: SMART FILE SELECTION ---
-        # We look for the file that actually contains yield data, not just the first one.
-        yield_file = None
-        for f in files:
-            if 'yield' in f.lower():
-                yield_file = f
-                break
-        
-        # Fallback: If no file has 'yield' in name, try one with 'crop'
-        if not yield_file:
-            for f in files:
-                if 'crop' in f.lower() and 'price' not in f.lower():
-                    yield_file = f
-                    break
-        
-        if not yield_file:
-            raise FileNotFoundError(f"Could not find a Yield dataset in {data_dir}. Found: {files}")
+            if use_cache:
+                self.df, self.yield_index = load_yield_store(file_path, cache_path)
+            else:
+                self.df = read_yield_csv(file_path)
+                # Aggregate once so lookups don't rescan the whole DataFrame per report
+                self.yield_index = YieldIndex.from_frame(self.df)
 
-        file_path = os.path.join(data_dir, yield_file)
-        print(f"[Init] Loading Financial Context from: {yield_file}")
-        
-        self.df = pd.read_csv(file_path)
-        
-        # Clean column names (strip spaces, remove special chars)
-        self.df.columns = [c.strip().replace(' ', '_').replace(':', '') for c in self.df.columns]
-        
-        # Standardize State/Crop columns if they have weird names
-        # Some datasets use "State_Name", others "State"
-        for col in self.df.columns:
-            if 'state' in col.lower():
-                self.df.rename(columns={col: 'State'}, inplace=True)
-            if 'crop' in col.lower() and 'year' not in col.lower():
-                self.df.rename(columns={col: 'Crop'}, inplace=True)
-            if 'yield' in col.lower():
-                self.df.rename(columns={col: 'Yield'}, inplace=True)
-
-        # 2. Define Disease Impact Table (The "Risk Logic")
-        self.impact_db = {
-            'Healthy': 0.0,
-            'Early_blight': 0.20,  # 20% Yield Loss
-            'Late_blight': 0.40,   # 40% Yield Loss
-            'Leaf_mold': 0.15,
-            'Septoria_leaf_spot': 0.15,
-            'Spider_mites': 0.10,
-            'Target_Spot': 0.25,
-            'Mosaic_virus': 0.50,  # Severe
-            'Yellow_Leaf_Curl_Virus': 0.60,
-            'Bacterial_spot': 0.30,
-            'Common_rust': 0.25,
-            'Northern_Leaf_Blight': 0.35,
-            'Black_rot': 0.30,
-            'Esca_(Black_Measles)': 0.40,
-            'Leaf_scorch': 0.20
-        }
+            self.yield_source = file_path
+            self.ingest_path = ingest_path or default_ingest_path(file_path)
+            ingested = load_ingested(self.ingest_path, file_path)
+            if ingested is not None:
+                print(f"[Init] Merging {int(ingested.pair_count.sum())} ingested yield records")
+                self.yield_index = self.yield_index.merge(ingested)
+        # Serializes ingest() calls; readers never lock (see ingest)
+        self._ingest_lock = threading.Lock()
+        self.ingested_rows = 0
+
+        # 2. Disease Impact Table (The "Risk Logic"): loss % per model class,
+        # compiled once and shared with the app's treatment lookup (see class_metadata.py).
+        # Pass the classifier's table (get_class_metadata(model.names)) so class ids line up.
+        self.class_metadata = class_metadata if class_metadata is not None else get_class_metadata()
 
         # Market Prices (Estimated INR per Quintal)
         self.market_prices = {
@@ -76,35 +67,126 @@ class FinancialEngine:
             'Cotton': 6000
         }
 
+    @instrumentation.timed("yield_lookup")
     def get_historical_yield(self, state, crop):
         """
         Fetches the average historical yield for a specific State & Crop.
+
+        Served from the precomputed YieldIndex. A partial name (e.g. "Pradesh")
+        still pools every State/Crop it matches, exactly like the old row-wise
+        str.contains() scan; the only difference is floating point summation
+        order (per-pair sums instead of one pass over the rows).
         """
+        return self._historical_yield(self.yield_index, state, crop)
+
+    def _historical_yield(self, index, state, crop):
         state = state.title().strip()
         crop = crop.title().strip()
-        
-        # Filter data (Case insensitive matching)
-        # We use strict 'State' column now since we renamed it in __init__
-        subset = self.df[
-            (self.df['State'].str.contains(state, case=False, na=False)) & 
-            (self.df['Crop'].str.contains(crop, case=False, na=False))
-        ]
-        
-        if subset.empty:
-            # Fallback 1: Try finding the crop in ANY state (National Avg)
-            subset_national = self.df[self.df['Crop'].str.contains(crop, case=False, na=False)]
-            if not subset_national.empty:
-                return subset_national['Yield'].mean()
-            
-            # Fallback 2: Hardcoded safe defaults if crop is totally missing from CSV
-            defaults = {'Rice': 4.0, 'Wheat': 3.5, 'Maize': 3.0}
-            return defaults.get(crop, 5.0)
-            
-        return subset['Yield'].mean()
-
-    def calculate_risk_profile(self, state, crop, disease_class, land_area_acres):
+
+        avg_yield = index.lookup(state, crop)
+        if avg_yield is None:
+            # Crop is totally missing from the CSV
+            return self.DEFAULT_YIELDS.get(crop, self.DEFAULT_YIELD)
+
+        return avg_yield
+
+    def ingest(self, rows, chunksize=100000, persist=True):
+        """
+        Adds new yield records without reloading the dataset.
+
+        `rows` is a DataFrame, a CSV path / file object (read in `chunksize`
+        row chunks), or any iterable of DataFrames; raw dataset headers are
+        mapped like at load time. Each chunk is reduced to per-(State, Crop)
+        sums/counts, merged, and the result merged into a copy of the current
+        index, which then replaces it in a single attribute assignment:
+        concurrent readers see either the old or the new aggregates, never a
+        mix, and a failing chunk leaves the engine untouched. Only aggregates
+        are kept, so memory is bounded by the number of State/Crop pairs;
+        `self.df` is not updated (it is the load-time snapshot, or None for an
+        engine built on a prebuilt index).
+
+        With `persist`, the new aggregates are merged into `self.ingest_path`
+        (under a file lock, so concurrent engines add up) before the swap, and
+        later engines on the same CSV load them back. That file belongs to the
+        CSV content: once the CSV changes (e.g. the records were appended to
+        it) it is set aside instead of being counted twice; delete it to drop
+        ingested records by hand (see yield_store.load_ingested). Records
+        other processes ingest show up here after a restart. Engines on a
+        prebuilt (e.g. shared) index have no ingest_path: their records are
+        only kept in memory. Returns the number of rows ingested.
+        """
+        with self._ingest_lock:
+            added = None
+            n_rows = 0
+            for chunk in iter_yield_chunks(rows, chunksize):
+                aggregates = YieldIndex.from_frame(chunk)
+                added = aggregates if added is None else added.merge(aggregates)
+                n_rows += len(chunk)
+            if added is None:
+                return 0
+
+            if persist and self.ingest_path:
+                add_ingested(added, self.ingest_path, self.yield_source)
+            self.yield_index = self.yield_index.merge(added)
+            self.ingested_rows += n_rows
+        return n_rows
+
+    @instrumentation.timed("disease_loss")
+    def resolve_disease_loss(self, disease_class):
+        """
+        Maps a model class name (e.g. "Tomato___Early_blight") or integer
+        class id to the disease name and its expected yield loss fraction.
+        Bare disease names (e.g. "Early_blight") resolve too; unknown names
+        lose 10% (0% if "healthy").
+        """
+        disease_name = self.class_metadata.disease(disease_class)
+        loss_pct = float(self.class_metadata.loss[self.class_metadata.class_id(disease_class)])
+
+        return disease_name, loss_pct
+
+    def distribution_loss(self, disease_distribution):
+        """
+        Severity-weighted yield loss fraction of a disease distribution: the
+        expected loss under {class name or id: probability} (e.g. the tile-averaged
+        probabilities of a multi-leaf photo), renormalized to sum to 1.
+        """
+        names = list(disease_distribution)
+        weights = np.array([disease_distribution[n] for n in names], dtype=np.float64)
+        if weights.sum() <= 0:
+            raise ValueError("disease_distribution has no probability mass")
+        losses = self.class_metadata.loss[self.class_metadata.class_ids(names)]
+        return float(weights @ losses / weights.sum())
+
+    @staticmethod
+    def credit_score(loss_pct):
+        """Agri-Credit Score (20-100) for a given yield loss fraction."""
+        return max(min(round(100 - (loss_pct * 100 * 1.2)), 100), 20)
+
+    def get_yield_spread(self, state, crop):
+        """
+        (mean, std) of the historical yield for a State & Crop, resolved the
+        same way as get_historical_yield. Used by the risk simulation.
+        """
+        state = state.title().strip()
+        crop = crop.title().strip()
+
+        spread = self.yield_index.spread(state, crop)
+        if spread is None:
+            mean = self.DEFAULT_YIELDS.get(crop, self.DEFAULT_YIELD)
+            return mean, mean * self.DEFAULT_YIELD_CV
+
+        return spread
+
+    @instrumentation.timed("risk_profile")
+    def calculate_risk_profile(self, state, crop, disease_class, land_area_acres, disease_distribution=None):
         """
         The Core Algo: Combines Vision Diagnosis + Financial Data -> Credit Score
+
+        `disease_class` is a model class name or the classifier's integer class id.
+
+        With a `disease_distribution` ({class name: probability}, e.g. from
+        tiled_inference.diagnose_tiles) the yield loss is its severity-weighted
+        expectation instead of the loss of the single `disease_class` label.
         """
         # 1. Get Baseline Metrics
         hectares = land_area_acres * 0.404686
@@ -116,24 +198,16 @@ class FinancialEngine:
         potential_revenue = expected_total_production * market_price
 
         # 2. Apply Disease Penalty
-        disease_name = disease_class.split('___')[-1] if '___' in disease_class else disease_class
-        loss_pct = self.impact_db.get(disease_name, 0.10)
-        
-        if 'healthy' in disease_name.lower():
-            loss_pct = 0.0
+        disease_name, loss_pct = self.resolve_disease_loss(disease_class)
+        if disease_distribution:
+            loss_pct = self.distribution_loss(disease_distribution)
 
         adjusted_yield = expected_total_production * (1 - loss_pct)
         actual_revenue = potential_revenue * (1 - loss_pct)
         revenue_at_risk = potential_revenue - actual_revenue
 
         # 3. Calculate "Agri-Credit Score" (0-100)
-        score = 100
-        score -= (loss_pct * 100) * 1.5 
-        
-        if avg_yield_per_ha > 5: 
-            score += 5
-            
-        final_score = max(min(round(100 - (loss_pct * 100 * 1.2)), 100), 20)
+        final_score = self.credit_score(loss_pct)
 
         return {
             "State": state,
@@ -147,6 +221,114 @@ class FinancialEngine:
             "Recommendation": "Approve Loan" if final_score > 70 else "Reject / Require Insurance"
         }
 
+    # Input columns expected by calculate_risk_profile_batch
+    BATCH_COLUMNS = ['state', 'crop', 'disease_class', 'land_area_acres']
+
+    @classmethod
+    def factorize_applications(cls, applications):
+        """
+        (codes, unique values) of the state, crop and disease_class columns of
+        an applications DataFrame, the uniques as plain lists (per-element
+        access to pandas indexes is slow). Missing BATCH_COLUMNS raise
+        KeyError, missing values ValueError.
+        """
+        missing = [c for c in cls.BATCH_COLUMNS if c not in applications.columns]
+        if missing:
+            raise KeyError(f"Missing columns for batch scoring: {missing}")
+
+        factorized = [pd.factorize(applications[c]) for c in ('state', 'crop', 'disease_class')]
+        # factorize() codes missing values as -1, which would silently index the last state/crop/class
+        missing_rows = np.logical_or.reduce([codes < 0 for codes, _ in factorized])
+        if missing_rows.any():
+            raise ValueError(f"{int(missing_rows.sum())} application(s) without state/crop/disease_class, "
+                             f"e.g. rows {applications.index[missing_rows][:5].tolist()}")
+        return [(codes, uniques.tolist()) for codes, uniques in factorized]
+
+    @instrumentation.timed("risk_profile_batch")
+    def calculate_risk_profile_batch(self, applications):
+        """
+        Vectorized calculate_risk_profile for a whole loan portfolio.
+
+        `applications` is a DataFrame (or pyarrow Table) with the BATCH_COLUMNS;
+        disease_class holds class names or integer class ids.
+        Returns a DataFrame with the same fields as calculate_risk_profile, one
+        row per application, row for row identical to the scalar path. Missing
+        state / crop / disease_class values raise ValueError (the scalar path
+        can't score them either).
+        Yields, losses and scores are resolved once per unique value and
+        broadcast; everything per-row is plain NumPy column math.
+        """
+        if hasattr(applications, 'to_pandas'):
+            applications = applications.to_pandas()
+
+        (state_codes, states), (crop_codes, crops), (disease_codes, diseases) = self.factorize_applications(
+            applications)
+        acres = applications['land_area_acres'].to_numpy(dtype=np.float64)
+
+        # 1. Baseline Metrics (yield resolved once per unique State/Crop pair)
+        hectares = acres * 0.404686
+
+        # One index snapshot for the whole batch, even if an ingest() lands meanwhile
+        index = self.yield_index
+        pair_codes, pairs = pd.factorize(state_codes * len(crops) + crop_codes)
+        pair_yields = np.array([self._historical_yield(index, states[p // len(crops)], crops[p % len(crops)])
+                                for p in pairs], dtype=np.float64)
+        avg_yield_per_ha = pair_yields[pair_codes]
+        expected_total_production = avg_yield_per_ha * hectares
+
+        crop_prices = np.array([self.market_prices.get(c, 2000) for c in crops], dtype=np.float64)
+        market_price = crop_prices[crop_codes]
+        potential_revenue = expected_total_production * market_price
+
+        # 2. Disease Penalty (unique class names joined to the class metadata table by id)
+        losses = self.class_metadata.loss[self.class_metadata.class_ids(diseases)]
+        disease_names = [self.class_metadata.disease(d) for d in diseases]
+        loss_pct = losses[disease_codes]
+
+        actual_revenue = potential_revenue * (1 - loss_pct)
+        revenue_at_risk = potential_revenue - actual_revenue
+
+        # 3. Credit Score (a function of the loss only)
+        scores = np.array([self.credit_score(loss) for loss in losses.tolist()], dtype=np.int64)
+        final_score = scores[disease_codes]
+
+        # Text columns stay dictionary-encoded (Categorical) so large
+        # portfolios never materialize one Python string per row.
+        return pd.DataFrame({
+            "State": _categorical(state_codes, states),
+            "Crop": _categorical(crop_codes, crops),
+            "Disease_Detected": _categorical(disease_codes, disease_names),
+            "Historical_Yield_Ton_Ha": np.array([round(y, 2) for y in pair_yields.tolist()])[pair_codes],
+            "Yield_Loss_Pct": _categorical(disease_codes, [f"{loss*100:.1f}%" for loss in losses.tolist()]),
+            "Projected_Revenue_INR": _round_like_builtin(actual_revenue, 2),
+            "Revenue_at_Risk_INR": _round_like_builtin(revenue_at_risk, 2),
+            "Credit_Eligibility_Score": final_score,
+            "Recommendation": _categorical((final_score > 70).astype(np.int8),
+                                           ["Reject / Require Insurance", "Approve Loan"]),
+        }, index=applications.index)
+
+
+def _categorical(codes, labels):
+    """Per-row Categorical from codes into a (possibly repeating) label list."""
+    categories, label_codes = np.unique(np.asarray(labels, dtype=object), return_inverse=True)
+    return pd.Categorical.from_codes(label_codes[codes], categories=categories)
+
+
+def _round_like_builtin(values, ndigits):
+    """
+    np.round() that agrees with Python's round() bit for bit.
+
+    np.round scales by 10**ndigits before rounding, which can land on the
+    other side of a half-way point than the correctly rounded builtin; those
+    (rare) near-ties are recomputed with round().
+    """
+    rounded = np.round(values, ndigits)
+    scaled = values * 10 ** ndigits
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_tie.any():
+        rounded[near_tie] = [round(v, ndigits) for v in values[near_tie].tolist()]
+    return rounded
+
 if __name__ == "__main__":
     engine = FinancialEngine()
     
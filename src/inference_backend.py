@@ -0,0 +1,168 @@
+import ast
+import io
+import os
+
+import numpy as np
+
+import instrumentation
+
+# Model locations live in a dependency-free module so the app can read them without importing numpy
+from model_paths import DEFAULT_INT8_PATH, DEFAULT_MODEL_PATH, DEFAULT_ONNX_PATH
+
+
+def decode_image(data):
+    """
+    Decodes raw image bytes (or passes through a PIL image) as an RGB image.
+    An RGB PIL image is returned as is, so decoding it again costs nothing.
+    """
+    from PIL import Image
+
+    if isinstance(data, Image.Image):
+        image = data
+    else:
+        image = Image.open(io.BytesIO(data))
+    return image if image.mode == 'RGB' else image.convert('RGB')
+
+
+def resize_and_crop(image, imgsz=224):
+    """
+    Resizes the short side to `imgsz` (bilinear) and center crops to
+    imgsz x imgsz, like the Ultralytics classification transform.
+    Returns an RGB PIL image.
+    """
+    from PIL import Image
+
+    image = decode_image(image)
+    w, h = image.size
+    if w <= h:
+        new_w, new_h = imgsz, int(imgsz * h / w)
+    else:
+        new_w, new_h = int(imgsz * w / h), imgsz
+    image = image.resize((new_w, new_h), Image.BILINEAR)
+
+    top = int(round((new_h - imgsz) / 2.0))
+    left = int(round((new_w - imgsz) / 2.0))
+    return image.crop((left, top, left + imgsz, top + imgsz))
+
+
+def preprocess(image, imgsz=224):
+    """
+    Pure NumPy model input: resize_and_crop, HWC -> CHW, scale to [0, 1].
+    Returns a (3, imgsz, imgsz) float32 array.
+    """
+    pixels = np.asarray(resize_and_crop(image, imgsz), dtype=np.uint8)
+    return np.ascontiguousarray(pixels.transpose(2, 0, 1), dtype=np.float32) / 255.0
+
+
+def topk(probs, names, k=5):
+    """
+    Returns the k most likely (class_name, confidence) pairs of one probability vector.
+    """
+    k = max(1, min(k, len(probs)))
+    order = np.argsort(probs)[::-1][:k]
+    return [(names[i], float(probs[i])) for i in order]
+
+
+class UltralyticsBackend:
+    """
+    Classifier backed by the Ultralytics YOLO runtime (PyTorch `best.pt`, or
+    any format YOLO() can load such as the exported `best.onnx`).
+    """
+
+    def __init__(self, model_path=DEFAULT_MODEL_PATH):
+        from ultralytics import YOLO
+
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model not found: {model_path}")
+
+        self.model_path = model_path
+        self.model = YOLO(model_path)
+        self.names = [self.model.names[i] for i in range(len(self.model.names))]
+        # Training imgsz is kept in the checkpoint args
+        imgsz = self.model.overrides.get('imgsz', 224)
+        self.imgsz = imgsz[0] if isinstance(imgsz, (list, tuple)) else imgsz
+
+    def predict_proba(self, images):
+        """
+        Classifies a list of images in one forward pass.
+        Returns an (N, num_classes) float32 array of class probabilities.
+        """
+        with instrumentation.stage("decode"):
+            images = [decode_image(img) for img in images]
+        # Ultralytics resizes/normalizes inside the call, so "model" includes its preprocessing
+        with instrumentation.stage("model", backend="ultralytics"):
+            results = self.model(images, verbose=False)
+        with instrumentation.stage("postprocess"):
+            return np.stack([r.probs.data.cpu().numpy() for r in results]).astype(np.float32)
+
+
+class OnnxBackend:
+    """
+    Classifier backed by ONNX Runtime on the CPU (no torch import).
+    Works with the exported `best.onnx` as well as its INT8-quantized copy.
+    """
+
+    def __init__(self, model_path=DEFAULT_ONNX_PATH, threads=None, session=None):
+        import onnxruntime as ort
+
+        self.model_path = model_path
+        if session is None:
+            if not os.path.exists(model_path):
+                raise FileNotFoundError(f"Model not found: {model_path}")
+
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if threads:
+                options.intra_op_num_threads = threads
+            session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        # A prebuilt `session` (e.g. over shared-memory weights) is used as is
+        self.session = session
+
+        # Ultralytics stores names/imgsz as Python literals in the model metadata
+        metadata = self.session.get_modelmeta().custom_metadata_map
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, height, _ = model_input.shape
+        # Static exports only accept their fixed batch size (usually 1)
+        self.fixed_batch = batch if isinstance(batch, int) else None
+        if isinstance(height, int):
+            self.imgsz = height
+        else:
+            self.imgsz = ast.literal_eval(metadata.get('imgsz', '[224, 224]'))[0]
+
+        if 'names' not in metadata:
+            raise ValueError(f"{model_path} has no 'names' metadata. Export it with Ultralytics.")
+        names = ast.literal_eval(metadata['names'])
+        self.names = [names[i] for i in range(len(names))]
+
+    def predict_proba(self, images):
+        """
+        Classifies a list of images. Returns an (N, num_classes) float32 array.
+        """
+        with instrumentation.stage("preprocess"):
+            batch = np.stack([preprocess(img, self.imgsz) for img in images])
+        step = self.fixed_batch or len(batch)
+        with instrumentation.stage("model", backend="onnx"):
+            outputs = [self.session.run(None, {self.input_name: batch[i:i + step]})[0]
+                       for i in range(0, len(batch), step)]
+        return np.concatenate(outputs).astype(np.float32)
+
+
+# Backends selectable by name (e.g. from the Streamlit sidebar)
+BACKENDS = {
+    'ultralytics': UltralyticsBackend,
+    'onnx': OnnxBackend,
+}
+
+
+def load_backend(model_path=DEFAULT_MODEL_PATH, backend=None):
+    """
+    Loads the classifier backend for a model file. Without an explicit
+    `backend`, .onnx files go to ONNX Runtime and everything else to Ultralytics.
+    """
+    if backend is None:
+        backend = 'onnx' if model_path.endswith('.onnx') else 'ultralytics'
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'. Choose from: {list(BACKENDS)}")
+    return BACKENDS[backend](model_path)
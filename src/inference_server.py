@@ -0,0 +1,329 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import instrumentation
+from inference_backend import DEFAULT_MODEL_PATH, load_backend, topk
+
+
+class MicroBatcher:
+    """
+    Collects single items into micro-batches.
+
+    A batch is flushed as soon as it holds `max_batch` items or the oldest
+    item has waited `max_wait_ms`. `dispatch(items)` must return a Future
+    resolving to one result per item, so several batches can be in flight.
+    If a batch fails, its items are retried one by one so only the bad
+    item's Future gets the exception.
+    """
+
+    def __init__(self, dispatch, max_batch=16, max_wait_ms=10, max_pending=1024):
+        self.dispatch = dispatch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self.batches = 0
+        self.items = 0
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item, block=True, timeout=None):
+        """
+        Queues one item and returns a Future for its result.
+        Raises queue.Full when the pending queue is full (backpressure).
+        """
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        future = Future()
+        self._queue.put((item, future), block=block, timeout=timeout)
+        return future
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    self._queue.put(None)
+                    break
+                batch.append(entry)
+            self._flush(batch)
+
+    def _flush(self, batch):
+        # Drop what callers already cancelled (client went away); the rest can't be cancelled from here on
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        self.batches += 1
+        self.items += len(batch)
+        self._dispatch([item for item, _ in batch], [future for _, future in batch])
+
+    def _dispatch(self, items, futures):
+        try:
+            result = self.dispatch(items)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        def _resolve(done):
+            try:
+                outputs = done.result()
+            except Exception as e:
+                if len(items) > 1:
+                    # One bad item (e.g. an undecodable upload) shouldn't fail the rest: retry them one by one
+                    for item, future in zip(items, futures):
+                        self._dispatch([item], [future])
+                    return
+                futures[0].set_exception(e)
+                return
+            for future, output in zip(futures, outputs):
+                future.set_result(output)
+
+        result.add_done_callback(_resolve)
+
+
+# --- Worker process side ---
+_worker_backend = None
+
+
+def _init_worker(model_path, threads_per_worker, shared=None, metrics=False):
+    global _worker_backend
+    # Follow the parent's switch (it may have been flipped with instrumentation.enable())
+    instrumentation.enable(metrics)
+    # Keep each worker to its own slice of the CPU instead of every process
+    # spinning up one thread per core.
+    os.environ['OMP_NUM_THREADS'] = str(threads_per_worker)
+    try:
+        import torch
+        torch.set_num_threads(threads_per_worker)
+    except ImportError:
+        pass
+    if shared:
+        # Weights published by shared_resources.py: every worker maps the same pages
+        from shared_resources import load_classifier
+        _worker_backend = load_classifier(model_path, shared=shared, threads=threads_per_worker)
+    else:
+        _worker_backend = load_backend(model_path)
+
+
+def _worker_predict(images):
+    # Stage metrics recorded here live in this process: hand them back with the result
+    probs = _worker_backend.predict_proba(images)
+    return probs, instrumentation.REGISTRY.drain() if instrumentation.ENABLED else None
+
+
+def _worker_names():
+    return _worker_backend.names
+
+
+class InferenceService:
+    """
+    Micro-batched classifier running on a pool of CPU worker processes.
+    Stage metrics the workers record are merged into this process's registry
+    as each batch comes back, so /metrics covers the whole pipeline.
+    """
+
+    def __init__(self, model_path=DEFAULT_MODEL_PATH, workers=2, threads_per_worker=1,
+                 max_batch=16, max_wait_ms=10, max_pending=1024, shared=None):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model not found: {model_path}")
+
+        self.model_path = model_path
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                        initargs=(model_path, threads_per_worker, shared, instrumentation.ENABLED))
+        self.names = self.pool.submit(_worker_names).result()
+        self.batcher = MicroBatcher(self._submit, max_batch=max_batch, max_wait_ms=max_wait_ms,
+                                    max_pending=max_pending)
+        self.timeouts = 0
+
+    def _submit(self, images):
+        result = Future()
+
+        def _unpack(done):
+            try:
+                probs, metrics = done.result()
+            except Exception as e:
+                result.set_exception(e)
+                return
+            if metrics:
+                instrumentation.REGISTRY.merge(metrics)
+            result.set_result(probs)
+
+        self.pool.submit(_worker_predict, images).add_done_callback(_unpack)
+        return result
+
+    def predict_proba(self, image_bytes, timeout=None):
+        """
+        Class probabilities for one encoded image (blocks until its batch ran).
+        After `timeout` seconds the request is cancelled, so a batch that
+        hasn't started yet skips it, and concurrent.futures.TimeoutError raised.
+        """
+        future = self.batcher.submit(image_bytes, block=False)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            future.cancel()
+            self.timeouts += 1
+            raise
+
+    def predict(self, image_bytes, k=5, timeout=None):
+        """Top-k (class_name, confidence) pairs for one encoded image."""
+        return topk(self.predict_proba(image_bytes, timeout=timeout), self.names, k)
+
+    def stats(self):
+        return {
+            "batches": self.batcher.batches,
+            "images": self.batcher.items,
+            "avg_batch_size": round(self.batcher.items / self.batcher.batches, 2) if self.batcher.batches else 0.0,
+            "pending": self.batcher.pending(),
+            "timeouts": self.timeouts,
+        }
+
+    def close(self):
+        self.batcher.close()
+        self.pool.shutdown()
+
+
+# --- HTTP API ---
+def make_handler(service, request_timeout=30.0):
+    class InferenceHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = urllib.parse.urlparse(self.path).path
+            if path == '/metrics':
+                # Stage histograms of the workers, Prometheus text (empty unless AGRIGUARD_METRICS=1)
+                body = instrumentation.export_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if path != '/health':
+                return self._send_json(404, {"error": "not found"})
+            self._send_json(200, {"status": "ok", "classes": len(service.names), **service.stats()})
+
+        def do_POST(self):
+            url = urllib.parse.urlparse(self.path)
+            if url.path != '/predict':
+                return self._send_json(404, {"error": "not found"})
+
+            # Read the body even when rejecting the request, so the client isn't cut off mid-upload
+            image_bytes = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            params = urllib.parse.parse_qs(url.query)
+            try:
+                k = int(params.get('topk', ['5'])[0])
+            except ValueError:
+                return self._send_json(400, {"error": "topk must be an integer"})
+            if not 1 <= k <= len(service.names):
+                return self._send_json(400, {"error": f"topk must be between 1 and {len(service.names)}"})
+            if not image_bytes:
+                return self._send_json(400, {"error": "empty request body, POST the raw image bytes"})
+
+            start = time.perf_counter()
+            try:
+                predictions = service.predict(image_bytes, k=k, timeout=request_timeout)
+            except queue.Full:
+                return self._send_json(503, {"error": "inference queue full, retry later"})
+            except FutureTimeout:
+                return self._send_json(504, {"error": "inference timed out"})
+            except Exception as e:
+                return self._send_json(500, {"error": str(e)})
+
+            self._send_json(200, {
+                "predictions": [{"class": name, "confidence": conf} for name, conf in predictions],
+                "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return InferenceHandler
+
+
+def serve(service, host='127.0.0.1', port=8765):
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    print(f"[Inference] Serving {service.model_path} on http://{host}:{port} "
+          f"(POST /predict, GET /health, GET /metrics)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+class InferenceClient:
+    """
+    Minimal client for the inference worker, used by the Streamlit app and batch jobs.
+    """
+
+    def __init__(self, base_url='http://127.0.0.1:8765', timeout=30.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def predict(self, image_bytes, k=5):
+        request = urllib.request.Request(f"{self.base_url}/predict?topk={k}", data=image_bytes,
+                                         headers={'Content-Type': 'application/octet-stream'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            payload = json.load(response)
+        return [(p['class'], p['confidence']) for p in payload['predictions']]
+
+    def health(self):
+        with urllib.request.urlopen(f"{self.base_url}/health", timeout=self.timeout) as response:
+            return json.load(response)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AgriGuard micro-batched inference worker")
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help="Path to best.pt / best.onnx")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--threads-per-worker', type=int, default=1)
+    parser.add_argument('--max-batch', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=10.0)
+    parser.add_argument('--max-pending', type=int, default=1024)
+    parser.add_argument('--shared', help="Attach workers to weights published under this prefix (shared_resources.py)")
+    args = parser.parse_args()
+
+    service = InferenceService(args.model, workers=args.workers, threads_per_worker=args.threads_per_worker,
+                               max_batch=args.max_batch, max_wait_ms=args.max_wait_ms, max_pending=args.max_pending,
+                               shared=args.shared)
+    serve(service, args.host, args.port)
@@ -0,0 +1,353 @@
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Off unless AGRIGUARD_METRICS=1: every hook below then costs one flag check
+ENABLED = os.environ.get("AGRIGUARD_METRICS", "0") not in ("", "0")
+# Requests slower than this (ms) get their sampled stacks dumped; unset = profiler off
+PROFILE_SLOW_MS = os.environ.get("AGRIGUARD_PROFILE_SLOW_MS")
+PROFILE_DIR = os.environ.get("AGRIGUARD_PROFILE_DIR", "outputs/profiles")
+
+STAGE_METRIC = "agriguard_stage_seconds"
+# Latency buckets (seconds): sub-ms lookups up to multi-second cold loads
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, Prometheus style."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        Approximate quantile: upper bound of the bucket holding it. Values past
+        the last bucket report that bucket's bound (a lower bound, not inf).
+        """
+        if not self.count:
+            return 0.0
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= q * self.count:
+                return bound
+        return self.buckets[-1]
+
+    def merge(self, counts, total, count):
+        for i, n in enumerate(counts):
+            self.counts[i] += n
+        self.sum += total
+        self.count += count
+
+
+class Registry:
+    """Thread-safe store of counters and histograms keyed by (name, labels)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def drain(self):
+        """
+        Picklable snapshot of everything recorded since the last drain, which
+        is then cleared. Worker processes ship these to the parent's merge().
+        """
+        with self._lock:
+            snapshot = {"counters": dict(self.counters),
+                        "histograms": {key: (h.buckets, h.counts, h.sum, h.count)
+                                       for key, h in self.histograms.items()}}
+            self.counters.clear()
+            self.histograms.clear()
+        return snapshot
+
+    def merge(self, snapshot):
+        """Adds a drain() snapshot (e.g. from a worker process) to this registry."""
+        with self._lock:
+            for key, value in snapshot["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, (buckets, counts, total, count) in snapshot["histograms"].items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram(buckets)
+                histogram.merge(counts, total, count)
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (metric, labels), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), histogram in sorted(self.histograms.items(), key=lambda kv: kv[0]):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, n in zip(histogram.buckets, histogram.counts):
+                        cumulative += n
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', repr(bound)),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """
+        {stage: {count, mean_ms, p50_ms, p99_ms}} of the stage timers
+        (bucket-resolution quantiles, capped at the largest finite bucket).
+        """
+        with self._lock:
+            stages = {dict(labels).get('stage'): h for (name, labels), h in self.histograms.items()
+                      if name == STAGE_METRIC}
+            return {stage: {"count": h.count,
+                            "mean_ms": round(h.sum / h.count * 1000, 3) if h.count else 0.0,
+                            "p50_ms": h.quantile(0.5) * 1000,
+                            "p99_ms": h.quantile(0.99) * 1000}
+                    for stage, h in sorted(stages.items())}
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (f'{k}="{_escape(v)}"' for k, v in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REGISTRY = Registry()
+
+
+def enable(flag=True):
+    """Turns instrumentation on/off at runtime (the env var only sets the default)."""
+    global ENABLED
+    ENABLED = flag
+
+
+class _Stage:
+    __slots__ = ('name', 'labels', 'start')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        REGISTRY.observe(STAGE_METRIC, time.perf_counter() - self.start, stage=self.name, **self.labels)
+        if exc_type is not None:
+            REGISTRY.inc("agriguard_stage_errors_total", stage=self.name)
+
+
+class _NoOp:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoOp()
+
+
+def stage(name, **labels):
+    """
+    Times a block as one pipeline stage:
+
+        with instrumentation.stage("upload_decode"):
+            image = Image.open(f)
+    """
+    if not ENABLED:
+        return _NOOP
+    return _Stage(name, labels)
+
+
+def timed(name):
+    """Decorator form of stage(): every call of the function is timed as `name`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with _Stage(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1, **labels):
+    """Increments a counter (e.g. cache hits)."""
+    if ENABLED:
+        REGISTRY.inc(name, value, **labels)
+
+
+def export_prometheus():
+    return REGISTRY.render_prometheus()
+
+
+def write_metrics(path):
+    """Writes the current metrics (Prometheus text) to `path`, e.g. for a node_exporter textfile collector."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(export_prometheus())
+    os.replace(tmp_path, path)
+    return path
+
+
+def serve_metrics(port=9108, host='127.0.0.1'):
+    """Serves GET /metrics on a daemon thread. Returns the server."""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = export_prometheus().encode()
+            self.send_response(200 if self.path.startswith('/metrics') else 404)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+# --- Sampling profiler for slow requests ---
+class StackSampler:
+    """
+    One background thread that, every `interval` seconds, records the Python
+    stack of each registered thread (via sys._current_frames). Stacks are kept
+    in collapsed form ("outer;inner;leaf" -> samples), the input format of
+    flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._targets = {}
+        self._thread = None
+
+    def start(self, thread_id):
+        samples = Counter()
+        with self._lock:
+            self._targets[thread_id] = samples
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+        return samples
+
+    def stop(self, thread_id):
+        with self._lock:
+            return self._targets.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._targets:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, samples in self._targets.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[_collapse(frame)] += 1
+
+
+def _collapse(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+class profile_request:
+    """
+    Context manager around one request. With AGRIGUARD_PROFILE_SLOW_MS set
+    (or `threshold_ms` given), the request's thread is sampled while it runs
+    and, if it took longer than the threshold, the collapsed stacks are written
+    to `<PROFILE_DIR>/<name>-<timestamp>.folded`. Free when not configured.
+    """
+
+    def __init__(self, name, threshold_ms=None, output_dir=None):
+        self.name = name
+        threshold_ms = threshold_ms if threshold_ms is not None else PROFILE_SLOW_MS
+        self.threshold = float(threshold_ms) / 1000 if threshold_ms is not None else None
+        self.output_dir = output_dir or PROFILE_DIR
+        self.dump_path = None
+
+    def __enter__(self):
+        global _sampler
+        if self.threshold is None:
+            return self
+        with _sampler_lock:
+            if _sampler is None:
+                _sampler = StackSampler()
+        self._thread_id = threading.get_ident()
+        self._start = time.perf_counter()
+        _sampler.start(self._thread_id)
+        return self
+
+    def __exit__(self, *exc):
+        if self.threshold is None:
+            return False
+        samples = _sampler.stop(self._thread_id)
+        elapsed = time.perf_counter() - self._start
+        if elapsed >= self.threshold and samples:
+            os.makedirs(self.output_dir, exist_ok=True)
+            self.dump_path = os.path.join(self.output_dir, f"{self.name}-{time.strftime('%Y%m%d-%H%M%S')}"
+                                                           f"-{int(elapsed * 1000)}ms.folded")
+            with open(self.dump_path, 'w') as f:
+                f.writelines(f"{stack} {n}\n" for stack, n in samples.most_common())
+            count("agriguard_slow_requests_total", request=self.name)
+        return False
@@ -0,0 +1,47 @@
+import threading
+import time
+
+
+class LazyResource:
+    """
+    A heavy, process-wide resource (model, engine) loaded on first use.
+
+    get() loads it once (thread-safe) and records how long that took;
+    warm_up() starts the same load on a background thread so a later get()
+    only waits for whatever is left. A failed load is retried by the next get().
+    With a `key` callable (e.g. the weights fingerprint), get() loads again
+    whenever the key differs from the one the current value was loaded for.
+    """
+
+    def __init__(self, name, loader, key=None):
+        self.name = name
+        self._loader = loader
+        self._key = key
+        self._lock = threading.Lock()
+        self._value = None
+        self._loaded_key = None
+        self.loaded = False
+        self.load_seconds = None
+
+    def get(self):
+        key = self._key() if self._key is not None else None
+        if not self.loaded or key != self._loaded_key:
+            with self._lock:
+                if not self.loaded or key != self._loaded_key:
+                    start = time.perf_counter()
+                    self._value = self._loader()
+                    self.load_seconds = time.perf_counter() - start
+                    self._loaded_key = key
+                    self.loaded = True
+        return self._value
+
+    def warm_up(self):
+        if not self.loaded and not self._lock.locked():
+            threading.Thread(target=self._warm, name=f"warm-up-{self.name}", daemon=True).start()
+
+    def _warm(self):
+        try:
+            self.get()
+        except Exception:
+            # Surfaces again (with UI feedback) on the foreground get()
+            pass
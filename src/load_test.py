@@ -0,0 +1,97 @@
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+SAMPLE_APPLICATION = {"state": "Maharashtra", "crop": "Maize", "disease_class": "Corn___Common_rust_",
+                      "land_area_acres": 5.0}
+
+
+def build_request(base_url, endpoint, image=None, batch_size=100):
+    """(url, body, content type) for one request against a scoring API endpoint."""
+    if endpoint == 'diagnose':
+        if image is None:
+            raise ValueError("--image is required for the diagnose endpoint")
+        with open(image, 'rb') as f:
+            return f"{base_url}/diagnose", f.read(), 'application/octet-stream'
+    if endpoint == 'risk':
+        return f"{base_url}/risk", json.dumps(SAMPLE_APPLICATION).encode(), 'application/json'
+    if endpoint == 'risk-batch':
+        body = json.dumps({"applications": [SAMPLE_APPLICATION] * batch_size}).encode()
+        return f"{base_url}/risk/batch", body, 'application/json'
+    raise ValueError(f"Unknown endpoint: {endpoint}")
+
+
+def run_load(url, body, content_type, requests=2000, concurrency=32, timeout=30.0):
+    """
+    Fires `requests` POSTs from `concurrency` client threads (closed loop:
+    each thread sends its next request once the previous one answered).
+    Returns latency percentiles (ms), throughput and status counts.
+    """
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def client():
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            request = urllib.request.Request(url, data=body, headers={'Content-Type': content_type})
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+            except Exception as e:
+                status = type(e).__name__
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+    wall = time.perf_counter() - start
+
+    ok = np.array(latencies) if latencies else np.zeros(1)
+    return {
+        "url": url,
+        "requests": requests,
+        "concurrency": concurrency,
+        "seconds": round(wall, 2),
+        "requests_per_sec": round(requests / wall, 1),
+        "status_counts": {str(k): v for k, v in sorted(statuses.items(), key=str)},
+        "p50_ms": round(float(np.percentile(ok, 50)), 2),
+        "p90_ms": round(float(np.percentile(ok, 90)), 2),
+        "p99_ms": round(float(np.percentile(ok, 99)), 2),
+        "max_ms": round(float(ok.max()), 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local load test for the scoring API (p50/p99 latency)")
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--endpoint', choices=['risk', 'risk-batch', 'diagnose'], default='risk')
+    parser.add_argument('--image', help="Leaf image to POST for the diagnose endpoint")
+    parser.add_argument('--batch-size', type=int, default=100, help="Applications per risk-batch request")
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--warmup', type=int, default=50, help="Untimed requests sent first")
+    args = parser.parse_args()
+
+    url, body, content_type = build_request(args.url.rstrip('/'), args.endpoint, args.image, args.batch_size)
+    if args.warmup:
+        run_load(url, body, content_type, requests=args.warmup, concurrency=min(args.concurrency, args.warmup))
+    print(json.dumps(run_load(url, body, content_type, args.requests, args.concurrency), indent=2))
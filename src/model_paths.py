@@ -0,0 +1,8 @@
+import os
+
+# Default location of the trained classifier (see src/03_model_training.py)
+DEFAULT_MODEL_PATH = 'runs/classify/weights/agriguard_model/weights/best.pt'
+# model.export(format='onnx') writes next to the weights
+DEFAULT_ONNX_PATH = os.path.splitext(DEFAULT_MODEL_PATH)[0] + '.onnx'
+# Output of src/04_model_optimization.py
+DEFAULT_INT8_PATH = os.path.splitext(DEFAULT_MODEL_PATH)[0] + '.int8.onnx'
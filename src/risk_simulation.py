@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from financial_engine import FinancialEngine
+
+# Scenario x loan cells simulated per chunk (keeps every array a few MB)
+CHUNK_CELLS = 1 << 18
+
+
+class PortfolioSimulator:
+    """
+    Monte Carlo loss distribution for a loan portfolio, on top of the same
+    inputs calculate_risk_profile uses for its single point estimate.
+
+    Every scenario samples, per loan:
+      - yield:   Normal(historical mean, historical std) of the State/Crop pair,
+                 with a per-crop systemic factor so bad seasons hit every loan
+                 of that crop together (`yield_correlation`)
+      - price:   a mean-preserving lognormal shock per crop (`price_volatility`)
+      - disease: with probability 1 - confidence the classifier was wrong and
+                 the true disease is drawn from the impact table
+      - loss:    Beta severity around the disease's table loss (class_metadata)
+                 (`severity_concentration`, higher = tighter)
+
+    The portfolio loss of a scenario is the revenue shortfall against the
+    disease-free expectation, i.e. the simulated version of Revenue_at_Risk_INR.
+    Scenarios run in fixed-size chunks, each seeded from its own SeedSequence
+    child, so the result only depends on `seed`, never on the worker count.
+    """
+
+    def __init__(self, engine, yield_correlation=0.5, price_volatility=0.15, severity_concentration=8.0,
+                 default_confidence=0.9):
+        self.engine = engine
+        self.yield_correlation = yield_correlation
+        self.price_volatility = price_volatility
+        self.severity_concentration = severity_concentration
+        self.default_confidence = default_confidence
+
+    def prepare(self, portfolio):
+        """
+        Resolves the per-loan parameters once (per unique State/Crop and
+        disease, like calculate_risk_profile_batch). `portfolio` has the
+        FinancialEngine.BATCH_COLUMNS plus an optional 'confidence' column
+        (classifier top-1 probability). Loans without state / crop /
+        disease_class raise ValueError, as in calculate_risk_profile_batch.
+        """
+        if hasattr(portfolio, 'to_pandas'):
+            portfolio = portfolio.to_pandas()
+
+        (state_codes, states), (crop_codes, crops), (disease_codes, diseases) = \
+            self.engine.factorize_applications(portfolio)
+
+        pairs, pair_codes = np.unique(state_codes * len(crops) + crop_codes, return_inverse=True)
+        spreads = np.array([self.engine.get_yield_spread(states[p // len(crops)], crops[p % len(crops)])
+                            for p in pairs], dtype=np.float64).reshape(-1, 2)
+        losses = np.array([self.engine.resolve_disease_loss(d)[1] for d in diseases], dtype=np.float64)
+        prices = np.array([self.engine.market_prices.get(c, 2000) for c in crops], dtype=np.float64)
+
+        if 'confidence' in portfolio.columns:
+            confidence = portfolio['confidence'].fillna(self.default_confidence).to_numpy(dtype=np.float64)
+        else:
+            confidence = np.full(len(portfolio), self.default_confidence)
+
+        return {
+            "crop_codes": crop_codes.astype(np.int64),
+            "n_crops": len(crops),
+            "mean_yield": spreads[pair_codes, 0],
+            "std_yield": np.nan_to_num(spreads[pair_codes, 1]),
+            "hectares": portfolio['land_area_acres'].to_numpy(dtype=np.float64) * 0.404686,
+            "price": prices[crop_codes],
+            "loss_mean": losses[disease_codes],
+            "misclassified_prob": np.clip(1.0 - confidence, 0.0, 1.0),
+            # What the true disease could be when the diagnosis is wrong
+            "alternative_losses": np.unique(self.engine.class_metadata.loss[:self.engine.class_metadata.unknown_id]),
+            "yield_correlation": self.yield_correlation,
+            "price_volatility": self.price_volatility,
+            "severity_concentration": self.severity_concentration,
+        }
+
+    def simulate(self, portfolio, n_scenarios=1000, seed=0, workers=1):
+        """
+        Returns the simulated portfolio loss (INR) of every scenario, shape (n_scenarios,).
+        """
+        params = self.prepare(portfolio)
+        n_loans = len(params["hectares"])
+        chunk = max(1, CHUNK_CELLS // max(n_loans, 1))
+        sizes = [min(chunk, n_scenarios - start) for start in range(0, n_scenarios, chunk)]
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+        if workers > 1 and len(sizes) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parts = list(pool.map(_simulate_chunk, [params] * len(sizes), seeds, sizes))
+        else:
+            parts = [_simulate_chunk(params, s, n) for s, n in zip(seeds, sizes)]
+        return np.concatenate(parts) if parts else np.empty(0)
+
+    def run(self, portfolio, n_scenarios=1000, seed=0, workers=1, levels=(0.95, 0.99)):
+        """
+        Simulates the portfolio and summarizes the loss distribution:
+        expected loss, VaR and expected shortfall at each confidence level,
+        next to the point estimate from calculate_risk_profile_batch.
+        """
+        start = time.perf_counter()
+        losses = self.simulate(portfolio, n_scenarios, seed, workers)
+        elapsed = time.perf_counter() - start
+
+        point = self.engine.calculate_risk_profile_batch(portfolio)
+        summary = {
+            "loans": len(point),
+            "scenarios": int(n_scenarios),
+            "seconds": round(elapsed, 3),
+            "point_revenue_at_risk": round(float(point["Revenue_at_Risk_INR"].sum()), 2),
+            "point_projected_revenue": round(float(point["Projected_Revenue_INR"].sum()), 2),
+            "expected_loss": round(float(losses.mean()), 2),
+            "loss_std": round(float(losses.std()), 2),
+        }
+        summary.update(loss_metrics(losses, levels))
+        return summary
+
+
+def loss_metrics(losses, levels=(0.95, 0.99)):
+    """VaR (loss quantile) and expected shortfall (mean loss beyond it) per level."""
+    metrics = {}
+    for level in levels:
+        var = float(np.quantile(losses, level))
+        tail = losses[losses >= var]
+        tag = f"{level * 100:g}"
+        metrics[f"var_{tag}"] = round(var, 2)
+        metrics[f"es_{tag}"] = round(float(tail.mean()) if len(tail) else var, 2)
+    return metrics
+
+
+def _simulate_chunk(params, seed, n):
+    # Runs in worker processes: (n scenarios x M loans) array math only
+    rng = np.random.default_rng(seed)
+    crop_codes = params["crop_codes"]
+    shape = (n, len(crop_codes))
+
+    # 1. Yield: systemic per-crop factor + idiosyncratic noise
+    rho = params["yield_correlation"]
+    systemic = rng.standard_normal((n, params["n_crops"]))[:, crop_codes]
+    noise = np.sqrt(rho) * systemic + np.sqrt(1 - rho) * rng.standard_normal(shape)
+    yields = np.maximum(params["mean_yield"] + params["std_yield"] * noise, 0.0)
+
+    # 2. Price: one lognormal shock per crop, mean-preserving
+    sigma = params["price_volatility"]
+    shock = np.exp(sigma * rng.standard_normal((n, params["n_crops"])) - 0.5 * sigma ** 2)
+    prices = params["price"] * shock[:, crop_codes]
+
+    # 3. Disease: a wrong diagnosis swaps in a random disease from the impact table
+    loss_mean = np.broadcast_to(params["loss_mean"], shape)
+    wrong = rng.random(shape) < params["misclassified_prob"]
+    alternatives = params["alternative_losses"]
+    loss_mean = np.where(wrong, alternatives[rng.integers(len(alternatives), size=shape)], loss_mean)
+
+    # 4. Severity: Beta around the expected loss (a zero-loss disease stays at zero)
+    k = params["severity_concentration"]
+    a = np.maximum(loss_mean * k, 1e-9)
+    b = np.maximum((1 - loss_mean) * k, 1e-9)
+    loss_pct = np.where(loss_mean > 0, rng.beta(a, b), 0.0)
+
+    # Shortfall against the disease-free expectation, summed over the portfolio
+    expected = params["mean_yield"] * params["hectares"] * params["price"]
+    actual = yields * params["hectares"] * prices * (1 - loss_pct)
+    return (expected - actual).sum(axis=1)
+
+
+def synthetic_portfolio(engine, n_loans, seed=0):
+    """Random applications over the engine's known crops/diseases, for trying the simulator."""
+    rng = np.random.default_rng(seed)
+    states = sorted({s for s in engine.yield_index.states if s})
+    crops = list(engine.market_prices)
+    diseases = engine.class_metadata.names
+    return pd.DataFrame({
+        'state': rng.choice(states, n_loans),
+        'crop': rng.choice(crops, n_loans),
+        'disease_class': rng.choice(diseases, n_loans),
+        'land_area_acres': rng.uniform(1, 20, n_loans).round(1),
+        'confidence': rng.uniform(0.6, 1.0, n_loans).round(3),
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo VaR / expected shortfall for a loan portfolio")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--portfolio', help="CSV with state, crop, disease_class, land_area_acres[, confidence]")
+    source.add_argument('--synthetic', type=int, metavar='N', help="Simulate N random loans instead")
+    parser.add_argument('--scenarios', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default="data/raw/financial")
+    parser.add_argument('--yield-correlation', type=float, default=0.5)
+    parser.add_argument('--price-volatility', type=float, default=0.15)
+    parser.add_argument('--output', help="Also write the summary JSON here")
+    args = parser.parse_args()
+
+    engine = FinancialEngine(data_dir=args.data_dir)
+    portfolio = pd.read_csv(args.portfolio) if args.portfolio else synthetic_portfolio(engine, args.synthetic, args.seed)
+
+    simulator = PortfolioSimulator(engine, yield_correlation=args.yield_correlation,
+                                   price_volatility=args.price_volatility)
+    summary = simulator.run(portfolio, n_scenarios=args.scenarios, seed=args.seed, workers=args.workers)
+    print(json.dumps(summary, indent=2))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"[Success] Summary saved to: {args.output}")
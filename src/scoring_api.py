@@ -0,0 +1,281 @@
+import argparse
+import asyncio
+import io
+import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List, Optional, Union
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel
+
+import instrumentation
+from inference_backend import DEFAULT_MODEL_PATH, load_backend, topk
+from inference_server import InferenceService, MicroBatcher
+
+# /risk/batch requests at least this large go through calculate_risk_profile_batch
+VECTORIZE_MIN_BATCH = 256
+# /diagnose gives up (504) on an image that isn't classified within this many seconds
+DIAGNOSE_TIMEOUT_S = 30.0
+
+
+class RiskRequest(BaseModel):
+    state: str
+    crop: str
+    # Model class name ("Tomato___Early_blight") or the classifier's integer class id
+    disease_class: Union[str, int]
+    land_area_acres: float
+
+
+class RiskBatchRequest(BaseModel):
+    applications: List[RiskRequest]
+
+
+def check_image(data):
+    """
+    Cheap check (header and structure, no full decode) that `data` is an
+    image PIL can read, so garbage is rejected before it joins a batch.
+    Raises ValueError otherwise.
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+    except Exception as e:
+        raise ValueError(f"Not a readable image: {e}")
+
+
+class InProcessClassifier:
+    """
+    Classifier held in the API process: requests are micro-batched and each
+    batch runs on a small thread pool (the ONNX / torch kernels release the GIL).
+    Same predict_proba/names/stats surface as InferenceService.
+    """
+
+    def __init__(self, model_path=DEFAULT_MODEL_PATH, threads=2, max_batch=16, max_wait_ms=5, max_pending=256,
+                 shared=None):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model not found: {model_path}")
+        self.model_path = model_path
+        if shared:
+            from shared_resources import load_classifier
+            self.backend = load_classifier(model_path, shared=shared, threads=threads)
+        else:
+            self.backend = load_backend(model_path)
+        self.names = self.backend.names
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="inference")
+        self.batcher = MicroBatcher(lambda images: self.pool.submit(self.backend.predict_proba, images),
+                                    max_batch=max_batch, max_wait_ms=max_wait_ms, max_pending=max_pending)
+
+    def stats(self):
+        return {
+            "batches": self.batcher.batches,
+            "images": self.batcher.items,
+            "avg_batch_size": round(self.batcher.items / self.batcher.batches, 2) if self.batcher.batches else 0.0,
+            "pending": self.batcher.pending(),
+        }
+
+    def close(self):
+        self.batcher.close()
+        self.pool.shutdown()
+
+
+class AdmissionLimit:
+    """
+    Backpressure: at most `limit` requests are processed at once; the rest are
+    turned away with 503 right away instead of queueing without bound.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.rejected = 0
+
+    def __enter__(self):
+        # Only touched from the event loop thread, so no lock is needed
+        if self.active >= self.limit:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Server busy, retry later")
+        self.active += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.active -= 1
+
+
+def create_app(model_path=DEFAULT_MODEL_PATH, data_dir="data/raw/financial", workers=0, threads=2,
+               max_batch=16, max_wait_ms=5, max_pending=256, max_in_flight=512, shared=None,
+               timeout_s=DIAGNOSE_TIMEOUT_S):
+    """
+    Builds the scoring API. FinancialEngine and the classifier are loaded once
+    at startup. With workers=0 the model runs in this process on `threads`
+    threads, otherwise on an InferenceService process pool. With `shared` (a
+    shared_resources.py prefix) both attach to the published weights and
+    yield aggregates instead of loading private copies. A /diagnose image
+    not classified within `timeout_s` seconds gets a 504.
+    """
+    resources = {}
+
+    @asynccontextmanager
+    async def lifespan(app):
+        from class_metadata import get_class_metadata
+        from financial_engine import FinancialEngine
+
+        resources["executor"] = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="risk")
+        resources["classifier"] = None
+        if model_path and os.path.exists(model_path):
+            if workers > 0:
+                resources["classifier"] = InferenceService(model_path, workers=workers, max_batch=max_batch,
+                                                           max_wait_ms=max_wait_ms, max_pending=max_pending, shared=shared)
+            else:
+                resources["classifier"] = InProcessClassifier(model_path, threads=threads, max_batch=max_batch,
+                                                              max_wait_ms=max_wait_ms, max_pending=max_pending,
+                                                              shared=shared)
+        else:
+            print(f"[Warning] Model not found at {model_path}: /diagnose is disabled.")
+
+        # One class table for classifier and engine, indexed by the model's class ids
+        classifier = resources["classifier"]
+        class_metadata = get_class_metadata(classifier.names if classifier is not None else None)
+        if shared:
+            from shared_resources import attach
+            resources["engine"] = attach(shared).engine(class_metadata)
+        else:
+            resources["engine"] = FinancialEngine(data_dir=data_dir, class_metadata=class_metadata)
+        yield
+        if resources["classifier"] is not None:
+            resources["classifier"].close()
+        resources["executor"].shutdown()
+
+    app = FastAPI(title="AgriGuard Scoring API", lifespan=lifespan)
+    limit = AdmissionLimit(max_in_flight)
+
+    @app.exception_handler(ValueError)
+    async def invalid_application(request, exc):
+        # e.g. a class id the classifier doesn't have
+        return JSONResponse(status_code=422, content={"detail": str(exc)})
+
+    async def classify(image_bytes, k):
+        classifier = resources["classifier"]
+        if classifier is None:
+            raise HTTPException(status_code=503, detail="No classifier loaded")
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(resources["executor"], check_image, image_bytes)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        try:
+            future = classifier.batcher.submit(image_bytes, block=False)
+        except queue.Full:
+            raise HTTPException(status_code=503, detail="Inference queue full, retry later")
+        # The batcher's Future resolves on a worker; awaiting it keeps the loop free.
+        # On timeout the Future is cancelled, so a batch that hasn't started yet skips it.
+        try:
+            probs = await asyncio.wait_for(asyncio.wrap_future(future), timeout_s)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Inference timed out")
+        except OSError as e:
+            # Passed check_image() but failed to decode (e.g. truncated); the rest of its batch was retried without it
+            raise HTTPException(status_code=400, detail=f"Could not decode image: {e}")
+        return topk(probs, classifier.names, k)
+
+    @app.get("/health")
+    async def health():
+        classifier = resources["classifier"]
+        return {
+            "status": "ok",
+            "in_flight": limit.active,
+            "rejected": limit.rejected,
+            "classifier": classifier.stats() if classifier is not None else None,
+        }
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        # Stage histograms in Prometheus text format (empty unless AGRIGUARD_METRICS=1)
+        return instrumentation.export_prometheus()
+
+    @app.post("/diagnose")
+    async def diagnose(request: Request, k: int = Query(5, alias="topk"), state: Optional[str] = None,
+                       crop: Optional[str] = None, acres: Optional[float] = None):
+        """
+        POST the raw image bytes. With state/crop/acres the top-1
+        diagnosis is also scored into a risk report; giving only some of
+        them is a 422.
+        """
+        risk_args = {"state": state, "crop": crop, "acres": acres}
+        missing = [name for name, value in risk_args.items() if value is None]
+        if 0 < len(missing) < len(risk_args):
+            raise HTTPException(status_code=422, detail=f"Risk scoring needs state, crop and acres together; "
+                                                        f"missing: {', '.join(missing)}")
+        with limit:
+            image_bytes = await request.body()
+            if not image_bytes:
+                raise HTTPException(status_code=400, detail="Empty request body, POST the raw image bytes")
+
+            start = time.perf_counter()
+            predictions = await classify(image_bytes, k)
+            response = {"predictions": [{"class": name, "confidence": conf} for name, conf in predictions]}
+            if not missing:
+                response["risk"] = resources["engine"].calculate_risk_profile(state, crop, predictions[0][0], acres)
+            response["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            return response
+
+    @app.post("/risk")
+    async def risk(application: RiskRequest):
+        with limit:
+            # A single report is a few index lookups: cheaper inline than a thread hop
+            return resources["engine"].calculate_risk_profile(application.state, application.crop,
+                                                              application.disease_class, application.land_area_acres)
+
+    @app.post("/risk/batch")
+    async def risk_batch(batch: RiskBatchRequest):
+        with limit:
+            engine = resources["engine"]
+            loop = asyncio.get_running_loop()
+            if len(batch.applications) < VECTORIZE_MIN_BATCH:
+                # Small batches: the scalar path is cheaper than building DataFrames, but a few
+                # hundred reports still take long enough to belong off the event loop
+                reports = await loop.run_in_executor(
+                    resources["executor"],
+                    lambda: [engine.calculate_risk_profile(a.state, a.crop, a.disease_class, a.land_area_acres)
+                             for a in batch.applications])
+                return {"reports": reports}
+
+            import pandas as pd
+
+            frame = pd.DataFrame([{'state': a.state, 'crop': a.crop, 'disease_class': a.disease_class,
+                                   'land_area_acres': a.land_area_acres} for a in batch.applications],
+                                 columns=engine.BATCH_COLUMNS)
+            reports = await loop.run_in_executor(resources["executor"], engine.calculate_risk_profile_batch, frame)
+            return {"reports": reports.astype(object).to_dict('records')}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="AgriGuard async scoring API (diagnosis + risk)")
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help="Path to best.pt / best.onnx")
+    parser.add_argument('--data-dir', default="data/raw/financial")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=0, help="Inference processes (0 = in-process threads)")
+    parser.add_argument('--threads', type=int, default=2, help="Inference / batch scoring threads")
+    parser.add_argument('--max-batch', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--max-pending', type=int, default=256, help="Queued images before /diagnose returns 503")
+    parser.add_argument('--max-in-flight', type=int, default=512, help="Concurrent requests before 503")
+    parser.add_argument('--shared', help="Attach to weights / yield data published under this prefix")
+    parser.add_argument('--timeout', type=float, default=DIAGNOSE_TIMEOUT_S, help="Seconds before /diagnose gives up (504)")
+    args = parser.parse_args()
+
+    app = create_app(args.model, args.data_dir, workers=args.workers, threads=args.threads,
+                     max_batch=args.max_batch, max_wait_ms=args.max_wait_ms, max_pending=args.max_pending,
+                     max_in_flight=args.max_in_flight, shared=args.shared,
+                     timeout_s=args.timeout)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
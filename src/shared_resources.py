@@ -0,0 +1,472 @@
+import argparse
+import json
+import mmap
+import multiprocessing
+import os
+import queue
+import sys
+import time
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from inference_backend import DEFAULT_ONNX_PATH, OnnxBackend, load_backend
+
+DEFAULT_PREFIX = "agriguard"
+LAYOUT_VERSION = 2
+# Array offsets inside the data segment are aligned for SIMD loads
+ALIGNMENT = 64
+# Yield aggregate arrays of a YieldIndex, published as is
+YIELD_ARRAYS = ['pair_state', 'pair_crop', 'pair_sum', 'pair_count', 'pair_sumsq']
+# measure(): seconds a worker may take to load, timed predictions per batch size
+MEASURE_TIMEOUT_S = 300
+LATENCY_RUNS = 20
+# Pre-packed weights mostly pay off for batches, so both are timed
+LATENCY_BATCHES = (1, 8)
+
+_segments = []
+
+
+def _open_segment(name):
+    """
+    Read-only mapping of an existing segment, as a buffer.
+
+    On Linux the segment is the file /dev/shm/<name> and is mmap'd with
+    ACCESS_READ, so writes fault and nothing is registered with the
+    multiprocessing resource tracker (which would unlink the segment when
+    an attaching worker exits). Elsewhere SharedMemory is used untracked.
+    """
+    path = os.path.join('/dev/shm', name)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if sys.version_info >= (3, 13):
+        segment = shared_memory.SharedMemory(name=name, track=False)
+    else:
+        from multiprocessing import resource_tracker
+        segment = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(segment._name, "shared_memory")
+    # SharedMemory.__del__ closes the mapping, which fails while views exist: keep it for the process lifetime
+    _segments.append(segment)
+    return segment.buf
+
+
+def _pack(arrays):
+    """Byte layout {key: {offset, dtype, shape}} for a dict of arrays, and the total size."""
+    layout, offset = {}, 0
+    for key, array in arrays.items():
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        layout[key] = {"offset": offset, "dtype": array.dtype.str, "shape": list(array.shape)}
+        offset += array.nbytes
+    return layout, max(offset, 1)
+
+
+def _view(buffer, spec):
+    """Read-only NumPy view of one packed array (no copy)."""
+    dtype = np.dtype(spec["dtype"])
+    count = int(np.prod(spec["shape"], dtype=np.int64))
+    array = np.frombuffer(buffer, dtype=dtype, count=count, offset=spec["offset"]).reshape(spec["shape"])
+    array.flags.writeable = False
+    return array
+
+
+def _onnx_arrays(model_path):
+    """
+    Initializers of an ONNX model as arrays, plus the graph with each of them
+    turned into a graph input (fed from shared memory on every run).
+    """
+    import onnx
+    from onnx import helper, numpy_helper
+
+    model = onnx.load(model_path)
+    arrays = {}
+    inputs = {i.name for i in model.graph.input}
+    for tensor in model.graph.initializer:
+        arrays[tensor.name] = numpy_helper.to_array(tensor)
+        if tensor.name not in inputs:
+            model.graph.input.append(helper.make_tensor_value_info(tensor.name, tensor.data_type, list(tensor.dims)))
+    del model.graph.initializer[:]
+    return arrays, model.SerializeToString()
+
+
+class SharedResourcePublisher:
+    """
+    Loader side: publishes the compact yield aggregates, and with
+    `share_weights` the ONNX classifier weights, once per node, so worker
+    processes can attach instead of each loading their own copy.
+
+    Weight sharing is opt-in: shared weights are fed to ONNX Runtime as
+    graph inputs, which skips weight pre-packing and constant folding, so
+    inference can get slower (see measure(), which reports both memory and
+    latency). Only ONNX models can be shared; export .pt weights first.
+
+    Two shared memory segments are created:
+      - `<prefix>_data`:   every weight / aggregate array, 64-byte aligned
+      - `<prefix>_layout`: JSON (length-prefixed) describing where each array
+                           lives, its dtype and shape, plus the model graph
+                           and yield vocabularies needed to rebuild objects.
+    The publisher must stay alive while workers use the segments; close()
+    removes them.
+    """
+
+    def __init__(self, prefix=DEFAULT_PREFIX, model_path=DEFAULT_ONNX_PATH, data_dir="data/raw/financial",
+                 share_weights=False):
+        if share_weights and not (model_path or '').endswith('.onnx'):
+            raise ValueError(f"Only ONNX weights can be shared, got {model_path}; export the model to ONNX first")
+        self.prefix = prefix
+        self.model_path = model_path
+        self.data_dir = data_dir
+        self.share_weights = share_weights
+        self.segments = []
+
+    def publish(self):
+        from yield_store import default_ingest_path, find_yield_file, load_ingested, load_yield_store
+
+        start = time.perf_counter()
+        arrays, layout = {}, {"version": LAYOUT_VERSION, "created": time.time()}
+
+        # 1. Yield aggregates (a few arrays per (State, Crop) pair, not the raw rows)
+        source = find_yield_file(self.data_dir)
+        _, index = load_yield_store(source)
+        # Plus what FinancialEngine.ingest() saved for this CSV
+        ingested = load_ingested(default_ingest_path(source), source)
+        if ingested is not None:
+            index = index.merge(ingested)
+        for name in YIELD_ARRAYS:
+            arrays[f"yield/{name}"] = np.ascontiguousarray(getattr(index, name))
+        layout["yield"] = {"states": index.states, "crops": index.crops}
+
+        # 2. Classifier weights (+ the weightless graph, stored as a byte array)
+        if self.share_weights and os.path.exists(self.model_path):
+            model_arrays, graph = _onnx_arrays(self.model_path)
+            for name, array in model_arrays.items():
+                arrays[f"model/{name}"] = np.ascontiguousarray(array)
+            arrays["model_graph"] = np.frombuffer(graph, dtype=np.uint8)
+            layout["model"] = {"model_path": os.path.abspath(self.model_path)}
+        elif self.share_weights:
+            print(f"[Warning] Model not found at {self.model_path}: only yield aggregates are shared.")
+
+        # 3. Copy everything into the data segment once
+        layout["arrays"], size = _pack(arrays)
+        data = self._create(f"{self.prefix}_data", size)
+        for key, array in arrays.items():
+            spec = layout["arrays"][key]
+            target = np.ndarray(array.shape, dtype=array.dtype, buffer=data.buf, offset=spec["offset"])
+            target[...] = array
+            del target
+
+        encoded = json.dumps(layout).encode()
+        meta = self._create(f"{self.prefix}_layout", len(encoded) + 8)
+        meta.buf[:8] = len(encoded).to_bytes(8, 'little')
+        meta.buf[8:8 + len(encoded)] = encoded
+
+        print(f"[Success] Published {len(arrays)} arrays ({size / 1e6:.1f} MB) as '{self.prefix}' "
+              f"in {time.perf_counter() - start:.2f}s")
+        return self
+
+    def _create(self, name, size):
+        try:
+            # Left over from a publisher that didn't shut down cleanly
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.segments.append(segment)
+        return segment
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                pass
+        self.segments = []
+
+    def __enter__(self):
+        return self.publish()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _SharedWeightsSession:
+    """
+    ONNX Runtime session whose weights are graph inputs, fed as the shared
+    arrays on every run. ORT reads CPU inputs in place, whereas initializers
+    (even via add_initializer / add_external_initializers) end up copied or
+    pre-packed into private memory. The price is that weight-dependent graph
+    rewrites (constant folding, pre-packed MatMul/NCHWc conv weights) are
+    skipped: on a 117 MB MatMul model one thread ran ~3x slower.
+    """
+
+    def __init__(self, session, weights):
+        self.session = session
+        self.weights = weights
+
+    def get_inputs(self):
+        return [i for i in self.session.get_inputs() if i.name not in self.weights]
+
+    def get_modelmeta(self):
+        return self.session.get_modelmeta()
+
+    def run(self, output_names, feeds):
+        return self.session.run(output_names, {**feeds, **self.weights})
+
+
+class SharedResources:
+    """
+    Worker side: attaches to a publisher's segments by prefix. Every array is
+    a read-only view into the shared pages, so N workers hold one copy of the
+    weights and aggregates instead of N.
+    """
+
+    def __init__(self, prefix=DEFAULT_PREFIX):
+        self.prefix = prefix
+        meta = _open_segment(f"{prefix}_layout")
+        size = int.from_bytes(bytes(meta[:8]), 'little')
+        self.layout = json.loads(bytes(meta[8:8 + size]))
+        del meta
+        if self.layout.get("version") != LAYOUT_VERSION:
+            raise RuntimeError(f"Shared layout version {self.layout.get('version')} != {LAYOUT_VERSION}")
+
+        self._data = _open_segment(f"{prefix}_data")
+        self._backend = None
+
+    def array(self, key):
+        return _view(self._data, self.layout["arrays"][key])
+
+    @property
+    def model_path(self):
+        return self.layout["model"]["model_path"] if "model" in self.layout else None
+
+    def yield_index(self):
+        """YieldIndex over the shared aggregates (only the small per-process memos are private)."""
+        from yield_store import YieldIndex
+
+        vocab = self.layout["yield"]
+        return YieldIndex(vocab["states"], vocab["crops"], *[self.array(f"yield/{n}") for n in YIELD_ARRAYS])
+
+    def engine(self, class_metadata=None):
+        from financial_engine import FinancialEngine
+
+        return FinancialEngine(yield_index=self.yield_index(), class_metadata=class_metadata)
+
+    def backend(self, threads=None):
+        """The shared ONNX classifier (built once per process)."""
+        if self._backend is None:
+            if "model" not in self.layout:
+                raise RuntimeError(f"No model weights published under '{self.prefix}'")
+            self._backend = self._onnx_backend(self.layout["model"], threads)
+        return self._backend
+
+    def _model_arrays(self):
+        return {key[len("model/"):]: self.array(key) for key in self.layout["arrays"] if key.startswith("model/")}
+
+    def _onnx_backend(self, model, threads):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        session = ort.InferenceSession(self.array("model_graph").tobytes(), options,
+                                       providers=['CPUExecutionProvider'])
+        return OnnxBackend(model["model_path"], session=_SharedWeightsSession(session, self._model_arrays()))
+
+    def close(self):
+        # The mapping itself goes away once the last array view is released
+        self._backend = None
+        self._data = None
+
+
+_attached = {}
+
+
+def attach(prefix=DEFAULT_PREFIX):
+    """Process-wide SharedResources per prefix."""
+    if prefix not in _attached:
+        _attached[prefix] = SharedResources(prefix)
+    return _attached[prefix]
+
+
+def load_classifier(model_path=DEFAULT_ONNX_PATH, backend=None, shared=None, threads=None):
+    """
+    The shared classifier if `shared` (a prefix) publishes the weights of this
+    very model, otherwise a private load_backend() copy.
+    """
+    if shared:
+        resources = attach(shared)
+        if resources.model_path and os.path.abspath(model_path) == resources.model_path:
+            return resources.backend(threads)
+        print(f"[Init] '{shared}' doesn't share the weights of {model_path}; loading a private copy.")
+    return load_backend(model_path, backend)
+
+
+# --- RSS measurement ---
+
+def memory_usage():
+    """
+    Memory of this process in MB. RSS counts shared pages in every process
+    mapping them, so PSS (shared pages split between their users) and
+    private (USS) show what a worker really adds. Linux only for PSS/private.
+    """
+    usage = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if parts[0] in ('Rss:', 'Pss:', 'Private_Clean:', 'Private_Dirty:'):
+                    usage[parts[0][:-1]] = int(parts[1]) / 1024
+        return {"rss_mb": round(usage["Rss"], 1), "pss_mb": round(usage["Pss"], 1),
+                "private_mb": round(usage["Private_Clean"] + usage["Private_Dirty"], 1)}
+    except (OSError, KeyError):
+        import resource
+        # Peak RSS (KB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {"rss_mb": round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)}
+
+
+def _measure_worker(mode, prefix, model_path, data_dir, image, ready, done, results):
+    # Each worker loads (or attaches), serves diagnoses + a risk report, then reports memory and latency
+    try:
+        from financial_engine import FinancialEngine
+
+        baseline = memory_usage()
+        if mode == 'shared':
+            resources = attach(prefix)
+            engine = resources.engine()
+            classifier = resources.backend(threads=1) if "model" in resources.layout else None
+        else:
+            engine = FinancialEngine(data_dir=data_dir)
+            classifier = OnnxBackend(model_path, threads=1) if os.path.exists(model_path) else None
+
+        disease, latency = "Tomato___Early_blight", {}
+        if classifier is not None:
+            for batch_size in LATENCY_BATCHES:
+                batch = [image] * batch_size
+                classifier.predict_proba(batch)  # warm-up
+                timings = []
+                for _ in range(LATENCY_RUNS):
+                    start = time.perf_counter()
+                    probs = classifier.predict_proba(batch)[0]
+                    timings.append((time.perf_counter() - start) * 1000)
+                latency[f"batch_{batch_size}"] = round(float(np.median(timings)), 3)
+            disease = classifier.names[int(np.argmax(probs))]
+        engine.calculate_risk_profile("Maharashtra", "Maize", disease, 5)
+
+        # Measure while every worker is loaded, so shared pages are really shared
+        ready.wait(MEASURE_TIMEOUT_S)
+        results.put({"mode": mode, "pid": os.getpid(), "baseline": baseline, "loaded": memory_usage(),
+                     "latency_ms": latency})
+    except Exception:
+        # Release the other workers (their barrier breaks) and tell the parent why
+        ready.abort()
+        results.put({"mode": mode, "pid": os.getpid(), "error": traceback.format_exc()})
+        return
+    done.wait(MEASURE_TIMEOUT_S)
+
+
+def _collect(processes, results, timeout):
+    """One result per worker; RuntimeError if a worker fails, dies or doesn't report within `timeout` s."""
+    rows, deadline = [], time.monotonic() + timeout
+    while len(rows) < len(processes):
+        try:
+            row = results.get(timeout=1)
+        except queue.Empty:
+            dead = [p for p in processes if not p.is_alive() and p.exitcode != 0]
+            if dead:
+                raise RuntimeError(f"Worker {dead[0].pid} exited with code {dead[0].exitcode}")
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Only {len(rows)}/{len(processes)} workers reported within {timeout}s")
+            continue
+        if "error" in row:
+            raise RuntimeError(f"Worker {row['pid']} failed:\n{row['error']}")
+        rows.append(row)
+    return rows
+
+
+def measure(workers=4, prefix=DEFAULT_PREFIX, model_path=DEFAULT_ONNX_PATH, data_dir="data/raw/financial",
+            output_path="outputs/shared_memory_rss.json", timeout=MEASURE_TIMEOUT_S):
+    """
+    Starts `workers` processes that each load their own model + engine, then
+    `workers` that attach to the shared segments (weights included), and
+    compares their memory and single-image latency (one ORT thread each).
+    """
+    from PIL import Image
+
+    context = multiprocessing.get_context('spawn')
+    image = Image.new('RGB', (256, 256), (60, 140, 50))
+    report = {"workers": workers, "model_path": model_path, "modes": {}}
+
+    publisher = SharedResourcePublisher(prefix, model_path, data_dir, share_weights=True).publish()
+    try:
+        for mode in ('private', 'shared'):
+            ready, done = context.Barrier(workers), context.Event()
+            results = context.Queue()
+            processes = [context.Process(target=_measure_worker, args=(mode, prefix, model_path, data_dir, image,
+                                                                       ready, done, results))
+                         for _ in range(workers)]
+            for p in processes:
+                p.start()
+            try:
+                rows = _collect(processes, results, timeout)
+            finally:
+                done.set()
+                for p in processes:
+                    p.join(10)
+                    if p.is_alive():
+                        p.terminate()
+
+            loaded = [r["loaded"] for r in rows]
+            summary = {key: round(float(np.mean([m[key] for m in loaded])), 1) for key in loaded[0]}
+            summary["baseline_rss_mb"] = round(float(np.mean([r["baseline"]["rss_mb"] for r in rows])), 1)
+            for key in rows[0]["latency_ms"]:
+                summary[f"latency_ms_{key}"] = round(float(np.median([r["latency_ms"][key] for r in rows])), 2)
+            report["modes"][mode] = {"per_worker": summary, "workers": rows}
+    finally:
+        publisher.close()
+
+    batches = [f"batch_{b}" for b in LATENCY_BATCHES]
+    print(f"\n{'Mode':<10}{'Base RSS':>10}{'RSS':>10}{'PSS':>10}{'Private':>10}"
+          + "".join(f"{'ms x' + b.split('_')[1]:>10}" for b in batches) + f"   (per worker, {workers} workers)")
+    for mode, result in report["modes"].items():
+        s = result["per_worker"]
+        print(f"{mode:<10}{s['baseline_rss_mb']:>10.1f}{s['rss_mb']:>10.1f}{s.get('pss_mb', float('nan')):>10.1f}"
+              f"{s.get('private_mb', float('nan')):>10.1f}"
+              + "".join(f"{s.get('latency_ms_' + b, float('nan')):>10.2f}" for b in batches))
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nMeasurement saved to: {output_path}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Share model weights and yield aggregates across worker processes")
+    parser.add_argument('command', choices=['publish', 'measure'])
+    parser.add_argument('--prefix', default=DEFAULT_PREFIX, help="Shared memory segment name prefix")
+    parser.add_argument('--model', default=DEFAULT_ONNX_PATH, help="ONNX model (weights are only shared for ONNX)")
+    parser.add_argument('--share-weights', action='store_true',
+                        help="Also share the model weights (less memory, can be slower; see measure)")
+    parser.add_argument('--data-dir', default="data/raw/financial")
+    parser.add_argument('--workers', type=int, default=4, help="Worker processes per mode (measure)")
+    parser.add_argument('--timeout', type=float, default=MEASURE_TIMEOUT_S, help="Seconds to wait for workers (measure)")
+    args = parser.parse_args()
+
+    if args.command == 'measure':
+        measure(args.workers, args.prefix, args.model, args.data_dir, timeout=args.timeout)
+    else:
+        with SharedResourcePublisher(args.prefix, args.model, args.data_dir, share_weights=args.share_weights):
+            print(f"Workers can attach with AGRIGUARD_SHARED_RESOURCES={args.prefix}. Ctrl-C to stop.")
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                pass
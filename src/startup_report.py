@@ -0,0 +1,70 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from model_paths import DEFAULT_MODEL_PATH
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# What each app mode needs before its first request can be answered
+MODES = {
+    "farmer": ("from inference_backend import load_backend",
+               "load_backend({model_path!r}, {backend!r})"),
+    "banker": ("from financial_engine import FinancialEngine",
+               "FinancialEngine()"),
+}
+
+_PROBE = """
+import json, sys, time
+sys.path.insert(0, {src_dir!r})
+start = time.perf_counter()
+{import_stmt}
+imported = time.perf_counter()
+{load_stmt}
+loaded = time.perf_counter()
+print(json.dumps({{"import_s": imported - start, "load_s": loaded - imported}}))
+"""
+
+
+def measure_mode(mode, runs=3, model_path=DEFAULT_MODEL_PATH, backend=None):
+    """
+    Cold-start cost of one app mode, measured in fresh interpreters so no
+    module or file cache from a previous run is reused by Python.
+    """
+    import_stmt, load_stmt = MODES[mode]
+    code = _PROBE.format(src_dir=SRC_DIR, import_stmt=import_stmt,
+                         load_stmt=load_stmt.format(model_path=model_path, backend=backend))
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    import_s = statistics.median(s["import_s"] for s in samples)
+    load_s = statistics.median(s["load_s"] for s in samples)
+    return {
+        "import_s": round(import_s, 3),
+        "load_s": round(load_s, 3),
+        # With lazy loading this is what the first request in the mode pays
+        # (minus whatever the background warm-up already finished).
+        "time_to_first_result_s": round(import_s + load_s, 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold-start timing per app mode")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--backend', choices=['ultralytics', 'onnx'], default=None)
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+
+    report = {}
+    for mode in args.modes:
+        try:
+            report[mode] = measure_mode(mode, args.runs, args.model, args.backend)
+        except subprocess.CalledProcessError as e:
+            report[mode] = {"error": e.stderr.strip().splitlines()[-1] if e.stderr else str(e)}
+    print(json.dumps(report, indent=2))
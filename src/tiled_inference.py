@@ -0,0 +1,160 @@
+import argparse
+import io
+import json
+import math
+
+import numpy as np
+
+import instrumentation
+from inference_backend import DEFAULT_MODEL_PATH, load_backend, topk
+
+# Tiles across the short side of the photo: 3 x 224px tiles -> decode at 672px
+TILES_ACROSS = 3
+# Excess-green (2g - r - b on chromaticity) above this counts as leaf
+EXG_THRESHOLD = 0.05
+# Tiles with less leaf than this are background (soil, sky, hands) and skipped
+MIN_LEAF_FRACTION = 0.3
+MAX_TILES = 32
+
+
+def draft_decode(data, min_side):
+    """
+    Decodes an image so its short side is `min_side` px, as cheaply as possible.
+
+    For JPEGs, Image.draft() lets libjpeg decode directly at 1/2, 1/4 or 1/8
+    scale (a 12MP photo needed at 672px decodes ~1/16 of the pixels), and
+    only the small remainder is resized. Accepts bytes, a path, a file
+    object or a PIL image. Returns an RGB PIL image.
+    """
+    from PIL import Image
+
+    if isinstance(data, Image.Image):
+        image = data
+    else:
+        image = Image.open(io.BytesIO(data) if isinstance(data, bytes) else data)
+        w, h = image.size
+        scale = min_side / min(w, h)
+        if scale < 1:
+            # Smallest DCT scale that still covers the requested size
+            image.draft('RGB', (math.ceil(w * scale), math.ceil(h * scale)))
+
+    image = image.convert('RGB')
+    w, h = image.size
+    if min(w, h) != min_side:
+        scale = min_side / min(w, h)
+        image = image.resize((max(min_side, round(w * scale)), max(min_side, round(h * scale))), Image.BILINEAR)
+    return image
+
+
+def leaf_mask(pixels):
+    """Boolean (H, W) mask of green vegetation from an (H, W, 3) uint8 array (excess-green index)."""
+    rgb = pixels.astype(np.float32)
+    total = rgb.sum(axis=2) + 1e-6
+    r, g, b = rgb[..., 0] / total, rgb[..., 1] / total, rgb[..., 2] / total
+    return (2 * g - r - b) > EXG_THRESHOLD
+
+
+def tile_boxes(width, height, tile, overlap=0.25):
+    """(left, top, right, bottom) boxes of `tile` px covering the image, with `overlap` between neighbours."""
+    stride = max(1, int(tile * (1 - overlap)))
+
+    def starts(size):
+        if size <= tile:
+            return [0]
+        positions = list(range(0, size - tile, stride))
+        return positions + [size - tile]
+
+    return [(x, y, x + tile, y + tile) for y in starts(height) for x in starts(width)]
+
+
+def select_tiles(mask, boxes, min_leaf_fraction=MIN_LEAF_FRACTION, max_tiles=MAX_TILES):
+    """
+    Leaf fraction of every box (from an integral image, O(1) per box) and the
+    boxes worth classifying: the `max_tiles` leafiest with enough leaf in them.
+    Returns (selected boxes, their leaf fractions).
+    """
+    integral = np.pad(mask.astype(np.int64).cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0)))
+    box_array = np.array(boxes)
+    left, top, right, bottom = box_array.T
+    area = (right - left) * (bottom - top)
+    leaf = (integral[bottom, right] - integral[top, right] - integral[bottom, left] + integral[top, left]) / area
+
+    order = np.argsort(-leaf, kind='stable')[:max_tiles]
+    order = order[leaf[order] >= min_leaf_fraction]
+    return [boxes[i] for i in order], leaf[order]
+
+
+def diagnose_tiles(model, image, tiles_across=TILES_ACROSS, overlap=0.25, min_leaf_fraction=MIN_LEAF_FRACTION,
+                   max_tiles=MAX_TILES, k=5):
+    """
+    Multi-leaf diagnosis of one (high resolution) photo.
+
+    The photo is decoded at `tiles_across` model tiles across its short side,
+    cut into overlapping model-sized tiles, and the tiles that are mostly
+    leaf are classified in one batched predict_proba() call. The per-tile
+    probabilities are averaged, weighted by leaf fraction, into the plant's
+    disease distribution. Photos without enough leaf in any tile fall back to
+    the whole image as one tile.
+    """
+    imgsz = getattr(model, 'imgsz', 224)
+    with instrumentation.stage("tile_decode"):
+        image = draft_decode(image, imgsz * tiles_across)
+
+    with instrumentation.stage("tiling"):
+        pixels = np.asarray(image)
+        mask = leaf_mask(pixels)
+        boxes, weights = select_tiles(mask, tile_boxes(image.size[0], image.size[1], imgsz, overlap),
+                                      min_leaf_fraction, max_tiles)
+        if boxes:
+            tiles = [image.crop(box) for box in boxes]
+        else:
+            tiles, weights = [image], np.ones(1)
+
+    probs = model.predict_proba(tiles)
+    distribution = (probs * weights[:, None]).sum(axis=0) / weights.sum()
+
+    predictions = topk(distribution, model.names, k)
+    tile_top1 = [model.names[i] for i in probs.argmax(axis=1)]
+    return {
+        "class_name": predictions[0][0],
+        "confidence": predictions[0][1],
+        "topk": predictions,
+        # Whole distribution (class -> probability) for the severity-weighted loss
+        "distribution": {name: float(p) for name, p in zip(model.names, distribution) if p >= 1e-4},
+        "tiles": len(tiles),
+        "tile_boxes": [list(map(int, box)) for box in boxes],
+        "tile_top1": tile_top1,
+        "leaf_fraction": round(float(mask.mean()), 4),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tiled multi-leaf diagnosis of high resolution photos")
+    parser.add_argument('images', nargs='+')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--backend', choices=['ultralytics', 'onnx'], default=None)
+    parser.add_argument('--tiles-across', type=int, default=TILES_ACROSS)
+    parser.add_argument('--min-leaf', type=float, default=MIN_LEAF_FRACTION)
+    parser.add_argument('--state', help="Also score a severity-weighted risk profile for this state")
+    parser.add_argument('--crop')
+    parser.add_argument('--acres', type=float)
+    args = parser.parse_args()
+    missing = [f"--{name}" for name in ('state', 'crop', 'acres') if getattr(args, name) is None]
+    if 0 < len(missing) < 3:
+        parser.error(f"--state, --crop and --acres go together (missing {', '.join(missing)})")
+
+    model = load_backend(args.model, args.backend)
+    engine = None
+    if not missing:
+        from financial_engine import FinancialEngine
+        engine = FinancialEngine()
+
+    for path in args.images:
+        result = diagnose_tiles(model, path, tiles_across=args.tiles_across, min_leaf_fraction=args.min_leaf)
+        print(f"\n{path}: {result['tiles']} tiles, leaf {result['leaf_fraction']:.0%}")
+        for name, p in result["topk"]:
+            print(f"   {name:<50}{p:>7.1%}")
+        if engine is not None:
+            report = engine.calculate_risk_profile(args.state, args.crop, result["class_name"], args.acres,
+                                                   disease_distribution=result["distribution"])
+            print(json.dumps(report, indent=2))
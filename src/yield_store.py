@@ -0,0 +1,494 @@
+import contextlib
+import hashlib
+import json
+import os
+import re
+import tempfile
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+# Bump when the cache layout changes; older caches are rebuilt
+STORE_VERSION = 3
+# What np.load() of a truncated / corrupt .npz can raise
+LOAD_ERRORS = (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile)
+
+
+class YieldIndex:
+    """
+    Pre-aggregated yield statistics per (State, Crop), built once at load time.
+
+    Lookups reproduce the original substring scans: a query is matched
+    (case-insensitively, as a regex) against the *unique* State and Crop names
+    instead of every row, and the mean is pooled from per-pair sums/counts
+    (plus sums of squares, for the spread used by risk simulations).
+    Resolved queries are memoized, so repeated lookups are O(1).
+    """
+
+    MAX_MEMO = 4096
+
+    def __init__(self, states, crops, pair_state, pair_crop, pair_sum, pair_count, pair_sumsq=None):
+        # Vocabularies (a None state stands for rows with a missing State)
+        self.states = list(states)
+        self.crops = list(crops)
+
+        # One entry per observed (State, Crop) pair
+        self.pair_state = np.asarray(pair_state, dtype=np.int64)
+        self.pair_crop = np.asarray(pair_crop, dtype=np.int64)
+        self.pair_sum = np.asarray(pair_sum, dtype=np.float64)
+        self.pair_count = np.asarray(pair_count, dtype=np.int64)
+        # Without sums of squares the spread is unknown (NaN)
+        self.pair_sumsq = (np.full(len(self.pair_sum), np.nan) if pair_sumsq is None
+                           else np.asarray(pair_sumsq, dtype=np.float64))
+
+        # National aggregates per crop (every state, including missing ones)
+        n_crops = len(self.crops)
+        self.crop_sum = np.bincount(self.pair_crop, weights=self.pair_sum, minlength=n_crops)
+        self.crop_sumsq = np.bincount(self.pair_crop, weights=self.pair_sumsq, minlength=n_crops)
+        self.crop_count = np.bincount(self.pair_crop, weights=self.pair_count, minlength=n_crops)
+        self.crop_present = np.bincount(self.pair_crop, minlength=n_crops) > 0
+
+        self._state_matches = {}
+        self._crop_matches = {}
+        self._memo = {}
+
+    @classmethod
+    def from_frame(cls, df):
+        """Builds the index from a frame with State, Crop and Yield columns."""
+        # Rows without a Crop can never match a query, rows without a State
+        # still count towards the national average.
+        frame = df.loc[df['Crop'].notna(), ['State', 'Crop', 'Yield']]
+        frame = frame.assign(Yield=frame['Yield'].astype(np.float64))
+        frame['Yield_sq'] = frame['Yield'] ** 2
+        grouped = frame.groupby(['State', 'Crop'], dropna=False, sort=True, observed=True).agg(
+            sum=('Yield', 'sum'), count=('Yield', 'count'), sumsq=('Yield_sq', 'sum'))
+        return cls._from_grouped(grouped)
+
+    @classmethod
+    def _from_grouped(cls, grouped):
+        # `grouped` is indexed by (State, Crop) with sum / count / sumsq columns
+        state_keys = grouped.index.get_level_values('State')
+        crop_keys = grouped.index.get_level_values('Crop')
+        state_codes, states = pd.factorize(state_keys, use_na_sentinel=False)
+        crop_codes, crops = pd.factorize(crop_keys)
+
+        states = [None if pd.isna(s) else str(s) for s in states]
+        crops = [str(c) for c in crops]
+        return cls(states, crops, state_codes, crop_codes,
+                   grouped['sum'].to_numpy(), grouped['count'].to_numpy(), grouped['sumsq'].to_numpy())
+
+    def pairs_frame(self):
+        """The per-pair aggregates as a (State, Crop, sum, count, sumsq) frame."""
+        return pd.DataFrame({
+            'State': [self.states[i] for i in self.pair_state.tolist()],
+            'Crop': [self.crops[i] for i in self.pair_crop.tolist()],
+            'sum': self.pair_sum,
+            'count': self.pair_count,
+            'sumsq': self.pair_sumsq,
+        })
+
+    def merge(self, other):
+        """
+        New index holding the combined aggregates of `self` and `other`.
+        Sums, counts and sums of squares simply add up per (State, Crop), so
+        the cost and size depend on the number of pairs, not on the rows
+        behind them.
+        """
+        frame = pd.concat([self.pairs_frame(), other.pairs_frame()], ignore_index=True)
+        grouped = frame.groupby(['State', 'Crop'], dropna=False, sort=True).sum()
+        return self._from_grouped(grouped)
+
+    @staticmethod
+    def _match(names, pattern, cache):
+        codes = cache.get(pattern)
+        if codes is None:
+            # Same semantics as Series.str.contains(pattern, case=False, na=False)
+            regex = re.compile(pattern, flags=re.IGNORECASE)
+            codes = np.array([i for i, name in enumerate(names)
+                              if name is not None and regex.search(name)], dtype=np.int64)
+            if len(cache) >= YieldIndex.MAX_MEMO:
+                cache.clear()
+            cache[pattern] = codes
+        return codes
+
+    def _resolve(self, state, crop):
+        """
+        Pooled (sum, sum of squares, count) for the (already normalized) query:
+        matching State/Crop pairs, else the national figures for the crop, else
+        None if the crop does not appear at all.
+        """
+        key = (state, crop)
+        if key in self._memo:
+            return self._memo[key]
+
+        state_codes = self._match(self.states, state, self._state_matches)
+        crop_codes = self._match(self.crops, crop, self._crop_matches)
+
+        result = None
+        mask = np.isin(self.pair_state, state_codes) & np.isin(self.pair_crop, crop_codes)
+        if mask.any():
+            result = (self.pair_sum[mask].sum(), self.pair_sumsq[mask].sum(), self.pair_count[mask].sum())
+        elif self.crop_present[crop_codes].any():
+            result = (self.crop_sum[crop_codes].sum(), self.crop_sumsq[crop_codes].sum(),
+                      self.crop_count[crop_codes].sum())
+
+        if len(self._memo) >= self.MAX_MEMO:
+            self._memo.clear()
+        self._memo[key] = result
+        return result
+
+    def lookup(self, state, crop):
+        """
+        Returns the pooled mean yield for the (already normalized) query, the
+        national mean if the state has no matching rows, or None if the crop
+        does not appear at all.
+        """
+        pooled = self._resolve(state, crop)
+        if pooled is None:
+            return None
+        total, _, count = pooled
+        return float(total / count) if count else float('nan')
+
+    def spread(self, state, crop):
+        """
+        Same resolution as lookup(), but returns (mean, sample std), or None.
+        """
+        pooled = self._resolve(state, crop)
+        if pooled is None:
+            return None
+        total, total_sq, count = pooled
+        if not count:
+            return float('nan'), float('nan')
+        mean = total / count
+        var = (total_sq - count * mean * mean) / (count - 1) if count > 1 else 0.0
+        return float(mean), float(np.sqrt(max(var, 0.0)))
+
+
+def find_yield_file(data_dir):
+    """
+    Picks the CSV that actually contains yield data, not just the first one.
+    """
+    if not os.path.exists(data_dir):
+        raise FileNotFoundError(f"Directory not found: {data_dir}")
+
+    files = sorted(f for f in os.listdir(data_dir) if f.endswith('.csv'))
+
+    # We look for the file that actually contains yield data, not just the first one.
+    for f in files:
+        if 'yield' in f.lower():
+            return os.path.join(data_dir, f)
+
+    # Fallback: If no file has 'yield' in name, try one with 'crop'
+    for f in files:
+        if 'crop' in f.lower() and 'price' not in f.lower():
+            return os.path.join(data_dir, f)
+
+    raise FileNotFoundError(f"Could not find a Yield dataset in {data_dir}. Found: {files}")
+
+
+def standard_columns(columns):
+    """
+    Maps raw CSV headers to State / Crop / Yield.
+
+    Names are cleaned (strip spaces, remove special chars) and renamed the way
+    the engine always did: some datasets use "State_Name", others "State".
+    Each header is checked for state, then crop (not "crop year"), then
+    yield, and takes the first role it matches. Two headers mapping to the
+    same role are ambiguous and rejected.
+    """
+    mapping = {}
+    for raw in columns:
+        col = raw.strip().replace(' ', '_').replace(':', '')
+        if 'state' in col.lower():
+            role = 'State'
+        elif 'crop' in col.lower() and 'year' not in col.lower():
+            role = 'Crop'
+        elif 'yield' in col.lower():
+            role = 'Yield'
+        else:
+            continue
+        if role in mapping.values():
+            other = next(name for name, r in mapping.items() if r == role)
+            raise ValueError(f"Yield dataset has two {role} columns: {other!r} and {raw!r}")
+        mapping[raw] = role
+    missing = {'State', 'Crop', 'Yield'} - set(mapping.values())
+    if missing:
+        raise ValueError(f"Yield dataset is missing columns for: {sorted(missing)}")
+    return mapping
+
+
+def read_yield_csv(csv_path):
+    """
+    Reads only the State, Crop and Yield columns of a raw yield CSV.
+    """
+    header = pd.read_csv(csv_path, nrows=0).columns
+    mapping = standard_columns(header)
+    df = pd.read_csv(csv_path, usecols=list(mapping))
+    return df.rename(columns=mapping)[['State', 'Crop', 'Yield']]
+
+
+def iter_yield_chunks(source, chunksize=100000):
+    """
+    Yields State/Crop/Yield frames from a DataFrame, a CSV path or file object
+    (read `chunksize` rows at a time), or an iterable of DataFrames. Raw
+    dataset headers are mapped with standard_columns().
+    """
+    if isinstance(source, pd.DataFrame):
+        chunks = [source]
+    elif isinstance(source, (str, os.PathLike)) or hasattr(source, 'read'):
+        chunks = pd.read_csv(source, chunksize=chunksize)
+    else:
+        chunks = source
+
+    for chunk in chunks:
+        if not {'State', 'Crop', 'Yield'}.issubset(chunk.columns):
+            mapping = standard_columns(chunk.columns)
+            chunk = chunk[list(mapping)].rename(columns=mapping)
+        chunk = chunk[['State', 'Crop', 'Yield']]
+        yield chunk.assign(Yield=pd.to_numeric(chunk['Yield'], errors='coerce'))
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _source_meta(csv_path, sha256=None):
+    st = os.stat(csv_path)
+    return {
+        "version": STORE_VERSION,
+        "source": os.path.abspath(csv_path),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": sha256 or _file_sha256(csv_path),
+    }
+
+
+def compile_yield_store(csv_path, cache_path):
+    """
+    Compiles the raw yield CSV into a compact .npz cache:
+    categorical-encoded State/Crop codes, Yield (float64, as read from the
+    CSV), and the pre-aggregated YieldIndex arrays.
+    """
+    df = read_yield_csv(csv_path)
+    index = YieldIndex.from_frame(df)
+
+    states = pd.Categorical(df['State'])
+    crops = pd.Categorical(df['Crop'])
+
+    _savez_atomic(
+        cache_path,
+        meta=np.array(json.dumps(_source_meta(csv_path))),
+        state_categories=np.asarray(states.categories, dtype=str),
+        state_codes=states.codes.astype(np.int32),
+        crop_categories=np.asarray(crops.categories, dtype=str),
+        crop_codes=crops.codes.astype(np.int32),
+        yield_values=pd.to_numeric(df['Yield'], errors='coerce').to_numpy(dtype=np.float64),
+        **_index_arrays(index),
+    )
+    return cache_path
+
+
+def _savez_atomic(path, **arrays):
+    # Unique temp file in the target directory: concurrent writers never share it, and
+    # readers only ever see a complete file (os.replace is atomic)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                     delete=False) as f:
+        tmp_path = f.name
+        try:
+            np.savez(f, **arrays)
+        except BaseException:
+            f.close()
+            os.remove(tmp_path)
+            raise
+    os.replace(tmp_path, path)
+
+
+def _index_arrays(index):
+    # A None entry in the index vocabulary stands for rows without a State
+    null_state = index.states.index(None) if None in index.states else -1
+    return {
+        "index_states": np.array(['' if s is None else s for s in index.states], dtype=str),
+        "index_null_state": np.array(null_state),
+        "index_crops": np.array(index.crops, dtype=str),
+        "pair_state": index.pair_state,
+        "pair_crop": index.pair_crop,
+        "pair_sum": index.pair_sum,
+        "pair_count": index.pair_count,
+        "pair_sumsq": index.pair_sumsq,
+    }
+
+
+def _index_from_arrays(store):
+    states = store['index_states'].tolist()
+    null_state = int(store['index_null_state'])
+    if null_state >= 0:
+        states[null_state] = None
+    return YieldIndex(states, store['index_crops'].tolist(), store['pair_state'], store['pair_crop'],
+                      store['pair_sum'], store['pair_count'], store['pair_sumsq'])
+
+
+def _read_store(cache_path):
+    with np.load(cache_path) as store:
+        index = _index_from_arrays(store)
+        df = pd.DataFrame({
+            'State': pd.Categorical.from_codes(store['state_codes'], categories=store['state_categories']),
+            'Crop': pd.Categorical.from_codes(store['crop_codes'], categories=store['crop_categories']),
+            'Yield': store['yield_values'],
+        })
+    return df, index
+
+
+def _cached_meta(cache_path):
+    try:
+        with np.load(cache_path) as store:
+            return json.loads(str(store['meta']))
+    except LOAD_ERRORS:
+        return None
+
+
+def load_yield_store(csv_path, cache_path=None):
+    """
+    Returns (compact State/Crop/Yield frame, YieldIndex) for a yield CSV,
+    served from the compiled cache when it is still valid.
+
+    The cache is trusted while the source size and mtime match. If the mtime
+    changed, the CSV is re-hashed and the cache is only rebuilt when the
+    content actually differs.
+    """
+    if cache_path is None:
+        cache_path = default_cache_path(csv_path)
+
+    meta = _cached_meta(cache_path) if os.path.exists(cache_path) else None
+    st = os.stat(csv_path)
+    fresh = (meta is not None and meta.get("version") == STORE_VERSION
+             and meta.get("source") == os.path.abspath(csv_path) and meta.get("size") == st.st_size)
+
+    if fresh and meta.get("mtime_ns") != st.st_mtime_ns:
+        sha256 = _file_sha256(csv_path)
+        fresh = sha256 == meta.get("sha256")
+        if fresh:
+            # Same content, touched file: record the new mtime without recompiling
+            try:
+                with np.load(cache_path) as store:
+                    arrays = {k: store[k] for k in store.files}
+                arrays['meta'] = np.array(json.dumps(_source_meta(csv_path, sha256)))
+                _savez_atomic(cache_path, **arrays)
+            except LOAD_ERRORS:
+                fresh = False
+
+    if fresh:
+        try:
+            return _read_store(cache_path)
+        except LOAD_ERRORS as e:
+            print(f"[Warning] Yield cache {cache_path} is unreadable ({e!r}): rebuilding it.")
+
+    print(f"[Init] Compiling yield cache: {cache_path}")
+    compile_yield_store(csv_path, cache_path)
+    return _read_store(cache_path)
+
+
+def default_cache_path(csv_path):
+    base = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(os.path.dirname(csv_path), '.cache', f"{base}.yieldstore.npz")
+
+
+def default_ingest_path(csv_path):
+    base = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(os.path.dirname(csv_path), '.cache', f"{base}.ingested.npz")
+
+
+def _same_source(meta, csv_path):
+    # Same content as when the records were ingested: size and mtime, or (touched file) sha256
+    st = os.stat(csv_path)
+    if meta.get("size") != st.st_size:
+        return False
+    return meta.get("mtime_ns") == st.st_mtime_ns or meta.get("sha256") == _file_sha256(csv_path)
+
+
+@contextlib.contextmanager
+def _file_lock(path):
+    # Exclusive lock across processes, released when the file is closed
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        yield
+
+
+def _read_ingested(path, csv_path):
+    if not os.path.exists(path):
+        return None, None
+    try:
+        with np.load(path) as store:
+            meta = json.loads(str(store['meta']))
+            index = _index_from_arrays(store)
+    except LOAD_ERRORS as e:
+        os.replace(path, path + ".corrupt")
+        print(f"[Warning] Ingested yield records in {path} are unreadable ({e!r}); moved to {path}.corrupt")
+        return None, None
+    if not _same_source(meta, csv_path):
+        # Typically the records were appended to the CSV meanwhile: merging them again would count them twice
+        os.replace(path, path + ".stale")
+        print(f"[Warning] {csv_path} changed since the records in {path} were ingested; "
+              f"moved them to {path}.stale instead of counting them twice.")
+        return None, None
+    return index, meta
+
+
+def load_ingested(path, csv_path):
+    """
+    The aggregates FinancialEngine.ingest() saved for `csv_path`, or None.
+
+    They are only valid for the CSV content they were ingested on top of: if
+    the CSV changed since (e.g. the records were appended to it), the file is
+    moved to `<path>.stale` and ignored. An unreadable file is moved to
+    `<path>.corrupt`. Delete `path` to drop every ingested record.
+    """
+    if not path:
+        return None
+    with _file_lock(path + ".lock"):
+        return _read_ingested(path, csv_path)[0]
+
+
+def add_ingested(added, path, csv_path):
+    """
+    Merges the aggregates `added` into the ingest file of `csv_path` under a
+    file lock: concurrent engines add up instead of overwriting each other's
+    records. Kept apart from the compiled cache, so a recompile keeps them.
+    """
+    with _file_lock(path + ".lock"):
+        current, meta = _read_ingested(path, csv_path)
+        total = added if current is None else current.merge(added)
+        # Content already verified by _read_ingested(): keep its hash, refresh size/mtime
+        meta = _source_meta(csv_path, meta and meta.get("sha256"))
+        _savez_atomic(path, meta=np.array(json.dumps(meta)), **_index_arrays(total))
+    return path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compile the raw yield CSV into the compact engine cache")
+    parser.add_argument('--data-dir', default="data/raw/financial")
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    source = find_yield_file(args.data_dir)
+    output = compile_yield_store(source, args.output or default_cache_path(source))
+    print(f"[Success] {source} -> {output} ({os.path.getsize(output) / 1e6:.2f} MB)")
@@ -0,0 +1,23 @@
+import os
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC_DIR)
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def yield_data_dir(tmp_path_factory):
+    from benchmark_suite import make_yield_csv
+
+    data_dir = tmp_path_factory.mktemp("financial")
+    make_yield_csv(str(data_dir / "crop_yield.csv"), rows=5000)
+    return str(data_dir)
+
+
+@pytest.fixture(scope="session")
+def engine(yield_data_dir):
+    from financial_engine import FinancialEngine
+
+    return FinancialEngine(data_dir=yield_data_dir, use_cache=False)
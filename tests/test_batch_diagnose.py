@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+pytest.importorskip("tqdm")
+
+from batch_diagnose import run_batch
+
+
+@pytest.mark.parametrize("risk_args", [{"state": "Punjab"}, {"state": "Punjab", "crop": "Wheat"}, {"acres": 5.0}])
+def test_partial_risk_arguments_are_rejected(tmp_path, risk_args):
+    with pytest.raises(ValueError, match="missing"):
+        run_batch([], str(tmp_path / "results.csv"), **risk_args)
+    assert not (tmp_path / "results.csv").exists()
+
+
+KILLED_RUN = """
+import os, sys
+sys.path.insert(0, {src!r})
+import batch_diagnose
+
+write = batch_diagnose.ParquetSink.write
+def write_then_die(self, rows):
+    write(self, rows)
+    if len(self._parts()) == 2 and self._writer is None:
+        os._exit(1)   # killed: no finally, no close()
+batch_diagnose.ParquetSink.write = write_then_die
+batch_diagnose.run_batch({paths!r}, {output!r}, model_path={model!r}, batch_size=4, workers=1)
+"""
+
+
+def test_resume_after_kill_keeps_finished_batches(tmp_path, capsys):
+    import subprocess
+    import sys
+
+    pytest.importorskip("onnxruntime")
+    pq = pytest.importorskip("pyarrow.parquet")
+    Image = pytest.importorskip("PIL.Image")
+    from benchmark_suite import make_tiny_classifier
+    from conftest import SRC_DIR
+
+    model = make_tiny_classifier(str(tmp_path / "tiny.onnx"), imgsz=32)
+    paths = []
+    for i in range(12):
+        paths.append(str(tmp_path / f"leaf{i:02d}.png"))
+        Image.new("RGB", (40, 40), (i * 20, 120, 0)).save(paths[-1])
+    output = str(tmp_path / "results.parquet")
+
+    script = KILLED_RUN.format(src=SRC_DIR, paths=paths, output=output, model=model)
+    assert subprocess.run([sys.executable, "-c", script]).returncode == 1
+    first_parts = sorted(os.listdir(output))
+    assert first_parts == ["part-00000.parquet", "part-00001.parquet"]
+
+    run_batch(paths, output, model_path=model, batch_size=4, workers=1)
+    assert "8 images already" in capsys.readouterr().out
+    assert sorted(os.listdir(output)) == first_parts + ["part-00002.parquet"]
+    done = pq.read_table(output).column("path").to_pylist()
+    assert sorted(done) == sorted(paths)
+
+
+def test_part_numbers_are_never_reused(tmp_path):
+    from batch_diagnose import ParquetSink
+
+    for name in ("part-00000.parquet", "part-00002.parquet"):
+        (tmp_path / name).touch()
+    assert ParquetSink(str(tmp_path), {})._next_part().endswith("part-00003.parquet")
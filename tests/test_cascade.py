@@ -0,0 +1,43 @@
+import shutil
+
+import pytest
+
+pytest.importorskip("onnxruntime")
+
+from benchmark_suite import make_tiny_classifier
+from cascade import load_cascade
+from diagnosis_cache import weights_fingerprint
+
+
+@pytest.fixture(scope="module")
+def models(tmp_path_factory):
+    base = tmp_path_factory.mktemp("models")
+    fast = make_tiny_classifier(str(base / "fast.onnx"), imgsz=32, seed=0)
+    larger = make_tiny_classifier(str(base / "larger.onnx"), imgsz=32, seed=1)
+    return fast, larger
+
+
+def test_fallback_with_the_same_weights_is_rejected(models, tmp_path):
+    fast, _ = models
+    copy = shutil.copy(fast, tmp_path / "copy.onnx")
+    with pytest.raises(ValueError, match="same weights"):
+        load_cascade(fast, fallback_path=str(copy))
+
+
+def test_config_keys_on_the_fallback_weights(models):
+    fast, larger = models
+    cascade = load_cascade(fast, fallback_path=larger)
+    assert cascade.config()["fallback"] == weights_fingerprint(larger)
+    assert load_cascade(fast).config()["fallback"] is None
+
+
+def test_cost_factor_counts_fallback_passes(models):
+    fast, larger = models
+    # Thresholds above any confidence: every image goes through TTA and the fallback
+    cascade = load_cascade(fast, fallback_path=larger, tta_threshold=1.1, fallback_threshold=1.1,
+                           views=("hflip",), fallback_cost=4.0)
+    Image = pytest.importorskip("PIL.Image")
+    cascade.predict_proba([Image.new("RGB", (40, 40), (0, 120, 0))] * 2)
+    stats = cascade.stats()
+    assert stats["fallback"] == 2
+    assert stats["cost_factor"] == 1 + 1 + 4.0
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+from class_metadata import PLANTVILLAGE_CLASSES, get_class_metadata
+
+
+def test_model_names_share_the_default_table():
+    assert get_class_metadata(list(PLANTVILLAGE_CLASSES)) is get_class_metadata()
+    assert get_class_metadata(dict(enumerate(PLANTVILLAGE_CLASSES))) is get_class_metadata()
+
+
+def test_class_ids_index_the_table():
+    metadata = get_class_metadata()
+    name = 'Tomato___Early_blight'
+    class_id = metadata.class_id(name)
+    assert metadata.class_id(class_id) == metadata.class_id(np.int64(class_id)) == class_id
+    assert metadata.disease(class_id) == metadata.disease(name) == 'Early_blight'
+    assert metadata.class_ids(np.array([class_id, 0])).tolist() == [class_id, 0]
+    with pytest.raises(ValueError):
+        metadata.class_id(len(metadata.names))
+    with pytest.raises(ValueError):
+        metadata.class_ids(np.array([-1]))
@@ -0,0 +1,50 @@
+import importlib.util
+import os
+
+import pytest
+
+pytest.importorskip("tqdm")
+
+from conftest import SRC_DIR
+
+
+def _preprocessing_module():
+    spec = importlib.util.spec_from_file_location("data_preprocessing",
+                                                  os.path.join(SRC_DIR, "02_data_preprocessing.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def raw_base(tmp_path):
+    for cls in ("Tomato___healthy", "Tomato___Late_blight"):
+        folder = tmp_path / "raw" / "train" / cls
+        folder.mkdir(parents=True)
+        for i in range(10):
+            (folder / f"{i}.jpg").write_bytes(f"{cls}-{i}".encode())
+    return str(tmp_path / "raw")
+
+
+def test_rebuilds_deleted_outputs_of_unchanged_class(raw_base, tmp_path):
+    preprocessing = _preprocessing_module()
+    processed = str(tmp_path / "processed")
+    preprocessing.organize_dataset(raw_base, processed, mode="copy", workers=2)
+
+    os.remove(os.path.join(processed, "val", "Tomato___healthy", os.listdir(os.path.join(
+        processed, "val", "Tomato___healthy"))[0]))
+    preprocessing.organize_dataset(raw_base, processed, mode="copy", workers=2)
+
+    for split, expected in (("train", 8), ("val", 2)):
+        assert len(os.listdir(os.path.join(processed, split, "Tomato___healthy"))) == expected
+
+
+def test_stray_files_do_not_break_cleanup(raw_base, tmp_path):
+    preprocessing = _preprocessing_module()
+    processed = str(tmp_path / "processed")
+    preprocessing.organize_dataset(raw_base, processed, mode="copy", workers=2)
+
+    stray = os.path.join(processed, "train", ".DS_Store")
+    open(stray, "w").close()
+    preprocessing.organize_dataset(raw_base, processed, mode="copy", workers=2)
+    assert os.path.exists(stray)
@@ -0,0 +1,40 @@
+import json
+
+import numpy as np
+import pytest
+
+from dataset_shards import ShardDataset, write_shards
+
+
+@pytest.fixture
+def dataset_dir(tmp_path):
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    for split in ('train', 'val'):
+        for cls in ('A___healthy', 'B___rust'):
+            cls_dir = tmp_path / "dataset" / split / cls
+            cls_dir.mkdir(parents=True)
+            for i in range(3):
+                Image.fromarray(rng.integers(0, 255, (40, 48, 3), dtype=np.uint8)).save(cls_dir / f"{i}.jpg")
+    return str(tmp_path / "dataset")
+
+
+def test_rebuilding_one_split_keeps_the_others(dataset_dir, tmp_path):
+    shard_dir = str(tmp_path / "shards")
+    write_shards(dataset_dir, shard_dir, imgsz=32, workers=2)
+    write_shards(dataset_dir, shard_dir, imgsz=32, workers=2, splits=('train',))
+
+    with open(f"{shard_dir}/meta.json") as f:
+        meta = json.load(f)
+    assert set(meta["splits"]) == {'train', 'val'}
+    val = ShardDataset(shard_dir, 'val')
+    assert len(val) == 6 and val[0][0].shape == (32, 32, 3)
+    assert not [p for p in (tmp_path / "shards").iterdir() if p.name.endswith('.tmp')]
+
+
+def test_other_layout_drops_stale_splits(dataset_dir, tmp_path):
+    shard_dir = str(tmp_path / "shards")
+    write_shards(dataset_dir, shard_dir, imgsz=32, workers=2)
+    meta = write_shards(dataset_dir, shard_dir, imgsz=24, workers=2, splits=('train',))
+    assert set(meta["splits"]) == {'train'}
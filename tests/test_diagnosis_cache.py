@@ -0,0 +1,59 @@
+import io
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from diagnosis_cache import DiagnosisCache, image_hash
+
+
+def _png(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_same_pixels_hit_regardless_of_container():
+    data = _png((10, 200, 30))
+    assert image_hash(data) == image_hash(Image.open(io.BytesIO(data)))
+    assert image_hash(data) != image_hash(_png((10, 200, 31)))
+
+
+def test_diagnose_gets_the_decoded_image():
+    cache = DiagnosisCache("weights")
+    seen = []
+
+    def diagnose(image):
+        seen.append(image)
+        return {"class_name": "A", "confidence": 0.9}
+
+    result, hit = cache.get_or_compute(_png((1, 2, 3)), diagnose)
+    assert not hit and result["class_name"] == "A"
+    assert isinstance(seen[0], Image.Image) and seen[0].mode == "RGB"
+    assert cache.get_or_compute(_png((1, 2, 3)), diagnose) == (result, True)
+    assert len(seen) == 1
+
+
+def test_modes_sharing_one_db_keep_their_entries(tmp_path):
+    db_path = str(tmp_path / "diagnoses.sqlite")
+    plain = DiagnosisCache("fp", db_path=db_path)
+    plain.put("img", {"class_name": "A"})
+    plain.close()
+
+    # Alternate modes (and models) on the same file, as the app does when toggling
+    for fingerprint, config in (("fp", "tiled"), ("fp", "cascade={}"), ("other-weights", ""), ("fp", "tiled")):
+        cache = DiagnosisCache(fingerprint, db_path=db_path, config=config)
+        cache.put("img", {"class_name": config or fingerprint})
+        cache.close()
+
+    assert DiagnosisCache("fp", db_path=db_path).get("img") == {"class_name": "A"}
+    assert DiagnosisCache("fp", db_path=db_path, config="tiled").get("img") == {"class_name": "tiled"}
+
+
+def test_db_keeps_the_most_recently_used_rows(tmp_path):
+    cache = DiagnosisCache("fp", db_path=str(tmp_path / "diagnoses.sqlite"), max_rows=3)
+    cache.EVICT_EVERY = 1
+    for i in range(5):
+        cache.put(f"img{i}", {"i": i})
+    rows = cache._db.execute("SELECT image_hash FROM diagnosis_results ORDER BY used").fetchall()
+    assert [r[0] for r in rows] == ["img2", "img3", "img4"]
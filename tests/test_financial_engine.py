@@ -0,0 +1,105 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark_suite import FIXTURE_CLASSES, FIXTURE_CROPS, FIXTURE_STATES
+from financial_engine import FinancialEngine
+
+
+def _applications(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    # Partial state names, crops missing from the data and unknown classes go through the fallbacks
+    return pd.DataFrame({
+        'state': rng.choice(FIXTURE_STATES + ['Pradesh', 'Nagaland'], n),
+        'crop': rng.choice(FIXTURE_CROPS + ['Barley', 'Wheat'], n),
+        'disease_class': rng.choice(FIXTURE_CLASSES + ['Mango___Unknown', 'healthy'], n),
+        'land_area_acres': rng.uniform(0.5, 40, n),
+    })
+
+
+def test_batch_matches_scalar_row_for_row(engine):
+    applications = _applications()
+    batch = engine.calculate_risk_profile_batch(applications)
+
+    assert len(batch) == len(applications)
+    for row, (_, result) in zip(applications.itertuples(index=False), batch.iterrows()):
+        expected = engine.calculate_risk_profile(row.state, row.crop, row.disease_class, row.land_area_acres)
+        assert {key: (value.item() if hasattr(value, 'item') else value) for key, value in result.items()} == expected
+
+
+def test_batch_accepts_arrow_tables(engine):
+    pa = pytest.importorskip("pyarrow")
+    applications = _applications(200)
+    from_table = engine.calculate_risk_profile_batch(pa.Table.from_pandas(applications))
+    pd.testing.assert_frame_equal(from_table.astype(object), engine.calculate_risk_profile_batch(applications).astype(object))
+
+
+@pytest.mark.parametrize("column", ['state', 'crop', 'disease_class'])
+def test_batch_rejects_missing_text(engine, column):
+    applications = _applications(3)
+    applications.loc[1, column] = None
+    with pytest.raises(ValueError, match="without state/crop/disease_class"):
+        engine.calculate_risk_profile_batch(applications)
+
+
+def test_class_ids_score_like_names(engine):
+    metadata = engine.class_metadata
+    applications = _applications(300)
+    applications = applications[applications['disease_class'].isin(metadata.names)].reset_index(drop=True)
+    by_id = applications.assign(disease_class=metadata.class_ids(applications['disease_class'].tolist()))
+
+    pd.testing.assert_frame_equal(engine.calculate_risk_profile_batch(by_id),
+                                  engine.calculate_risk_profile_batch(applications))
+    row = by_id.iloc[0]
+    assert (engine.calculate_risk_profile(row.state, row.crop, int(row.disease_class), row.land_area_acres)
+            == engine.calculate_risk_profile(row.state, row.crop, applications.iloc[0].disease_class,
+                                             row.land_area_acres))
+
+
+@pytest.fixture
+def own_data_dir(yield_data_dir, tmp_path):
+    data_dir = tmp_path / "financial"
+    data_dir.mkdir()
+    shutil.copy(os.path.join(yield_data_dir, "crop_yield.csv"), data_dir / "crop_yield.csv")
+    return str(data_dir)
+
+
+def _records(*yields):
+    return pd.DataFrame({"State": ["Atlantis"] * len(yields), "Crop": ["Maize"] * len(yields), "Yield": yields})
+
+
+def test_ingest_survives_restart(own_data_dir):
+    engine = FinancialEngine(own_data_dir, use_cache=False)
+    assert engine.ingest(_records(4.0, 6.0)) == 2
+    assert engine.get_historical_yield("Atlantis", "Maize") == 5.0
+
+    restarted = FinancialEngine(own_data_dir, use_cache=False)
+    assert restarted.get_historical_yield("Atlantis", "Maize") == 5.0
+    restarted.ingest(_records(8.0, 8.0), persist=False)
+    assert FinancialEngine(own_data_dir, use_cache=False).get_historical_yield("Atlantis", "Maize") == 5.0
+
+
+def test_concurrent_engines_keep_each_others_ingests(own_data_dir):
+    from concurrent.futures import ThreadPoolExecutor
+
+    engines = [FinancialEngine(own_data_dir, use_cache=False) for _ in range(4)]
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda pair: pair[0].ingest(_records(pair[1])), zip(engines, [2.0, 4.0, 6.0, 8.0])))
+    assert FinancialEngine(own_data_dir, use_cache=False).get_historical_yield("Atlantis", "Maize") == 5.0
+
+
+def test_ingested_records_appended_to_the_csv_count_once(own_data_dir):
+    FinancialEngine(own_data_dir).ingest(_records(4.0, 6.0))
+    csv_path = os.path.join(own_data_dir, "crop_yield.csv")
+    header = pd.read_csv(csv_path, nrows=0).columns
+    appended = pd.DataFrame({col: [None, None] for col in header})
+    appended["State"], appended["Crop"], appended["Yield"] = "Atlantis", "Maize", [4.0, 10.0]
+    appended.to_csv(csv_path, mode="a", header=False, index=False)
+
+    # The CSV now holds the records: the ingest file is set aside, not merged on top
+    engine = FinancialEngine(own_data_dir)
+    assert engine.get_historical_yield("Atlantis", "Maize") == 7.0
+    assert os.path.exists(engine.ingest_path + ".stale")
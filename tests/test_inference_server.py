@@ -0,0 +1,140 @@
+import io
+import json
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import instrumentation
+from benchmark_suite import make_tiny_classifier
+from inference_server import InferenceService, MicroBatcher, make_handler
+
+
+def _gated_dispatch(gate):
+    def dispatch(items):
+        future = Future()
+
+        def run():
+            gate.wait()
+            future.set_result([item * 2 for item in items])
+        threading.Thread(target=run, daemon=True).start()
+        return future
+    return dispatch
+
+
+def test_cancelled_future_does_not_wedge_batch():
+    gate = threading.Event()
+    batcher = MicroBatcher(_gated_dispatch(gate), max_batch=3, max_wait_ms=200)
+    futures = [batcher.submit(i) for i in range(3)]
+    assert futures[1].cancel()
+    gate.set()
+    assert [futures[0].result(timeout=2), futures[2].result(timeout=2)] == [0, 4]
+    batcher.close()
+
+
+def test_dispatch_error_keeps_batcher_running():
+    def dispatch(items):
+        raise RuntimeError("worker pool down")
+
+    batcher = MicroBatcher(dispatch, max_batch=2, max_wait_ms=20)
+    futures = [batcher.submit(i) for i in range(2)]
+    futures[0].cancel()
+    assert isinstance(futures[1].exception(timeout=2), RuntimeError)
+    # The batcher thread survived and still serves new items
+    assert isinstance(batcher.submit(5).exception(timeout=2), RuntimeError)
+    batcher.close()
+
+
+def test_failed_batch_is_retried_per_item():
+    def dispatch(items):
+        future = Future()
+        if "bad" in items:
+            future.set_exception(ValueError("undecodable"))
+        else:
+            future.set_result([item.upper() for item in items])
+        return future
+
+    batcher = MicroBatcher(dispatch, max_batch=3, max_wait_ms=200)
+    futures = [batcher.submit(item) for item in ("a", "bad", "c")]
+    assert futures[0].result(timeout=2) == "A"
+    assert isinstance(futures[1].exception(timeout=2), ValueError)
+    assert futures[2].result(timeout=2) == "C"
+    batcher.close()
+
+
+def test_worker_stage_metrics_reach_the_parent(tmp_path):
+    pytest.importorskip("onnxruntime")
+    Image = pytest.importorskip("PIL.Image")
+
+    model_path = make_tiny_classifier(str(tmp_path / "tiny.onnx"), imgsz=32)
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 40), (0, 120, 0)).save(buffer, format="PNG")
+
+    instrumentation.enable(True)
+    instrumentation.REGISTRY.reset()
+    service = InferenceService(model_path, workers=1, max_wait_ms=1)
+    try:
+        service.predict_proba(buffer.getvalue(), timeout=30)
+        assert instrumentation.REGISTRY.summary()["model"]["count"] == 1
+    finally:
+        service.close()
+        instrumentation.enable(False)
+        instrumentation.REGISTRY.reset()
+
+
+def _png():
+    Image = pytest.importorskip("PIL.Image")
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 40), (0, 120, 0)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_timed_out_request_is_cancelled_and_counted(tmp_path):
+    pytest.importorskip("onnxruntime")
+    model_path = make_tiny_classifier(str(tmp_path / "tiny.onnx"), imgsz=32)
+    image = _png()
+
+    # The batch window outlasts the timeout, so the request is still queued when it gives up
+    service = InferenceService(model_path, workers=1, max_wait_ms=2000)
+    try:
+        with pytest.raises(FutureTimeout):
+            service.predict_proba(image, timeout=0.05)
+        assert service.stats()["timeouts"] == 1
+    finally:
+        service.close()
+    # Flushed on close: the cancelled request never reached a worker
+    assert service.batcher.items == 0
+
+
+def test_predict_rejects_invalid_topk(tmp_path):
+    pytest.importorskip("onnxruntime")
+    model_path = make_tiny_classifier(str(tmp_path / "tiny.onnx"), imgsz=32)
+    image = _png()
+
+    service = InferenceService(model_path, workers=1, max_wait_ms=1)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(service))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/predict"
+
+    def post(query):
+        try:
+            with urllib.request.urlopen(urllib.request.Request(f"{url}?{query}", data=image), timeout=30) as r:
+                return r.status, json.loads(r.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    try:
+        for query in ("topk=abc", "topk=0", "topk=-3", f"topk={len(service.names) + 1}"):
+            status, body = post(query)
+            assert status == 400, query
+            assert "topk" in body["error"]
+        status, body = post(f"topk={len(service.names)}")
+        assert status == 200
+        assert len(body["predictions"]) == len(service.names)
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.close()
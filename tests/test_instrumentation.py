@@ -0,0 +1,24 @@
+import pickle
+
+from instrumentation import STAGE_METRIC, Histogram, Registry
+
+
+def test_quantile_past_last_bucket_is_finite():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 30.0, 60.0):
+        histogram.observe(value)
+    assert histogram.quantile(0.99) == 1.0
+
+
+def test_drained_worker_metrics_merge_into_parent():
+    parent, worker = Registry(), Registry()
+    parent.observe(STAGE_METRIC, 0.002, stage="upload_decode")
+    worker.observe(STAGE_METRIC, 0.004, stage="decode")
+    worker.observe(STAGE_METRIC, 0.006, stage="decode")
+    worker.inc("agriguard_stage_errors_total", stage="decode")
+
+    parent.merge(pickle.loads(pickle.dumps(worker.drain())))
+    summary = parent.summary()
+    assert summary["decode"]["count"] == 2 and summary["upload_decode"]["count"] == 1
+    assert 'agriguard_stage_errors_total{stage="decode"} 1' in parent.render_prometheus()
+    assert worker.summary() == {}
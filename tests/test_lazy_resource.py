@@ -0,0 +1,12 @@
+from lazy_resource import LazyResource
+
+
+def test_reloads_when_key_changes():
+    loads, key = [], ["a"]
+    resource = LazyResource("model", lambda: loads.append(key[0]) or len(loads), key=lambda: key[0])
+
+    assert resource.get() == 1
+    assert resource.get() == 1
+    key[0] = "b"
+    assert resource.get() == 2
+    assert loads == ["a", "b"]
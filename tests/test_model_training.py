@@ -0,0 +1,32 @@
+import importlib.util
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("ultralytics")
+
+from conftest import SRC_DIR
+
+
+def _training_module():
+    spec = importlib.util.spec_from_file_location("model_training", os.path.join(SRC_DIR, "03_model_training.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_logits_pass_through_in_train_mode():
+    training = _training_module()
+    model = torch.nn.Linear(2, 3).train()
+    logits = torch.tensor([[-2.0, 0.5, 3.0], [1.0, -1.0, 0.0]])
+    assert torch.equal(training._logits(model, logits), logits)
+
+
+def test_logits_from_eval_mode_outputs():
+    training = _training_module()
+    model = torch.nn.Linear(2, 3).eval()
+    logits = torch.tensor([[-2.0, 0.5, 3.0]])
+    assert torch.equal(training._logits(model, (logits.softmax(1), logits)), logits)
+    recovered = training._logits(model, logits.softmax(1))
+    assert torch.allclose(recovered.softmax(1), logits.softmax(1), atol=1e-6)
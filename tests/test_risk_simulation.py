@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from risk_simulation import PortfolioSimulator, synthetic_portfolio
+
+
+@pytest.fixture(scope="module")
+def portfolio(engine):
+    return synthetic_portfolio(engine, 2000, seed=1)
+
+
+def test_prepare_resolves_one_value_per_loan(engine, portfolio):
+    params = PortfolioSimulator(engine).prepare(portfolio)
+
+    for name in ("crop_codes", "mean_yield", "std_yield", "hectares", "price", "loss_mean", "misclassified_prob"):
+        assert params[name].shape == (len(portfolio),), name
+    assert (params["crop_codes"] >= 0).all() and (params["crop_codes"] < params["n_crops"]).all()
+    assert np.isfinite(params["mean_yield"]).all()
+    assert ((params["misclassified_prob"] >= 0) & (params["misclassified_prob"] <= 1)).all()
+
+
+def test_simulate_shape_and_seeded_determinism(engine, portfolio):
+    simulator = PortfolioSimulator(engine)
+    losses = simulator.simulate(portfolio, n_scenarios=400, seed=7)
+
+    assert losses.shape == (400,)
+    assert np.isfinite(losses).all()
+    np.testing.assert_array_equal(losses, simulator.simulate(portfolio, n_scenarios=400, seed=7))
+    # Chunks are seeded independently of who runs them
+    np.testing.assert_array_equal(losses, simulator.simulate(portfolio, n_scenarios=400, seed=7, workers=2))
+    assert not np.array_equal(losses, simulator.simulate(portfolio, n_scenarios=400, seed=8))
+
+
+def test_expected_shortfall_is_not_below_var(engine, portfolio):
+    summary = PortfolioSimulator(engine).run(portfolio, n_scenarios=500, seed=0)
+
+    assert summary["loans"] == len(portfolio) and summary["scenarios"] == 500
+    assert summary["var_95"] <= summary["es_95"]
+    assert summary["var_99"] <= summary["es_99"]
+    assert summary["var_95"] <= summary["var_99"]
+
+
+@pytest.mark.parametrize("column", ['state', 'crop', 'disease_class'])
+def test_prepare_rejects_missing_values(engine, portfolio, column):
+    broken = portfolio.head(50).copy()
+    broken.loc[broken.index[3], column] = None
+
+    with pytest.raises(ValueError, match="without state/crop/disease_class"):
+        PortfolioSimulator(engine).prepare(broken)
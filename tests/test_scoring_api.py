@@ -0,0 +1,46 @@
+import io
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("onnxruntime")
+Image = pytest.importorskip("PIL.Image")
+
+from fastapi.testclient import TestClient
+
+from benchmark_suite import make_tiny_classifier
+from scoring_api import VECTORIZE_MIN_BATCH, create_app
+
+
+@pytest.fixture(scope="module")
+def client(yield_data_dir, tmp_path_factory):
+    model = make_tiny_classifier(str(tmp_path_factory.mktemp("model") / "tiny.onnx"), imgsz=32)
+    with TestClient(create_app(model, yield_data_dir)) as client:
+        yield client
+
+
+@pytest.fixture(scope="module")
+def leaf():
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 40), (0, 120, 0)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("query", ["state=Punjab", "state=Punjab&crop=Rice", "acres=5"])
+def test_diagnose_rejects_partial_risk_arguments(client, leaf, query):
+    response = client.post(f"/diagnose?{query}", content=leaf)
+    assert response.status_code == 422
+    assert "missing" in response.json()["detail"]
+
+
+def test_diagnose_scores_zero_acres(client, leaf):
+    response = client.post("/diagnose?state=Punjab&crop=Rice&acres=0", content=leaf)
+    assert response.status_code == 200
+    assert response.json()["risk"]["Projected_Revenue_INR"] == 0
+
+
+def test_small_risk_batch_matches_single_reports(client):
+    application = {"state": "Punjab", "crop": "Rice", "disease_class": 0, "land_area_acres": 5}
+    batch = client.post("/risk/batch", json={"applications": [application] * (VECTORIZE_MIN_BATCH - 1)})
+    assert batch.status_code == 200
+    assert batch.json()["reports"][0] == client.post("/risk", json=application).json()
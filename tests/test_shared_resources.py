@@ -0,0 +1,42 @@
+import multiprocessing
+import os
+import uuid
+
+import pytest
+
+pytest.importorskip("onnx")
+
+import shared_resources
+from shared_resources import SharedResourcePublisher, attach
+
+
+def _crash():
+    os._exit(3)
+
+
+def test_aggregates_are_shared_without_weights(yield_data_dir, engine):
+    prefix = f"agtest_{uuid.uuid4().hex[:8]}"
+    publisher = SharedResourcePublisher(prefix, "missing.onnx", yield_data_dir).publish()
+    try:
+        resources = attach(prefix)
+        assert resources.model_path is None
+        shared = resources.engine()
+        assert shared.df is None
+        assert shared.calculate_risk_profile("Maharashtra", "Maize", "Tomato___Late_blight", 5) == \
+            engine.calculate_risk_profile("Maharashtra", "Maize", "Tomato___Late_blight", 5)
+    finally:
+        publisher.close()
+
+
+def test_share_weights_requires_onnx():
+    with pytest.raises(ValueError):
+        SharedResourcePublisher("unused", "best.pt", share_weights=True)
+
+
+def test_collect_reports_dead_worker():
+    context = multiprocessing.get_context("fork")
+    process = context.Process(target=_crash)
+    process.start()
+    with pytest.raises(RuntimeError, match="exited with code 3"):
+        shared_resources._collect([process], context.Queue(), timeout=30)
+    process.join()
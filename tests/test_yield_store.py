@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import SRC_DIR
+from yield_store import load_yield_store, read_yield_csv, standard_columns
+
+
+def test_standard_columns_keeps_engine_rename_rules():
+    mapping = standard_columns(["Crop_Year", "State_Name", "District", "Crop ", "Yield:"])
+    assert mapping == {"State_Name": "State", "Crop ": "Crop", "Yield:": "Yield"}
+
+
+def test_standard_columns_rejects_ambiguous_headers():
+    # "Crop Yield" was renamed to Crop as well, leaving two Crop columns
+    with pytest.raises(ValueError, match="two Crop columns"):
+        standard_columns(["State", "Crop", "Crop Yield", "Yield"])
+
+
+def test_cached_yield_matches_csv(yield_data_dir, tmp_path):
+    from yield_store import find_yield_file
+
+    csv_path = find_yield_file(yield_data_dir)
+    df, _ = load_yield_store(csv_path, str(tmp_path / "store.npz"))
+    expected = read_yield_csv(csv_path)
+    assert df["Yield"].dtype == np.float64
+    np.testing.assert_array_equal(df["Yield"].to_numpy(), pd.to_numeric(expected["Yield"]).to_numpy())
+
+
+def test_no_import_cycle():
+    # yield_store must import on its own, without pulling in the engine
+    code = "import sys, yield_store; assert 'financial_engine' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], cwd=SRC_DIR, check=True)
+
+
+def test_truncated_cache_is_rebuilt(yield_data_dir, tmp_path, capsys):
+    from yield_store import compile_yield_store, find_yield_file
+
+    csv_path = find_yield_file(yield_data_dir)
+    cache_path = str(tmp_path / "store.npz")
+    compile_yield_store(csv_path, cache_path)
+    with open(cache_path, "r+b") as f:
+        f.truncate(os.path.getsize(cache_path) // 2)
+
+    df, index = load_yield_store(csv_path, cache_path)
+    assert len(df) == len(read_yield_csv(csv_path))
+    assert "Compiling" in capsys.readouterr().out
+    load_yield_store(csv_path, cache_path)
+    assert "Compiling" not in capsys.readouterr().out
+
+
+def test_concurrent_compiles_leave_one_valid_cache(yield_data_dir, tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from yield_store import compile_yield_store, find_yield_file
+
+    csv_path = find_yield_file(yield_data_dir)
+    cache_path = str(tmp_path / "store.npz")
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda _: compile_yield_store(csv_path, cache_path), range(4)))
+    assert os.listdir(tmp_path) == ["store.npz"]
+    load_yield_store(csv_path, cache_path)